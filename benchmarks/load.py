@@ -0,0 +1,287 @@
+"""Offline load test for the MCP DeepInfra stdio server.
+
+Starts the local DeepInfra stand-in (``mock_deepinfra.py``) and the server
+pointed at it, then drives one tool at fixed concurrency levels and reports
+throughput, latency percentiles and the server's CPU time and memory per level.
+Because the upstream latency is fixed by the mock, changes in the results
+reflect server-side overhead.
+
+Usage:
+    python benchmarks/load.py [--tool text_classification] [--concurrency 1,8,32]
+                              [--requests 200] [--latency-ms 50] [--error-rate 0.0]
+                              [--rate-limit-rate 0.0] [--model-latency-ms MODEL=MS]
+                              [--model-error-rate MODEL=RATE] [--slow-every N] [--slow-ms 1000]
+                              [--base-url URL] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+import wave
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+# 1x1 PNG so vision tools need no network access
+TINY_PNG = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+
+def _silence_wav(seconds: float = 1.0) -> str:
+    path = os.path.join(tempfile.gettempdir(), "mcp-deepinfra-benchmark.wav")
+    with wave.open(path, "wb") as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(16000)
+        audio.writeframes(b"\0\0" * int(16000 * seconds))
+    return path
+
+
+# Arguments for request number ``i``; inputs vary so the response cache does not short-circuit calls
+TOOL_ARGUMENTS = {
+    "text_generation": lambda i: {"prompt": f"Write one sentence about the number {i}."},
+    "text_classification": lambda i: {"text": f"I love this product, order #{i} arrived early!"},
+    "token_classification": lambda i: {"text": f"John Smith met Jane Doe in Paris on day {i}."},
+    "fill_mask": lambda i: {"text": f"Hello [MASK] world number {i}."},
+    "embeddings": lambda i: {"inputs": [f"benchmark sentence {i}"]},
+    "generate_image": lambda i: {"prompt": f"a cat sitting on windowsill number {i}"},
+    "analyze_image": lambda i: {"image_url": TINY_PNG, "candidate_labels": ["cat", "dog", f"label {i}"]},
+    "text_classification_batch": lambda i: {"texts": [f"Review {i}.{j}: works great" for j in range(10)]},
+    "speech_recognition": lambda i: {"audio_url": Path(_silence_wav()).as_uri()},
+}
+
+
+class StdioClient:
+    """Minimal concurrent JSON-RPC client for an MCP server on stdio."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self._next_id = 0
+        self._pending: dict[int, asyncio.Future] = {}
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self) -> None:
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                for future in self._pending.values():
+                    if not future.done():
+                        future.set_exception(RuntimeError("Server exited"))
+                return
+            if not line.startswith(b"{"):
+                continue
+            message = json.loads(line)
+            future = self._pending.pop(message.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(message)
+
+    async def request(self, method: str, params: dict | None = None) -> dict:
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        message = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params or {}}
+        self.process.stdin.write((json.dumps(message) + "\n").encode())
+        await self.process.stdin.drain()
+        return await future
+
+    async def notify(self, method: str) -> None:
+        self.process.stdin.write((json.dumps({"jsonrpc": "2.0", "method": method}) + "\n").encode())
+        await self.process.stdin.drain()
+
+
+def _cpu_seconds(pid: int) -> float | None:
+    """User plus system CPU time of a process, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _memory_mb(pid: int) -> dict:
+    """Current and peak resident set size of a process, from /proc (Linux only)."""
+    memory = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    memory["rss_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_mock(url: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await asyncio.to_thread(urllib.request.urlopen, url, timeout=1)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Mock server did not start at {url}")
+            await asyncio.sleep(0.1)
+
+
+async def run_level(client: StdioClient, pid: int, tool: str, concurrency: int, requests: int, offset: int) -> dict:
+    """Send ``requests`` calls to ``tool`` with ``concurrency`` in flight; return the level's stats."""
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(offset, offset + requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.request("tools/call", {"name": tool, "arguments": TOOL_ARGUMENTS[tool](i)})
+            latencies.append(time.perf_counter() - start)
+            result = response.get("result", {})
+            text = (result.get("content") or [{}])[0].get("text", "")
+            if "error" in response or result.get("isError") or text.startswith("Error"):
+                errors += 1
+
+    cpu_before = _cpu_seconds(pid)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    cpu_after = _cpu_seconds(pid)
+
+    ordered = sorted(latencies)
+    cpu = None if cpu_before is None else (cpu_after - cpu_before) * 1000 / requests
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": _percentile(ordered, 0.50) * 1000,
+        "p95_ms": _percentile(ordered, 0.95) * 1000,
+        "p99_ms": _percentile(ordered, 0.99) * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "cpu_ms_per_request": cpu,
+        **_memory_mb(pid),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    mock = None
+    base_url = args.base_url
+    if base_url is None:
+        port = _free_port()
+        mock = await asyncio.create_subprocess_exec(
+            sys.executable, str(PROJECT_ROOT / "benchmarks" / "mock_deepinfra.py"),
+            "--port", str(port),
+            "--latency-ms", str(args.latency_ms),
+            "--jitter-ms", str(args.jitter_ms),
+            "--error-rate", str(args.error_rate),
+            "--rate-limit-rate", str(args.rate_limit_rate),
+            *(flag for item in args.model_latency_ms for flag in ("--model-latency-ms", item)),
+            *(flag for item in args.model_error_rate for flag in ("--model-error-rate", item)),
+            "--slow-every", str(args.slow_every),
+            "--slow-ms", str(args.slow_ms),
+        )
+        await _wait_for_mock(f"http://127.0.0.1:{port}/stats")
+        base_url = f"http://127.0.0.1:{port}/v1/openai"
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(PROJECT_ROOT / "src"),
+        "DEEPINFRA_API_KEY": os.environ.get("DEEPINFRA_API_KEY", "benchmark"),
+        "DEEPINFRA_BASE_URL": base_url,
+    }
+    server = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "mcp_deepinfra.server",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        cwd=str(PROJECT_ROOT),
+        env=env,
+        limit=64 * 1024 * 1024,
+    )
+    try:
+        client = StdioClient(server)
+        await client.request("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "load-benchmark", "version": "1.0.0"},
+        })
+        await client.notify("notifications/initialized")
+        # Warm up lazy imports, the API client and connection pools
+        await run_level(client, server.pid, args.tool, 1, 5, offset=-5)
+
+        levels = []
+        offset = 0
+        for concurrency in args.concurrency:
+            levels.append(await run_level(client, server.pid, args.tool, concurrency, args.requests, offset))
+            offset += args.requests
+        return {"tool": args.tool, "base_url": base_url, "levels": levels}
+    finally:
+        server.stdin.close()
+        try:
+            await asyncio.wait_for(server.wait(), 10)
+        except asyncio.TimeoutError:
+            server.kill()
+        if mock is not None:
+            mock.terminate()
+            await mock.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tool", default="text_classification", choices=sorted(TOOL_ARGUMENTS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels (default: 1,8,32)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level (default: 200)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="mock upstream latency (default: 50)")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="mock latency standard deviation (default: 10)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock requests failed with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of mock requests rejected with 429")
+    parser.add_argument("--model-latency-ms", action="append", default=[], metavar="MODEL=MS",
+                        help="mock latency for one model (repeatable)")
+    parser.add_argument("--model-error-rate", action="append", default=[], metavar="MODEL=RATE",
+                        help="share of one model's mock requests failed with 503 (repeatable)")
+    parser.add_argument("--slow-every", type=int, default=0, metavar="N",
+                        help="make every Nth mock request take --slow-ms instead (default: off)")
+    parser.add_argument("--slow-ms", type=float, default=1000, help="latency of the slow mock requests (default: 1000)")
+    parser.add_argument("--base-url", help="use an already running endpoint instead of starting the mock")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['tool']} against {report['base_url']}")
+    print(f"{'conc':>5} {'reqs':>6} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'cpu ms/req':>10} {'rss MB':>7}")
+    for level in report["levels"]:
+        cpu = level["cpu_ms_per_request"]
+        rss = level["rss_mb"]
+        print(
+            f"{level['concurrency']:>5} {level['requests']:>6} {level['errors']:>6} {level['throughput_rps']:>8.1f}"
+            f" {level['p50_ms']:>8.1f} {level['p95_ms']:>8.1f} {level['p99_ms']:>8.1f}"
+            f" {'n/a' if cpu is None else f'{cpu:.2f}':>10} {'n/a' if rss is None else f'{rss:.1f}':>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
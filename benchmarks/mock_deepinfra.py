@@ -0,0 +1,339 @@
+"""Local stand-in for DeepInfra's OpenAI-compatible API, for offline benchmarks.
+
+Serves completions (including streaming), chat completions, embeddings, image
+generation and audio transcriptions with canned responses, after a configurable
+latency. Generated images are tiny PNGs served by the mock itself under
+``/files/`` (``?size=WxH`` for larger ones, ``/redirect?to=URL`` redirects). A
+share of requests can be failed with 500s or rejected with 429s. ``/stats``
+reports requests per endpoint and model, and the latest image references sent to chat.
+
+Usage:
+    python benchmarks/mock_deepinfra.py [--port 8765] [--latency-ms 50] [--jitter-ms 10]
+                                        [--error-rate 0.0] [--rate-limit-rate 0.0]
+                                        [--model-latency-ms MODEL=MS] [--model-error-rate MODEL=RATE]
+                                        [--slow-every N] [--slow-ms 1000] [--embedding-dimensions 384]
+                                        [--invalid-structured-rate 0.0]
+
+Then start the server with ``DEEPINFRA_BASE_URL=http://127.0.0.1:8765/v1/openai``.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import struct
+import time
+import zlib
+from collections import deque
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+EMBEDDING_DIMENSIONS = 384
+STREAM_CHUNKS = 8
+ANALYSIS = {
+    "classification": [{"label": "animal", "score": 0.9}],
+    "objects": [{"label": "cat", "location": "center", "confidence": 0.95}],
+}
+
+
+class MockConfig:
+    def __init__(
+        self,
+        latency_ms: float,
+        jitter_ms: float,
+        error_rate: float,
+        rate_limit_rate: float,
+        retry_after_ms: int,
+        model_latency_ms: dict[str, float] | None = None,
+        model_error_rates: dict[str, float] | None = None,
+        slow_every: int = 0,
+        slow_ms: float = 1000,
+        embedding_dimensions: int = EMBEDDING_DIMENSIONS,
+        invalid_structured_rate: float = 0.0,
+    ):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        # Per-model overrides, for exercising model routing
+        self.model_latency = {model: ms / 1000 for model, ms in (model_latency_ms or {}).items()}
+        self.model_error_rates = model_error_rates or {}
+        # Every Nth request takes slow_ms, for a deterministic latency tail
+        self.slow_every = slow_every
+        self.slow_latency = slow_ms / 1000
+        self.embedding_dimensions = embedding_dimensions
+        # Share of response_format answers that break the requested schema
+        self.invalid_structured_rate = invalid_structured_rate
+        self.total = 0
+        self.requests: dict[str, int] = {}
+        self.models: dict[str, int] = {}
+        # The latest image references (URLs or data URIs) received by chat completions
+        self.images: deque[str] = deque(maxlen=20)
+
+
+def _png(color: bytes, width: int = 1, height: int = 1) -> bytes:
+    """Encode a ``width`` x ``height`` RGB PNG filled with ``color``."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    pixels = (b"\0" + color * width) * height
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(pixels)) + chunk(b"IEND", b"")
+
+
+def _completion_text(prompt: str) -> str:
+    if "[MASK]" in prompt:
+        return json.dumps({"filled_text": "Hello beautiful world", "chosen_word": "beautiful", "explanation": "mock"})
+    if "named entity recognition" in prompt:
+        # Report every "Paris" in the text, so windowed results can be checked against the input
+        text = prompt.split("Text: ", 1)[-1].rsplit("\n\nResponse format:", 1)[0]
+        spans = [match.span() for match in re.finditer("Paris", text)] or [(0, 5)]
+        return json.dumps({"entities": [{"entity": "Paris", "type": "LOC", "position": list(span)} for span in spans]})
+    if "numbered texts" in prompt:
+        count = sum(1 for line in prompt.split("Texts:", 1)[-1].splitlines() if line.split(".", 1)[0].isdigit())
+        return json.dumps([{"index": i, "sentiment": "positive", "category": "general"} for i in range(1, count + 1)])
+    if "classify" in prompt:
+        return json.dumps({"sentiment": "positive", "category": "general"})
+    return "This is a generated response from the mock endpoint."
+
+
+def _example(schema: dict):
+    """Build a minimal value that satisfies a JSON schema, for ``response_format`` requests."""
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _example(subschema) for key, subschema in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_example(schema.get("items", {})) for _ in range(max(1, schema.get("minItems", 1)))]
+    if kind == "integer":
+        return 0
+    if kind == "number":
+        return 0.9
+    if kind == "boolean":
+        return True
+    return "mock"
+
+
+def _embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list[float]:
+    # Deterministic pseudo-random vector so identical inputs embed identically
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.uniform(-1, 1) for _ in range(dimensions)]
+
+
+def _usage(prompt_tokens: int, completion_tokens: int = 0) -> dict:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def build_app(config: MockConfig) -> Starlette:
+    async def simulate(request: Request, model: str | None = None) -> Response | None:
+        """Sleep for the configured (or model's) latency, then maybe return an injected failure."""
+        endpoint = request.url.path.rsplit("/v1/openai", 1)[-1]
+        config.requests[endpoint] = config.requests.get(endpoint, 0) + 1
+        if model:
+            config.models[model] = config.models.get(model, 0) + 1
+        config.total += 1
+        latency = config.model_latency.get(model, config.latency)
+        if config.slow_every and config.total % config.slow_every == 0:
+            latency = config.slow_latency
+        await asyncio.sleep(max(0.0, random.gauss(latency, config.jitter)))
+        if random.random() < config.model_error_rates.get(model, 0.0):
+            return JSONResponse({"error": {"message": "Injected model failure", "type": "server_error"}}, status_code=503)
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            return JSONResponse(
+                {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                status_code=429,
+                headers={"retry-after-ms": str(config.retry_after_ms)},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            return JSONResponse({"error": {"message": "Injected failure", "type": "server_error"}}, status_code=500)
+        return None
+
+    async def completions(request: Request) -> Response:
+        body = await request.json()
+        failure = await simulate(request, body.get("model"))
+        if failure is not None:
+            return failure
+        prompt = body.get("prompt", "")
+        prompt = prompt if isinstance(prompt, str) else " ".join(prompt)
+        text = _completion_text(prompt)
+        base = {"id": "cmpl-mock", "object": "text_completion", "created": int(time.time()), "model": body.get("model")}
+        if body.get("stream"):
+            async def events():
+                words = text.split(" ")
+                size = max(1, len(words) // STREAM_CHUNKS)
+                for start in range(0, len(words), size):
+                    piece = " ".join(words[start:start + size]) + " "
+                    choice = {"text": piece, "index": 0, "finish_reason": None, "logprobs": None}
+                    yield f"data: {json.dumps({**base, 'choices': [choice]})}\n\n"
+                    await asyncio.sleep(config.latency / STREAM_CHUNKS)
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return JSONResponse({
+            **base,
+            "choices": [{"text": text, "index": 0, "finish_reason": "stop", "logprobs": None}],
+            "usage": _usage(len(prompt) // 4 + 1, len(text) // 4 + 1),
+        })
+
+    async def chat_completions(request: Request) -> Response:
+        body = await request.json()
+        failure = await simulate(request, body.get("model"))
+        if failure is not None:
+            return failure
+        prompt = json.dumps(body.get("messages", []))
+        for message in body.get("messages", []):
+            for part in message.get("content") if isinstance(message.get("content"), list) else []:
+                if part.get("type") == "image_url":
+                    config.images.append(part["image_url"]["url"])
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema" and random.random() < config.invalid_structured_rate:
+            content = json.dumps({"unexpected": True})
+        elif response_format.get("type") == "json_schema":
+            content = json.dumps(_example(response_format["json_schema"]["schema"]))
+        else:
+            analysis = dict(ANALYSIS)
+            if "categories:" in prompt:
+                # Echo the first candidate label so zero-shot answers validate
+                label = prompt.split("categories:", 1)[1].split(",")[0].strip(" \\\"")
+                analysis["zero_shot"] = {"label": label, "scores": {label: 0.9}}
+            content = json.dumps(analysis)
+        return JSONResponse({
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(len(prompt) // 4 + 1, len(content) // 4 + 1),
+        })
+
+    async def embeddings(request: Request) -> Response:
+        body = await request.json()
+        failure = await simulate(request, body.get("model"))
+        if failure is not None:
+            return failure
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        return JSONResponse({
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": _embedding(text, config.embedding_dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": _usage(sum(len(text) // 4 + 1 for text in inputs)),
+        })
+
+    async def images(request: Request) -> Response:
+        body = await request.json()
+        failure = await simulate(request, body.get("model"))
+        if failure is not None:
+            return failure
+        # The image color is derived from the prompt, so equal prompts give identical images
+        color = hashlib.sha256(body.get("prompt", "").encode()).hexdigest()[:6]
+        url = f"{str(request.base_url).rstrip('/')}/files/{color}.png"
+        return JSONResponse({"created": int(time.time()), "data": [{"url": url}]})
+
+    async def files(request: Request) -> Response:
+        config.requests["/files"] = config.requests.get("/files", 0) + 1
+        color = request.path_params["color"]
+        try:
+            width, height = (int(side) for side in request.query_params.get("size", "1x1").split("x"))
+            return Response(_png(bytes.fromhex(color)[:3].ljust(3, b"\0"), width, height), media_type="image/png")
+        except ValueError:
+            return Response(status_code=404)
+
+    async def redirect(request: Request) -> Response:
+        return Response(status_code=302, headers={"location": request.query_params["to"]})
+
+    async def transcriptions(request: Request) -> Response:
+        form = await request.form()
+        upload = form.get("file")
+        size = len(await upload.read()) if upload is not None else 0
+        failure = await simulate(request, form.get("model"))
+        if failure is not None:
+            return failure
+        text = "This is a mock transcription."
+        # Assume 16 kHz 16-bit mono, which is what segmented transcription uploads
+        duration = round(size / 32000, 3)
+        if form.get("response_format") == "verbose_json":
+            return JSONResponse({
+                "task": "transcribe",
+                "language": "english",
+                "duration": duration,
+                "text": text,
+                "segments": [{"id": 0, "start": 0.0, "end": duration, "text": text}],
+            })
+        return JSONResponse({"text": text})
+
+    async def stats(request: Request) -> Response:
+        return JSONResponse({**config.requests, "models": config.models, "images": list(config.images)})
+
+    prefix = "/v1/openai"
+    return Starlette(routes=[
+        Route(f"{prefix}/completions", completions, methods=["POST"]),
+        Route(f"{prefix}/chat/completions", chat_completions, methods=["POST"]),
+        Route(f"{prefix}/embeddings", embeddings, methods=["POST"]),
+        Route(f"{prefix}/images/generations", images, methods=["POST"]),
+        Route(f"{prefix}/audio/transcriptions", transcriptions, methods=["POST"]),
+        Route("/files/{color}.png", files, methods=["GET"]),
+        Route("/redirect", redirect, methods=["GET"]),
+        Route("/stats", stats, methods=["GET"]),
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50, help="mean response latency (default: 50)")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="latency standard deviation (default: 10)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failed with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests rejected with 429")
+    parser.add_argument("--retry-after-ms", type=int, default=200, help="retry-after-ms sent with 429s (default: 200)")
+    parser.add_argument("--model-latency-ms", action="append", default=[], metavar="MODEL=MS",
+                        help="mean latency for one model (repeatable)")
+    parser.add_argument("--model-error-rate", action="append", default=[], metavar="MODEL=RATE",
+                        help="share of one model's requests failed with 503 (repeatable)")
+    parser.add_argument("--slow-every", type=int, default=0, metavar="N",
+                        help="make every Nth request take --slow-ms instead (default: off)")
+    parser.add_argument("--slow-ms", type=float, default=1000, help="latency of the slow requests (default: 1000)")
+    parser.add_argument("--embedding-dimensions", type=int, default=EMBEDDING_DIMENSIONS,
+                        help=f"size of the returned embeddings (default: {EMBEDDING_DIMENSIONS})")
+    parser.add_argument("--invalid-structured-rate", type=float, default=0.0,
+                        help="share of json_schema answers that do not match the schema")
+    args = parser.parse_args()
+
+    def overrides(values: list[str]) -> dict[str, float]:
+        return {model: float(value) for model, _, value in (item.rpartition("=") for item in values)}
+
+    config = MockConfig(
+        args.latency_ms,
+        args.jitter_ms,
+        args.error_rate,
+        args.rate_limit_rate,
+        args.retry_after_ms,
+        model_latency_ms=overrides(args.model_latency_ms),
+        model_error_rates=overrides(args.model_error_rate),
+        slow_every=args.slow_every,
+        slow_ms=args.slow_ms,
+        embedding_dimensions=args.embedding_dimensions,
+        invalid_structured_rate=args.invalid_structured_rate,
+    )
+    uvicorn.run(build_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Startup benchmark for the MCP DeepInfra stdio server.
+
+Spawns the server repeatedly and measures time from process start to the
+``initialize`` response and to the ``tools/list`` response, plus the peak RSS
+of each server process. No DeepInfra calls are made.
+
+Usage:
+    python benchmarks/startup.py [--runs 20] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _request(process: subprocess.Popen, request_id: int, method: str, params: dict | None = None) -> dict:
+    message = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}
+    process.stdin.write(json.dumps(message) + "\n")
+    process.stdin.flush()
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Server exited before answering {method}")
+        if line.startswith("{"):
+            response = json.loads(line)
+            if response.get("id") == request_id:
+                return response
+
+
+def run_once() -> dict:
+    """Start one server process and return its startup timings and peak RSS."""
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(PROJECT_ROOT / "src"),
+        "DEEPINFRA_API_KEY": os.environ.get("DEEPINFRA_API_KEY", "benchmark"),
+    }
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "mcp_deepinfra.server"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        cwd=str(PROJECT_ROOT),
+        env=env,
+    )
+    try:
+        _request(process, 1, "initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "startup-benchmark", "version": "1.0.0"},
+        })
+        initialized = time.perf_counter()
+        process.stdin.write(json.dumps({"jsonrpc": "2.0", "method": "notifications/initialized"}) + "\n")
+        process.stdin.flush()
+        tools = _request(process, 2, "tools/list")
+        listed = time.perf_counter()
+    finally:
+        process.stdin.close()
+        _, _, usage = os.wait4(process.pid, 0)
+        process.returncode = 0
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {
+        "initialize_ms": (initialized - start) * 1000,
+        "tools_list_ms": (listed - start) * 1000,
+        "peak_rss_mb": peak_rss_mb,
+        "tools": len(tools["result"]["tools"]),
+    }
+
+
+def summarize(values: list[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "max": ordered[-1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20, help="number of server starts (default: 20)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    run_once()  # warm the filesystem and bytecode caches
+    runs = [run_once() for _ in range(args.runs)]
+    report = {
+        "runs": args.runs,
+        "tools": runs[0]["tools"],
+        **{key: summarize([run[key] for run in runs]) for key in ("initialize_ms", "tools_list_ms", "peak_rss_mb")},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.runs} runs, {report['tools']} tools")
+    for key in ("initialize_ms", "tools_list_ms", "peak_rss_mb"):
+        stats = report[key]
+        print(f"{key:>14}: min {stats['min']:8.1f}  median {stats['median']:8.1f}  p95 {stats['p95']:8.1f}  max {stats['max']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Audio source handling: streaming download, size limits and container detection."""
+
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from urllib.parse import unquote, urlparse
+from urllib.request import url2pathname
+
+import httpx
+
+# Downloads larger than this are spilled from memory to a temporary file.
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+_CONTENT_TYPES = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/ogg": "ogg",
+    "audio/webm": "webm",
+    "video/webm": "webm",
+    "audio/mp4": "m4a",
+    "audio/x-m4a": "m4a",
+    "video/mp4": "mp4",
+}
+
+_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "flac": "audio/flac",
+    "ogg": "audio/ogg",
+    "webm": "audio/webm",
+    "m4a": "audio/mp4",
+    "mp4": "video/mp4",
+}
+
+
+def detect_format(head: bytes, content_type: str | None = None, source: str = "") -> str:
+    """Guess the audio container from magic bytes, then content type, then file extension."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if head[4:8] == b"ftyp":
+        return "mp4" if head[8:12] in (b"isom", b"mp41", b"mp42") else "m4a"
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    if content_type:
+        mime = content_type.split(";")[0].strip().lower()
+        if mime in _CONTENT_TYPES:
+            return _CONTENT_TYPES[mime]
+    extension = os.path.splitext(urlparse(source).path)[1].lstrip(".").lower()
+    if extension in _MIME_TYPES:
+        return extension
+    return "mp3"
+
+
+def file_url_path(url: str) -> str:
+    """Return the local path of a ``file://`` URL, decoding percent-escapes."""
+    return url2pathname(unquote(urlparse(url).path))
+
+
+def _too_large(max_bytes: int) -> ValueError:
+    return ValueError(f"Audio exceeds the maximum size of {max_bytes} bytes")
+
+
+@asynccontextmanager
+async def open_audio(url: str, http_client: httpx.AsyncClient, max_bytes: int):
+    """Yield an upload tuple ``(filename, fileobj, mime_type)`` for an audio URL.
+
+    ``file://`` URLs are opened in place. HTTP(S) sources are streamed into a
+    spooled temporary file so large recordings never sit fully in memory.
+    The file is closed when the context exits.
+    """
+    if url.startswith("file://"):
+        path = file_url_path(url)
+        if os.path.getsize(path) > max_bytes:
+            raise _too_large(max_bytes)
+        with open(path, "rb") as f:
+            head = f.read(16)
+            f.seek(0)
+            extension = detect_format(head, source=url)
+            yield f"audio.{extension}", f, _MIME_TYPES[extension]
+        return
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+        async with http_client.stream("GET", url) as response:
+            response.raise_for_status()
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise _too_large(max_bytes)
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(max_bytes)
+                spool.write(chunk)
+            content_type = response.headers.get("content-type")
+        spool.seek(0)
+        head = spool.read(16)
+        spool.seek(0)
+        extension = detect_format(head, content_type, url)
+        yield f"audio.{extension}", spool, _MIME_TYPES[extension]
@@ -0,0 +1,130 @@
+"""Batching helpers: micro-batching of embedding requests and bounded fan-out of batch tools."""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from . import deadlines
+
+EmbedFn = Callable[[str, list[str]], Awaitable[list[list[float]]]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for batch budgeting."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class _Batch:
+    requests: list[tuple[list[str], asyncio.Future]] = field(default_factory=list)
+    size: int = 0
+    tokens: int = 0
+    timer: asyncio.TimerHandle | None = None
+    task: asyncio.Task | None = None
+
+
+class EmbeddingCoalescer:
+    """Collects concurrent embedding requests per model and sends them as one call.
+
+    A batch is flushed when ``window`` seconds have passed since its first
+    request, or earlier once ``max_batch_size`` texts or ``max_batch_tokens``
+    estimated tokens are queued. Each caller receives exactly its own vectors.
+    A batch is sent without its callers' deadlines; each caller stops waiting
+    at its own deadline. A batch whose callers have all given up is dropped, or
+    aborted if it was already sent.
+    """
+
+    def __init__(self, embed: EmbedFn, window: float, max_batch_size: int = 256, max_batch_tokens: int = 8192):
+        self._embed = embed
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self._batches: dict[str, _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def embed(self, model: str, texts: list[str]) -> list[list[float]]:
+        """Queue ``texts`` for ``model`` and wait for their vectors."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        tokens = sum(estimate_tokens(text) for text in texts)
+
+        batch = self._batches.get(model)
+        if batch is not None and (
+            batch.size + len(texts) > self.max_batch_size or batch.tokens + tokens > self.max_batch_tokens
+        ):
+            self._flush(model)
+            batch = None
+        if batch is None:
+            batch = self._batches[model] = _Batch()
+            batch.timer = loop.call_later(self.window, self._flush, model)
+
+        batch.requests.append((texts, future))
+        batch.size += len(texts)
+        batch.tokens += tokens
+        if batch.size >= self.max_batch_size or batch.tokens >= self.max_batch_tokens:
+            self._flush(model)
+        try:
+            return await deadlines.bounded(future)
+        finally:
+            if future.cancelled() and all(f.cancelled() for _, f in batch.requests):
+                if batch.task is not None:
+                    batch.task.cancel()
+                elif self._batches.get(model) is batch:
+                    batch.timer.cancel()
+                    del self._batches[model]
+
+    def _flush(self, model: str) -> None:
+        batch = self._batches.pop(model, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = batch.task = deadlines.detach(self._send(model, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, model: str, batch: _Batch) -> None:
+        texts = [text for request_texts, _ in batch.requests for text in request_texts]
+        try:
+            vectors = await self._embed(model, texts)
+        except Exception as e:
+            for _, future in batch.requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for request_texts, future in batch.requests:
+            if not future.done():
+                future.set_result(vectors[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+
+async def run_batch(
+    items: list[Any],
+    fn: Callable[[Any], Awaitable[Any]],
+    concurrency: int,
+    empty_error: str = "No result returned",
+) -> list[dict]:
+    """Apply ``fn`` to every item with at most ``concurrency`` calls in flight.
+
+    Results are returned in input order as ``{"index", "result"}`` or
+    ``{"index", "error"}`` dicts; one failing item never fails the batch.
+    A ``None`` result is reported as ``empty_error``. Items still queued or
+    running when the deadline passes are reported as ``DeadlineExceeded``.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(item: Any) -> Any:
+        async with semaphore:
+            return await fn(item)
+
+    async def run(index: int, item: Any) -> dict:
+        try:
+            result = await deadlines.bounded(call(item))
+        except Exception as e:
+            return {"index": index, "error": f"{type(e).__name__}: {str(e)}"}
+        if result is None:
+            return {"index": index, "error": empty_error}
+        return {"index": index, "result": result}
+
+    return list(await asyncio.gather(*(run(i, item) for i, item in enumerate(items))))
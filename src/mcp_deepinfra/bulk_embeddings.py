@@ -0,0 +1,260 @@
+"""Bulk embedding of newline-delimited text files into a memory-mapped ``.npy`` matrix.
+
+The input is streamed in batches bounded by an estimated token budget, several
+batches are in flight at once, and each batch's vectors are written straight
+into a preallocated ``.npy`` file. Row ids go to a JSON-lines sidecar. A small
+progress file records how far the rows are complete (in order), so an
+interrupted job resumes from the last completed batch instead of starting over.
+"""
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .batching import estimate_tokens
+from .vectors import postprocess
+
+EmbedFn = Callable[[list[str]], Awaitable[list[list[float]]]]
+# (rows done, total rows) -> None, called whenever the completed prefix grows
+ProgressFn = Callable[[int, int], Awaitable[None]]
+
+INPUT_FORMATS = ("lines", "ndjson")
+
+
+@dataclass
+class _Batch:
+    first_row: int
+    texts: list[str]
+    ids: list
+    end_offset: int
+    end_line: int
+
+
+def sidecar_paths(output_path: str) -> tuple[str, str]:
+    """Return the id sidecar and progress file paths for ``output_path``."""
+    stem = output_path[:-4] if output_path.endswith(".npy") else output_path
+    return f"{stem}.ids.jsonl", f"{stem}.progress.json"
+
+
+def _is_blank(text: str) -> bool:
+    """Lines that hold only whitespace (including Unicode spaces such as U+00A0) are skipped."""
+    return not text.strip()
+
+
+def _parse_line(line: bytes, line_number: int, input_format: str) -> tuple[object, str] | None:
+    text = line.decode("utf-8").rstrip("\r\n")
+    if _is_blank(text):
+        return None
+    if input_format == "ndjson":
+        record = json.loads(text)
+        return record.get("id", line_number), str(record["text"])
+    return line_number, text
+
+
+def count_rows(path: str) -> int:
+    """Count the non-empty records in the input file."""
+    rows = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if not _is_blank(line.decode("utf-8")):
+                rows += 1
+    return rows
+
+
+class _Reader:
+    """Reads token-budgeted batches from the input, starting at a byte offset."""
+
+    def __init__(self, path: str, input_format: str, offset: int, line: int, max_batch_size: int, max_batch_tokens: int):
+        self.file = open(path, "rb")
+        self.file.seek(offset)
+        self.input_format = input_format
+        self.line = line
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+
+    def read_batch(self, first_row: int) -> _Batch | None:
+        texts, ids, tokens = [], [], 0
+        while len(texts) < self.max_batch_size and tokens < self.max_batch_tokens:
+            position = self.file.tell()
+            line = self.file.readline()
+            if not line:
+                break
+            parsed = _parse_line(line, self.line, self.input_format)
+            if parsed is not None:
+                cost = estimate_tokens(parsed[1])
+                if texts and tokens + cost > self.max_batch_tokens:
+                    # Leave this line for the next batch
+                    self.file.seek(position)
+                    break
+                ids.append(parsed[0])
+                texts.append(parsed[1])
+                tokens += cost
+            self.line += 1
+        if not texts:
+            return None
+        return _Batch(first_row, texts, ids, self.file.tell(), self.line)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _load_state(progress_path: str, signature: dict) -> dict | None:
+    try:
+        with open(progress_path, encoding="utf-8") as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("signature") == signature else None
+
+
+def _save_state(progress_path: str, state: dict) -> None:
+    temporary = f"{progress_path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(state, file)
+    os.replace(temporary, progress_path)
+
+
+async def embed_file(
+    embed: EmbedFn,
+    input_path: str,
+    output_path: str,
+    model: str,
+    input_format: str = "lines",
+    dimensions: int | None = None,
+    normalize: bool = False,
+    max_batch_size: int = 256,
+    max_batch_tokens: int = 8192,
+    concurrency: int = 4,
+    resume: bool = True,
+    on_progress: ProgressFn | None = None,
+) -> dict:
+    """Embed every non-empty record of ``input_path`` into ``output_path`` and return job statistics."""
+    if input_format not in INPUT_FORMATS:
+        raise ValueError(f"Unsupported input_format '{input_format}', expected one of {', '.join(INPUT_FORMATS)}")
+    started = time.monotonic()
+    ids_path, progress_path = sidecar_paths(output_path)
+    info = os.stat(input_path)
+    signature = {
+        "input": os.path.abspath(input_path),
+        "size": info.st_size,
+        "mtime_ns": info.st_mtime_ns,
+        "format": input_format,
+        "model": model,
+        "dimensions": dimensions,
+        "normalize": normalize,
+    }
+
+    state = _load_state(progress_path, signature) if resume else None
+    if state is not None and os.path.exists(output_path) and os.path.exists(ids_path):
+        matrix = open_memmap(output_path, mode="r+")
+        resumed_from = state["rows_done"]
+    else:
+        rows = await asyncio.to_thread(count_rows, input_path)
+        state = {"signature": signature, "rows": rows, "dim": None, "rows_done": 0, "offset": 0, "line": 0, "ids_bytes": 0}
+        matrix = None
+        resumed_from = 0
+        open(ids_path, "wb").close()
+    total = state["rows"]
+
+    ids_file = open(ids_path, "r+b")
+    ids_file.truncate(state["ids_bytes"])
+    ids_file.seek(state["ids_bytes"])
+    reader = _Reader(input_path, input_format, state["offset"], state["line"], max_batch_size, max_batch_tokens)
+    pending: dict[int, _Batch] = {}
+    done: set[int] = set()
+    batches = 0
+    tokens = 0
+
+    checkpoint_lock = asyncio.Lock()
+
+    def persist() -> None:
+        # Vectors and ids must be on disk before the progress file claims them
+        matrix.flush()
+        ids_file.flush()
+        os.fsync(ids_file.fileno())
+        state["ids_bytes"] = ids_file.tell()
+        _save_state(progress_path, state)
+
+    async def checkpoint() -> None:
+        """Advance the completed prefix over finished batches and persist it off the event loop."""
+        async with checkpoint_lock:
+            advanced = False
+            while state["rows_done"] in done:
+                batch = pending.pop(state["rows_done"])
+                done.discard(batch.first_row)
+                ids_file.write("".join(json.dumps(i) + "\n" for i in batch.ids).encode("utf-8"))
+                state.update(rows_done=batch.first_row + len(batch.texts), offset=batch.end_offset, line=batch.end_line)
+                advanced = True
+            if advanced:
+                await asyncio.to_thread(persist)
+
+    async def process(batch: _Batch) -> None:
+        nonlocal matrix
+        vectors = postprocess(await embed(batch.texts), dimensions, normalize)
+        if matrix is None:
+            state["dim"] = int(vectors.shape[1])
+            matrix = open_memmap(output_path, mode="w+", dtype=np.float32, shape=(total, state["dim"]))
+        matrix[batch.first_row:batch.first_row + len(batch.texts)] = vectors
+        done.add(batch.first_row)
+        await checkpoint()
+        if on_progress is not None:
+            await on_progress(state["rows_done"], total)
+
+    next_row = state["rows_done"]
+    in_flight: set[asyncio.Task] = set()
+    try:
+        while True:
+            batch = await asyncio.to_thread(reader.read_batch, next_row)
+            if batch is None:
+                break
+            if matrix is None and in_flight:
+                # The first batch fixes the vector size; wait for it before fanning out
+                await asyncio.gather(*in_flight)
+                in_flight.clear()
+            pending[batch.first_row] = batch
+            next_row += len(batch.texts)
+            batches += 1
+            tokens += sum(estimate_tokens(text) for text in batch.texts)
+            in_flight.add(asyncio.ensure_future(process(batch)))
+            if len(in_flight) >= concurrency:
+                finished, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    task.result()
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    except BaseException:
+        for task in in_flight:
+            task.cancel()
+        raise
+    finally:
+        reader.close()
+        ids_file.close()
+        if matrix is not None:
+            matrix.flush()
+
+    if matrix is None:
+        # Nothing to embed (empty input, or a finished job that was already complete)
+        if not os.path.exists(output_path):
+            np.save(output_path, np.zeros((0, 0), dtype=np.float32))
+    state["complete"] = True
+    await asyncio.to_thread(_save_state, progress_path, state)
+    elapsed = time.monotonic() - started
+    embedded = state["rows_done"] - resumed_from
+    return {
+        "output_path": os.path.abspath(output_path),
+        "ids_path": os.path.abspath(ids_path),
+        "rows": total,
+        "dimensions": state["dim"],
+        "resumed_from": resumed_from,
+        "embedded": embedded,
+        "batches": batches,
+        "estimated_tokens": tokens,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(embedded / elapsed, 1) if elapsed > 0 else None,
+    }
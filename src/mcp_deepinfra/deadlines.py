@@ -0,0 +1,104 @@
+"""Per-call deadlines that bound every upstream request made on behalf of a tool call.
+
+The deadline is an absolute ``time.monotonic()`` value in a context variable,
+so it follows the call through the scheduler, the router and any tasks it
+spawns. :func:`deadline` also cancels the enclosed work when time runs out,
+and :func:`clamp_timeout`, installed as an httpx request hook, shortens each
+HTTP request's timeouts to the time left so no request outlives its call.
+Work shared by several callers is started with :func:`detach`, so it runs
+without any one caller's deadline, and each caller waits on it with
+:func:`bounded`.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Awaitable, Coroutine, TypeVar
+
+import anyio
+import httpx
+
+T = TypeVar("T")
+
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The work did not finish before its deadline."""
+
+
+def current() -> float | None:
+    """Return the current deadline as a ``time.monotonic()`` value, or None if there is none."""
+    return _deadline.get()
+
+
+def remaining() -> float | None:
+    """Return the seconds left before the current deadline (may be negative), or None."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def expired() -> bool:
+    """Return True if there is a deadline and it has passed."""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+@contextmanager
+def deadline(seconds: float | None, grace: float = 0.0):
+    """Run the block with a deadline ``seconds`` from now (None or 0: no deadline).
+
+    An enclosing deadline that is sooner stays in force. When the deadline
+    passes, the block is cancelled and DeadlineExceeded is raised. With a
+    ``grace`` period, the block is only cancelled that long after the
+    deadline, leaving it time to return the parts that finished in time.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    at = time.monotonic() + seconds
+    enclosing = _deadline.get()
+    if enclosing is not None and enclosing <= at:
+        yield
+        return
+    token = _deadline.set(at)
+    try:
+        with anyio.move_on_after(seconds + grace) as scope:
+            yield
+    finally:
+        _deadline.reset(token)
+    if scope.cancelled_caught:
+        raise DeadlineExceeded(f"No result within {seconds:g} seconds")
+
+
+async def bounded(awaitable: Awaitable[T]) -> T:
+    """Await ``awaitable`` until the current deadline; raise DeadlineExceeded if it passes first."""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    with anyio.move_on_after(left):
+        return await awaitable
+    raise DeadlineExceeded("Deadline passed before the result was ready")
+
+
+def detach(coro: Coroutine[None, None, T]) -> "asyncio.Task[T]":
+    """Start ``coro`` as a task that does not inherit the current deadline.
+
+    The task still sees the caller's other context variables. Its callers
+    bound their own waits, and cancel it once none of them is waiting.
+    """
+    context = copy_context()
+    context.run(_deadline.set, None)
+    return context.run(asyncio.create_task, coro)
+
+
+async def clamp_timeout(request: httpx.Request) -> None:
+    """httpx request hook: cap the request's connect, read, write and pool timeouts at the time left."""
+    left = remaining()
+    if left is None:
+        return
+    if left <= 0:
+        raise DeadlineExceeded(f"Deadline passed before {request.method} {request.url.host}")
+    timeouts = request.extensions.get("timeout") or dict.fromkeys(("connect", "read", "write", "pool"))
+    request.extensions["timeout"] = {key: left if value is None else min(value, left) for key, value in timeouts.items()}
@@ -0,0 +1,131 @@
+"""Persistent, content-addressed cache for embedding vectors backed by SQLite."""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Vectors are stored losslessly so cache hits are identical to upstream results.
+_STORAGE_DTYPE = "<f8"
+
+
+def text_key(text: str) -> str:
+    """Return the content hash used to address a text in the cache."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Size-bounded LRU cache of embeddings keyed by (model, sha256(text)).
+
+    All SQLite access is serialized behind a lock and run in a worker thread by
+    the async methods, so the event loop is never blocked on disk I/O.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def _get_many(self, model: str, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=_STORAGE_DTYPE).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, model, key) for key in found],
+                )
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def _put_many(self, model: str, items: dict[str, list[float]]) -> None:
+        now = time.time()
+        rows = [
+            (model, key, np.asarray(vector, dtype=_STORAGE_DTYPE).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def _invalidate(self, model: str | None) -> int:
+        with self._lock:
+            if model is None:
+                cursor = self._conn.execute("DELETE FROM embeddings")
+            else:
+                cursor = self._conn.execute("DELETE FROM embeddings WHERE model = ?", (model,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT model, COUNT(*) FROM embeddings GROUP BY model").fetchall()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "max_entries": self.max_entries,
+            "entries": sum(count for _, count in rows),
+            "entries_by_model": dict(rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    async def get_many(self, model: str, keys: list[str]) -> dict[str, list[float]]:
+        """Look up vectors for ``keys``; returns only the keys that were found."""
+        return await asyncio.to_thread(self._get_many, model, keys)
+
+    async def put_many(self, model: str, items: dict[str, list[float]]) -> None:
+        """Store vectors and evict least-recently-used entries beyond ``max_entries``."""
+        await asyncio.to_thread(self._put_many, model, items)
+
+    async def invalidate(self, model: str | None = None) -> int:
+        """Drop cached vectors for ``model`` (or every model); returns rows removed."""
+        return await asyncio.to_thread(self._invalidate, model)
+
+    async def stats(self) -> dict:
+        """Return entry counts and hit/miss counters."""
+        return await asyncio.to_thread(self._stats)
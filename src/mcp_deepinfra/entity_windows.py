@@ -0,0 +1,145 @@
+"""Windowed token classification: split long text into overlapping windows and merge the entities."""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from . import deadlines
+
+# window text -> entities with "entity", "type" and window-relative "position" hints
+ClassifyFn = Callable[[str], Awaitable[list[dict]]]
+# (finished count, total windows, window, entities with global positions), called as each window finishes
+WindowCallback = Callable[[int, int, "TextWindow", list[dict]], Awaitable[None]]
+
+
+@dataclass
+class TextWindow:
+    index: int
+    start: int
+    end: int
+    # Span this window is responsible for: from the middle of its left overlap to the middle of its right one
+    own_start: int = 0
+    own_end: int = 0
+
+
+def plan_windows(text: str, window_chars: int, overlap_chars: int) -> list[TextWindow]:
+    """Cover ``text`` with windows of about ``window_chars`` overlapping by about ``overlap_chars``.
+
+    Window edges are moved back to whitespace where possible so words are not split.
+    """
+    if window_chars <= 0:
+        raise ValueError("window_chars must be positive")
+    if not 0 <= overlap_chars < window_chars // 2:
+        raise ValueError("overlap_chars must be non-negative and less than half of window_chars")
+    windows = []
+    start = 0
+    while True:
+        end = min(start + window_chars, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start + window_chars // 2, end)
+            if space != -1:
+                end = space
+        windows.append(TextWindow(len(windows), start, end))
+        if end >= len(text):
+            break
+        next_start = end - overlap_chars
+        space = text.rfind(" ", start + 1, next_start + 1)
+        start = space + 1 if space >= next_start - overlap_chars // 2 else next_start
+    for i, window in enumerate(windows):
+        window.own_start = 0 if i == 0 else (windows[i - 1].end + window.start) // 2
+        window.own_end = len(text) if i == len(windows) - 1 else (window.end + windows[i + 1].start) // 2
+    return windows
+
+
+def locate(entity: str, window_text: str, hint) -> tuple[int, int] | None:
+    """Find ``entity`` in the window, preferring the model's position hint; None if absent.
+
+    Models often report approximate or token-based offsets, so the span is
+    recomputed from the text: the hint is used as-is only if it matches exactly,
+    otherwise the occurrence nearest to the hinted start is chosen.
+    """
+    if not entity:
+        return None
+    hinted_start = None
+    if isinstance(hint, (list, tuple)) and len(hint) == 2 and all(isinstance(v, int) for v in hint):
+        if window_text[hint[0]:hint[1]] == entity:
+            return hint[0], hint[1]
+        hinted_start = hint[0]
+    occurrences = []
+    position = window_text.find(entity)
+    while position != -1:
+        occurrences.append(position)
+        position = window_text.find(entity, position + 1)
+    if not occurrences:
+        return None
+    start = occurrences[0] if hinted_start is None else min(occurrences, key=lambda p: abs(p - hinted_start))
+    return start, start + len(entity)
+
+
+def place(window: TextWindow, text: str, entities: list[dict]) -> list[dict]:
+    """Map one window's entities to global offsets, keeping only those the window owns."""
+    window_text = text[window.start:window.end]
+    placed = []
+    for item in entities:
+        if not isinstance(item, dict):
+            continue
+        entity = str(item.get("entity", ""))
+        span = locate(entity, window_text, item.get("position"))
+        if span is None:
+            continue
+        start, end = window.start + span[0], window.start + span[1]
+        if window.own_start <= start < window.own_end:
+            placed.append({"entity": entity, "type": item.get("type"), "position": [start, end]})
+    return placed
+
+
+def merge(groups: list[list[dict]]) -> list[dict]:
+    """Combine placed entities from all windows, sorted by position, without duplicates."""
+    seen = set()
+    merged = []
+    for entity in sorted((e for group in groups for e in group), key=lambda e: tuple(e["position"])):
+        key = (*entity["position"], entity["type"])
+        if key not in seen:
+            seen.add(key)
+            merged.append(entity)
+    return merged
+
+
+async def classify_windowed(
+    classify: ClassifyFn,
+    text: str,
+    window_chars: int,
+    overlap_chars: int,
+    max_workers: int,
+    on_window: WindowCallback | None = None,
+) -> dict:
+    """Classify overlapping windows concurrently (at most ``max_workers`` at once) and merge them.
+
+    A failing window is reported in ``errors`` and does not fail the others;
+    windows not finished by the deadline are reported as ``DeadlineExceeded``.
+    """
+    windows = plan_windows(text, window_chars, overlap_chars)
+    semaphore = asyncio.Semaphore(max_workers)
+    finished = 0
+
+    async def classify_window(window: TextWindow) -> list[dict]:
+        async with semaphore:
+            return place(window, text, await classify(text[window.start:window.end]))
+
+    async def run(window: TextWindow) -> tuple[TextWindow, list[dict] | None, str | None]:
+        nonlocal finished
+        try:
+            entities = await deadlines.bounded(classify_window(window))
+        except Exception as e:
+            return window, None, f"{type(e).__name__}: {str(e)}"
+        finished += 1
+        if on_window is not None:
+            await on_window(finished, len(windows), window, entities)
+        return window, entities, None
+
+    results = await asyncio.gather(*(run(window) for window in windows))
+    return {
+        "entities": merge([entities for _, entities, _ in results if entities is not None]),
+        "windows": len(windows),
+        "errors": [{"window": window.index, "error": error} for window, _, error in results if error is not None],
+    }
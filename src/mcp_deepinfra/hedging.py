@@ -0,0 +1,110 @@
+"""Request hedging: fire a duplicate request when the first one is slower than usual."""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyWindow:
+    """Rolling window of recent latencies for one (tool, model) pair."""
+
+    def __init__(self, size: int = 200):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """Runs idempotent calls with an optional hedge after the rolling p95 latency.
+
+    A hedge is only sent once ``min_samples`` latencies are known, and only
+    while hedges stay below ``max_ratio`` of all requests. The first successful
+    response wins and the other request is cancelled.
+    """
+
+    def __init__(self, max_ratio: float = 0.05, min_samples: int = 20, quantile: float = 0.95):
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self._windows: dict[tuple[str, str], LatencyWindow] = {}
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def _window(self, tool: str, model: str) -> LatencyWindow:
+        return self._windows.setdefault((tool, model), LatencyWindow())
+
+    def _counters(self, tool: str) -> dict[str, int]:
+        return self._stats.setdefault(tool, {"requests": 0, "hedges": 0, "hedge_wins": 0})
+
+    def _hedge_delay(self, tool: str, model: str) -> float | None:
+        window = self._window(tool, model)
+        if len(window.samples) < self.min_samples:
+            return None
+        counters = self._counters(tool)
+        if counters["hedges"] + 1 > self.max_ratio * counters["requests"]:
+            return None
+        return window.percentile(self.quantile)
+
+    async def run(self, tool: str, model: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Run ``call``; if it is still pending after the p95 latency, race a second copy."""
+        counters = self._counters(tool)
+        counters["requests"] += 1
+        delay = self._hedge_delay(tool, model)
+
+        async def timed() -> tuple[T, float]:
+            start = time.monotonic()
+            result = await call()
+            return result, time.monotonic() - start
+
+        primary = asyncio.ensure_future(timed())
+        tasks = [primary]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    counters["hedges"] += 1
+                    tasks.append(asyncio.ensure_future(timed()))
+            pending = set(tasks)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    result, latency = task.result()
+                    self._window(tool, model).add(latency)
+                    if task is not primary:
+                        counters["hedge_wins"] += 1
+                    return result
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        tools = {}
+        for tool, counters in self._stats.items():
+            requests = counters["requests"]
+            p95 = {
+                model: round(window.percentile(self.quantile), 4)
+                for (window_tool, model), window in self._windows.items()
+                if window_tool == tool and window.samples
+            }
+            tools[tool] = {
+                **counters,
+                "hedge_rate": counters["hedges"] / requests if requests else 0.0,
+                "win_rate": counters["hedge_wins"] / counters["hedges"] if counters["hedges"] else 0.0,
+                "p95_seconds": p95,
+            }
+        return {"max_ratio": self.max_ratio, "min_samples": self.min_samples, "tools": tools}
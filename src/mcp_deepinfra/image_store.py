@@ -0,0 +1,87 @@
+"""Content-addressed local store for generated images.
+
+Images are saved once under their SHA-256 digest, as ``<dir>/<2 hex>/<digest>.<ext>``,
+and addressed by the name ``<digest>.<ext>``, so the same image generated or
+downloaded twice takes no extra space.
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import re
+
+import httpx
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp", "gif": "image/gif"}
+
+_NAME = re.compile(r"^[0-9a-f]{64}\.(png|jpeg|webp|gif)$")
+
+
+def detect_format(data: bytes) -> str:
+    """Return the file extension for image bytes; raise ValueError if the format is unknown."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    raise ValueError("Unrecognized image format")
+
+
+class ImageStore:
+    """Directory of images named by content hash."""
+
+    def __init__(self, directory: str, max_bytes: int = 50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        """Return the file path for an image name; raise ValueError for malformed names."""
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid image name '{name}'")
+        return os.path.join(self.directory, name[:2], name)
+
+    def put(self, data: bytes) -> dict:
+        """Store image bytes (if not already present) and describe the stored image."""
+        extension = detect_format(data)
+        name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self.path(name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        return {"name": name, "mime_type": MIME_TYPES[extension], "bytes": len(data), "path": path}
+
+    def get(self, name: str) -> bytes:
+        """Read a stored image; raise ValueError if the name is malformed or unknown."""
+        try:
+            with open(self.path(name), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            raise ValueError(f"Unknown image '{name}'") from None
+
+    async def _download(self, url: str, http_client: httpx.AsyncClient) -> bytes:
+        async with http_client.stream("GET", url) as response:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ValueError(f"Image exceeds the maximum size of {self.max_bytes} bytes")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def fetch(self, source: str, http_client: httpx.AsyncClient) -> dict:
+        """Store an image given as an http(s) URL or a base64 data URI."""
+        if source.startswith("data:"):
+            data = base64.b64decode(source.partition(",")[2])
+        else:
+            data = await self._download(source, http_client)
+        return await asyncio.to_thread(self.put, data)
@@ -0,0 +1,158 @@
+"""Image pre-fetching, downscaling and caching for the vision tools.
+
+Pillow is optional; without it images are passed to the provider by URL.
+Unless private targets are allowed, only URLs whose host resolves to public
+addresses are fetched (each redirect is checked again); any other URL is
+passed to the provider unchanged, as it was before pre-fetching.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import ipaddress
+import socket
+from collections import OrderedDict
+
+import httpx
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - exercised only without Pillow
+    Image = None
+
+
+def available() -> bool:
+    """Return True if image preparation is possible (Pillow is installed)."""
+    return Image is not None
+
+
+MAX_REDIRECTS = 5
+
+
+class PrivateAddressError(ValueError):
+    """The image URL points at a loopback, private, link-local or otherwise non-public address."""
+
+
+async def _check_public(url: httpx.URL) -> None:
+    if url.scheme not in ("http", "https"):
+        raise PrivateAddressError(f"Unsupported image URL scheme {url.scheme!r}")
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(url.host, None, type=socket.SOCK_STREAM)
+    except OSError as e:
+        raise PrivateAddressError(f"Cannot resolve {url.host}: {e}") from e
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        if not address.is_global:
+            raise PrivateAddressError(f"{url.host} resolves to non-public address {address}")
+
+
+def _target_size(width: int, height: int, max_long_side: int, max_short_side: int) -> tuple[int, int]:
+    scale = min(1.0, max_long_side / max(width, height), max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _encode(data: bytes, max_long_side: int, max_short_side: int, quality: int) -> str:
+    """Downscale and re-encode image bytes, returning a data URI."""
+    with Image.open(io.BytesIO(data)) as image:
+        source_format = image.format
+        image = ImageOps.exif_transpose(image)
+        size = _target_size(image.width, image.height, max_long_side, max_short_side)
+        if size == image.size and source_format in ("JPEG", "WEBP"):
+            mime = "image/jpeg" if source_format == "JPEG" else "image/webp"
+            return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+class ImagePreparer:
+    """Fetch images once, downscale them and cache the resulting data URIs.
+
+    Prepared payloads are cached by content hash, and URLs are mapped to the
+    hash of the content they returned, so the same image reached through
+    different URLs is only encoded once.
+    """
+
+    def __init__(
+        self,
+        max_long_side: int = 2048,
+        max_short_side: int = 768,
+        quality: int = 85,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_entries: int = 256,
+        allow_private: bool = False,
+    ):
+        self.max_long_side = max_long_side
+        self.max_short_side = max_short_side
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.allow_private = allow_private
+        self._by_url: OrderedDict[str, str] = OrderedDict()
+        self._by_hash: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, cache: OrderedDict, key: str, value: str) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    async def _download(self, url: str, http_client: httpx.AsyncClient) -> bytes:
+        target = httpx.URL(url)
+        for _ in range(MAX_REDIRECTS + 1):
+            if not self.allow_private:
+                await _check_public(target)
+            # Redirects are followed here, so that every hop is checked
+            async with http_client.stream("GET", target, follow_redirects=False) as response:
+                if response.is_redirect:
+                    target = response.next_request.url
+                    continue
+                response.raise_for_status()
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"Image exceeds the maximum size of {self.max_bytes} bytes")
+                    chunks.append(chunk)
+            return b"".join(chunks)
+        raise ValueError(f"More than {MAX_REDIRECTS} redirects fetching the image")
+
+    async def prepare(self, url: str, http_client: httpx.AsyncClient) -> str:
+        """Return a compact data URI for ``url``, or ``url`` itself if it cannot be prepared."""
+        if not available() or url.startswith("data:"):
+            return url
+        digest = self._by_url.get(url)
+        if digest is not None and digest in self._by_hash:
+            self._by_url.move_to_end(url)
+            self._by_hash.move_to_end(digest)
+            self.hits += 1
+            return self._by_hash[digest]
+
+        try:
+            data = await self._download(url, http_client)
+        except (httpx.HTTPError, ValueError):
+            # Let the provider try to fetch the image itself, as it did before pre-fetching
+            return url
+        digest = hashlib.sha256(data).hexdigest()
+        self._remember(self._by_url, url, digest)
+        if digest in self._by_hash:
+            self._by_hash.move_to_end(digest)
+            self.hits += 1
+            return self._by_hash[digest]
+
+        self.misses += 1
+        try:
+            prepared = await asyncio.to_thread(_encode, data, self.max_long_side, self.max_short_side, self.quality)
+        except Exception:
+            # Unreadable by Pillow (e.g. SVG); fall back to the original URL
+            return url
+        self._remember(self._by_hash, digest, prepared)
+        return prepared
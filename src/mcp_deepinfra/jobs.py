@@ -0,0 +1,374 @@
+"""Background jobs for long-running tools, with the queue persisted in SQLite.
+
+Submitting a job records it as queued and returns its id at once. A bounded
+pool of asyncio workers claims queued jobs in submission order, runs the
+handler for the job's kind and stores the result or error. Because the queue
+lives in SQLite, jobs survive a restart: queued jobs are picked up again and
+jobs that were running in a process that no longer exists are re-queued.
+Several server processes can share one database; a job is claimed with a
+conditional UPDATE, so exactly one process runs it.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from .deadlines import DeadlineExceeded
+
+# Job arguments -> result text
+Handler = Callable[[dict], Awaitable[str]]
+# (kind, final status or "timeout" for a failure at the deadline, seconds queued, seconds running)
+JobObserver = Callable[[str, str, float, float], None]
+
+STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED = ("succeeded", "failed", "cancelled")
+
+_COLUMNS = "id, kind, arguments, status, result, error, owner, created, started, finished"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _record(row: tuple) -> dict:
+    job = dict(zip(_COLUMNS.split(", "), row))
+    job["arguments"] = json.loads(job["arguments"])
+    return job
+
+
+class JobStore:
+    """SQLite table of jobs; every method is synchronous and serialized behind a lock."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                arguments TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                owner INTEGER,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)")
+
+    def insert(self, kind: str, arguments: dict, max_queued: int) -> dict:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                (queued,) = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()
+                if queued >= max_queued:
+                    raise ValueError(f"Job queue is full ({queued} queued jobs)")
+                self._conn.execute(
+                    "INSERT INTO jobs (id, kind, arguments, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                    (job_id, kind, json.dumps(arguments), now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"id": job_id, "kind": kind, "status": "queued", "created": now}
+
+    def claim(self, kinds: list[str], owner: int) -> dict | None:
+        """Mark the oldest queued job of one of ``kinds`` as running by ``owner`` and return it."""
+        placeholders = ",".join("?" * len(kinds))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) "
+                    "ORDER BY created LIMIT 1",
+                    kinds,
+                ).fetchone()
+                started = time.time()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, started = ? WHERE id = ?",
+                        (owner, started, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = _record(row)
+        job.update(status="running", owner=owner, started=started)
+        return job
+
+    def finish(self, job_id: str, status: str, result: str | None = None, error: str | None = None) -> bool:
+        """Record the outcome of a running job; False if it was cancelled meanwhile."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ? AND status = 'running'",
+                (status, result, error, time.time(), job_id),
+            )
+        return cursor.rowcount == 1
+
+    def requeue(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, started = NULL WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def cancel(self, job_id: str) -> str | None:
+        """Cancel a job that has not finished; return its status before cancelling, or None if unknown."""
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] not in FINISHED:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = ?",
+                    (time.time(), job_id, row[0]),
+                )
+        return row[0]
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else _record(row)
+
+    def list(self, status: str | None, limit: int) -> list[dict]:
+        query = f"SELECT {_COLUMNS} FROM jobs"
+        parameters: list = []
+        if status is not None:
+            query += " WHERE status = ?"
+            parameters.append(status)
+        with self._lock:
+            rows = self._conn.execute(f"{query} ORDER BY created DESC LIMIT ?", [*parameters, limit]).fetchall()
+        return [_record(row) for row in rows]
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: dict(rows).get(status, 0) for status in STATUSES}
+
+    def recover(self, owner: int) -> int:
+        """Re-queue running jobs whose owning process is gone (or is this process, restarted)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+            orphans = [job_id for job_id, pid in rows if pid is None or pid == owner or not _process_alive(pid)]
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'queued', owner = NULL, started = NULL WHERE id = ? AND status = 'running'",
+                [(job_id,) for job_id in orphans],
+            )
+        return len(orphans)
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs that finished before ``older_than`` (a Unix time)."""
+        placeholders = ",".join("?" * len(FINISHED))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({placeholders}) AND finished < ?",
+                (*FINISHED, older_than),
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """Runs queued jobs on at most ``workers`` concurrent asyncio workers.
+
+    Workers start on first use. They wake immediately for jobs submitted in
+    this process and poll every ``poll_interval`` seconds for jobs queued by
+    other processes sharing the database.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        handlers: dict[str, Handler],
+        workers: int = 4,
+        max_queued: int = 1000,
+        retention: float = 86400.0,
+        poll_interval: float = 1.0,
+        observer: JobObserver | None = None,
+    ):
+        self.path = path
+        self.handlers = handlers
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.observer = observer
+        self.recovered = 0
+        self._store: JobStore | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._workers: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+        self._cancelled: set[str] = set()
+        self._finished: dict[str, asyncio.Event] = {}
+        self._last_purge = 0.0
+        self._start_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Open the database, re-queue orphaned jobs and start the workers (idempotent)."""
+        if self._workers:
+            return
+        async with self._start_lock:
+            if self._workers:
+                return
+            self._store = await asyncio.to_thread(JobStore, self.path)
+            self._wakeup = asyncio.Event()
+            self.recovered = await asyncio.to_thread(self._store.recover, os.getpid())
+            await self._purge()
+            self._workers = [asyncio.ensure_future(self._work()) for _ in range(max(1, self.workers))]
+
+    async def close(self) -> None:
+        """Stop the workers; jobs they were running go back to the queue."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    async def _purge(self) -> None:
+        now = time.time()
+        if now - self._last_purge >= min(self.retention, 3600):
+            self._last_purge = now
+            await asyncio.to_thread(self._store.purge, now - self.retention)
+
+    async def _work(self) -> None:
+        kinds = list(self.handlers)
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await asyncio.to_thread(self._store.claim, kinds, os.getpid())
+                if job is not None:
+                    await self._run(job)
+                    continue
+            except sqlite3.Error:
+                # A locked or unavailable database must not stop the worker; try again after a pause
+                pass
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: dict) -> None:
+        job_id = job["id"]
+        task = asyncio.ensure_future(self.handlers[job["kind"]](job["arguments"]))
+        self._running[job_id] = task
+        result = error = None
+        outcome = None
+        try:
+            result = await task
+            status = "succeeded"
+        except asyncio.CancelledError:
+            if job_id not in self._cancelled:
+                # The worker itself is shutting down: leave the job for the next start
+                task.cancel()
+                await asyncio.to_thread(self._store.requeue, job_id)
+                raise
+            status = "cancelled"
+        except Exception as e:
+            status = "failed"
+            error = f"{type(e).__name__}: {str(e)}"
+            if isinstance(e, DeadlineExceeded):
+                outcome = "timeout"
+        finally:
+            self._running.pop(job_id, None)
+        self._cancelled.discard(job_id)
+        if status != "cancelled":
+            await asyncio.to_thread(self._store.finish, job_id, status, result, error)
+        if self.observer is not None:
+            finished = time.time()
+            self.observer(job["kind"], outcome or status, job["started"] - job["created"], finished - job["started"])
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def submit(self, kind: str, arguments: dict) -> dict:
+        """Queue a job and return its id and status without waiting for it to run."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        await self.start()
+        job = await asyncio.to_thread(self._store.insert, kind, arguments, self.max_queued)
+        self._wakeup.set()
+        await self._purge()
+        return job
+
+    async def get(self, job_id: str) -> dict:
+        """Return the job record; raise ValueError if there is no such job."""
+        await self.start()
+        job = await asyncio.to_thread(self._store.get, job_id)
+        if job is None:
+            raise ValueError(f"Unknown job '{job_id}'")
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> dict:
+        """Wait up to ``timeout`` seconds for the job to finish and return its record."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job["status"] in FINISHED or remaining <= 0:
+                return job
+            event = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                # Jobs run by other processes are only seen by polling the database
+                await asyncio.wait_for(event.wait(), min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    async def cancel(self, job_id: str) -> dict:
+        """Cancel a queued or running job and return its record."""
+        await self.start()
+        previous = await asyncio.to_thread(self._store.cancel, job_id)
+        if previous is None:
+            raise ValueError(f"Unknown job '{job_id}'")
+        task = self._running.get(job_id)
+        if previous == "running" and task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+        elif previous not in FINISHED and job_id in self._finished:
+            self._finished.pop(job_id).set()
+        return await self.get(job_id)
+
+    async def list(self, status: str | None = None, limit: int = 20) -> list[dict]:
+        """Return the most recently submitted jobs, optionally only those with ``status``."""
+        if status is not None and status not in STATUSES:
+            raise ValueError(f"Unknown status '{status}', expected one of {', '.join(STATUSES)}")
+        await self.start()
+        return await asyncio.to_thread(self._store.list, status, limit)
+
+    async def stats(self) -> dict:
+        """Return job counts by status and the worker pool configuration."""
+        await self.start()
+        return {
+            "path": self.path,
+            "workers": self.workers,
+            "running_here": len(self._running),
+            "max_queued": self.max_queued,
+            "recovered_at_start": self.recovered,
+            "jobs": await asyncio.to_thread(self._store.counts),
+        }
@@ -0,0 +1,300 @@
+"""In-process metrics: tool and upstream latency histograms, token usage, payload sizes and errors.
+
+Metrics are exposed as a JSON summary (the ``metrics://summary`` resource) and
+in the Prometheus text format, optionally served on a local port or written to
+a textfile for the node_exporter textfile collector.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from . import deadlines
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Tool currently being served, so upstream calls can be attributed to it
+current_tool: ContextVar[str] = ContextVar("current_tool", default="")
+
+# Tools report failures as "Error <doing something>: <ExceptionType>: <message>"
+_ERROR_CLASS = re.compile(r"^Error[^:]*: (\w+):")
+
+
+
+def error_class(result) -> str | None:
+    """Return the exception class named by a tool's error string, or None if ``result`` is not one."""
+    match = _ERROR_CLASS.match(result) if isinstance(result, str) else None
+    return match.group(1) if match else None
+
+
+HISTOGRAMS = {
+    "tool_duration_seconds": ("Tool call latency", ("tool",), LATENCY_BUCKETS),
+    "tool_request_bytes": ("Size of tool arguments", ("tool",), SIZE_BUCKETS),
+    "tool_response_bytes": ("Size of tool results", ("tool",), SIZE_BUCKETS),
+    "upstream_queue_seconds": ("Time waiting for a scheduler slot", ("tool", "model"), LATENCY_BUCKETS),
+    "upstream_duration_seconds": ("Upstream call latency", ("tool", "model"), LATENCY_BUCKETS),
+    "job_queue_seconds": ("Time background jobs spent queued", ("kind",), LATENCY_BUCKETS),
+    "job_run_seconds": ("Background job run time", ("kind",), LATENCY_BUCKETS),
+}
+COUNTERS = {
+    "tool_calls_total": ("Tool calls by outcome", ("tool", "outcome")),
+    "tool_errors_total": ("Tool errors by exception class", ("tool", "error")),
+    "upstream_errors_total": ("Upstream errors by exception class", ("tool", "model", "error")),
+    "upstream_aborted_total": ("Upstream calls abandoned on cancellation or deadline", ("tool", "model", "reason")),
+    "upstream_tokens_total": ("Tokens reported in upstream usage", ("tool", "model", "kind")),
+    "jobs_total": ("Background jobs by final status", ("kind", "status")),
+    "routed_calls_total": ("Calls served per model by routing choice", ("tool", "model", "choice")),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate a quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            **{name: _round(self.quantile(q)) for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        }
+
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(value, 6)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _size(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+class Metrics:
+    """Registry of the server's histograms and counters.
+
+    Updates happen on the event loop; reads may come from the Prometheus
+    exporter thread, so both take a lock.
+    """
+
+    def __init__(self, prefix: str = "mcp_deepinfra"):
+        self.prefix = prefix
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._histograms: dict[str, dict[tuple, Histogram]] = {name: {} for name in HISTOGRAMS}
+        self._counters: dict[str, dict[tuple, float]] = {name: {} for name in COUNTERS}
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        with self._lock:
+            series = self._histograms[name]
+            if labels not in series:
+                series[labels] = Histogram(HISTOGRAMS[name][2])
+            series[labels].observe(value)
+
+    def increment(self, name: str, labels: tuple, amount: float = 1) -> None:
+        with self._lock:
+            series = self._counters[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def instrument(self, fn):
+        """Decorate an async tool to record its latency, payload sizes and errors."""
+        tool = fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = current_tool.set(tool)
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                arguments = {key: value for key, value in kwargs.items() if key != "ctx"}
+                self.observe("tool_request_bytes", (tool,), _size(arguments))
+                result = await fn(*args, **kwargs)
+                error = error_class(result)
+                if error:
+                    self.increment("tool_errors_total", (tool, error))
+                    if error == deadlines.DeadlineExceeded.__name__:
+                        outcome = "timeout"
+                else:
+                    outcome = "ok"
+                self.observe("tool_response_bytes", (tool,), _size(result))
+                return result
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            except Exception as e:
+                self.increment("tool_errors_total", (tool, type(e).__name__))
+                raise
+            finally:
+                self.observe("tool_duration_seconds", (tool,), time.perf_counter() - start)
+                self.increment("tool_calls_total", (tool, outcome))
+                current_tool.reset(token)
+
+        return wrapper
+
+    def observe_upstream(
+        self,
+        model: str,
+        queue_wait: float,
+        duration: float | None,
+        response=None,
+        error: BaseException | None = None,
+    ) -> None:
+        """Record one upstream attempt: time queued, time upstream, usage tokens or the error."""
+        labels = (current_tool.get() or "internal", model)
+        self.observe("upstream_queue_seconds", labels, queue_wait)
+        if duration is not None:
+            self.observe("upstream_duration_seconds", labels, duration)
+        if isinstance(error, (asyncio.CancelledError, deadlines.DeadlineExceeded)):
+            # Cancellation at the deadline counts as a timeout, anything else as the client giving up
+            reason = "deadline" if deadlines.expired() or isinstance(error, deadlines.DeadlineExceeded) else "cancelled"
+            self.increment("upstream_aborted_total", (*labels, reason))
+        elif error is not None:
+            self.increment("upstream_errors_total", (*labels, type(error).__name__))
+        usage = getattr(response, "usage", None)
+        for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            value = getattr(usage, kind, None)
+            if isinstance(value, (int, float)) and value:
+                self.increment("upstream_tokens_total", (*labels, kind.removesuffix("_tokens")), value)
+
+    def observe_route(self, tool: str, model: str, choice: str) -> None:
+        """Count a call served by ``model`` (choice: best, explore, probe or fallback)."""
+        self.increment("routed_calls_total", (tool, model, choice))
+
+    def observe_job(self, kind: str, status: str, queue_wait: float, duration: float) -> None:
+        """Record one finished background job: time queued, run time and final status."""
+        self.observe("job_queue_seconds", (kind,), queue_wait)
+        self.observe("job_run_seconds", (kind,), duration)
+        self.increment("jobs_total", (kind, status))
+
+    def summary(self) -> dict:
+        """Return all metrics as nested JSON-serializable dictionaries."""
+        with self._lock:
+            report = {"uptime_seconds": round(time.time() - self.started, 3)}
+            for name, series in self._histograms.items():
+                label_names = HISTOGRAMS[name][1]
+                report[name] = [
+                    {**dict(zip(label_names, labels)), **histogram.summary()}
+                    for labels, histogram in sorted(series.items())
+                ]
+            for name, series in self._counters.items():
+                label_names = COUNTERS[name][1]
+                report[name] = [
+                    {**dict(zip(label_names, labels)), "value": value}
+                    for labels, value in sorted(series.items())
+                ]
+        return report
+
+    def prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in self._histograms.items():
+                help_text, label_names, buckets = HISTOGRAMS[name]
+                metric = f"{self.prefix}_{name}"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip((*buckets, "+Inf"), histogram.counts):
+                        cumulative += count
+                        le = f'le="{bound}"'
+                        lines.append(f"{metric}_bucket{_labels(label_names, labels, le)} {cumulative}")
+                    lines.append(f"{metric}_sum{_labels(label_names, labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{_labels(label_names, labels)} {histogram.count}")
+            for name, series in self._counters.items():
+                help_text, label_names = COUNTERS[name]
+                metric = f"{self.prefix}_{name}"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{metric}{_labels(label_names, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1", attempts: int = 1) -> int:
+        """Serve ``/metrics`` in the Prometheus format from a daemon thread.
+
+        Tries ``attempts`` consecutive ports starting at ``port`` and returns the one bound.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # stdout carries the MCP protocol; keep request logs out of it
+                pass
+
+        for candidate in range(port, port + attempts):
+            try:
+                server = ThreadingHTTPServer((host, candidate), Handler)
+                break
+            except OSError:
+                if candidate == port + attempts - 1:
+                    raise
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return candidate
+
+    def write_textfile(self, path: str, interval: float = 15.0) -> None:
+        """Periodically write the Prometheus text to ``path`` (atomically) from a daemon thread."""
+
+        def loop():
+            while True:
+                temporary = f"{path}.{os.getpid()}.tmp"
+                with open(temporary, "w", encoding="utf-8") as file:
+                    file.write(self.prometheus())
+                os.replace(temporary, path)
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name="metrics-textfile", daemon=True).start()
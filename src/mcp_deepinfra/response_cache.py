@@ -0,0 +1,151 @@
+"""LRU + TTL response cache with single-flight de-duplication and an optional disk tier."""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from . import deadlines
+
+
+def normalize_input(text: str) -> str:
+    """Normalize tool input for cache keys (Unicode NFC, surrounding whitespace removed)."""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def cache_key(tool: str, model: str, payload: str, params: dict) -> str:
+    """Build a cache key from the tool, model, normalized payload and sampling params."""
+    raw = json.dumps([tool, model, normalize_input(payload), params], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-backed second tier; values survive restarts until their TTL expires."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> tuple[Any, float] | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, value: Any, expires: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires),
+            )
+            self._conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+            self._conn.commit()
+
+
+class ResponseCache:
+    """In-memory LRU cache with per-entry TTL, shared by the deterministic tools.
+
+    Concurrent misses for the same key share one in-flight computation
+    (single-flight), so identical requests issue a single upstream call.
+    The computation runs without the callers' deadlines; each caller stops
+    waiting at its own deadline, and the computation is cancelled once every
+    caller waiting for it has given up.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, disk_path: str | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+        self._disk = _DiskTier(disk_path) if disk_path else None
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def _count(self, tool: str, field: str) -> None:
+        counters = self._stats.setdefault(tool, {"hits": 0, "disk_hits": 0, "misses": 0, "shared": 0})
+        counters[field] += 1
+
+    def _store(self, key: str, value: Any, expires: float) -> None:
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, tool: str, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for ``key`` or compute it once for all concurrent callers.
+
+        Values must be JSON-serializable when the disk tier is enabled. Exceptions
+        are propagated to every waiting caller and are not cached.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self._count(tool, "hits")
+                return entry[0]
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count(tool, "shared")
+            return await self._wait(key, task)
+
+        task = deadlines.detach(self._load(tool, key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await self._wait(key, task)
+
+    async def _wait(self, key: str, task: asyncio.Task) -> Any:
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await deadlines.bounded(asyncio.shield(task))
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                # Nobody wants the result any more; stop the upstream call instead of leaving it orphaned
+                if not task.done():
+                    task.cancel()
+
+    async def _load(self, tool: str, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if self._disk is not None:
+            found = await asyncio.to_thread(self._disk.get, key)
+            if found is not None:
+                self._store(key, *found)
+                self._count(tool, "disk_hits")
+                return found[0]
+
+        self._count(tool, "misses")
+        value = await compute()
+        expires = time.time() + self.ttl
+        self._store(key, value, expires)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.put, key, value, expires)
+        return value
+
+    def stats(self) -> dict:
+        """Return per-tool counters and hit rates."""
+        tools = {}
+        for tool, counters in self._stats.items():
+            served = counters["hits"] + counters["disk_hits"] + counters["shared"]
+            total = served + counters["misses"]
+            tools[tool] = {**counters, "hit_rate": served / total if total else 0.0}
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "disk": self._disk is not None,
+            "inflight": len(self._inflight),
+            "tools": tools,
+        }
@@ -0,0 +1,218 @@
+"""Latency-aware routing of a tool's calls across an ordered pool of models.
+
+Each model has a circuit breaker driven by an exponentially weighted error
+rate and consecutive failures; each (tool, model) pair has an exponentially
+weighted latency. Calls go to the healthy model with the lowest latency
+(untried models first, in pool order, so every model gets measured), with a
+small share sent to another healthy model to keep its latency current. If
+the chosen model fails with an upstream error, the next candidate is tried
+at once: the scheduler only retries on the last candidate.
+An open breaker lets one live request through as a probe after a cool-down;
+success closes it again. A call cut off by its deadline does not count
+against the model's health, but the time it took counts as latency.
+"""
+
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, TypeVar
+
+from . import deadlines
+from .scheduler import OVERLOAD_STATUSES, RETRYABLE_STATUSES, fallback_available, is_connection_error, status_code
+
+T = TypeVar("T")
+
+# Models that served upstream calls in the current tool call, when a caller is collecting them
+routed_models: ContextVar[list[str] | None] = ContextVar("routed_models", default=None)
+
+
+def is_model_failure(error: Exception) -> bool:
+    """Return True for errors that say the model endpoint is unhealthy rather than the request invalid."""
+    status = status_code(error)
+    if status is None:
+        return is_connection_error(error)
+    # 404: the model is not (or no longer) served
+    return status == 404 or status in OVERLOAD_STATUSES or status in RETRYABLE_STATUSES or status >= 500
+
+
+class ModelHealth:
+    """Circuit breaker state and error rate of one model."""
+
+    def __init__(self):
+        self.state = "closed"
+        self.error_rate = 0.0
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.probing = False
+
+
+class Router:
+    """Chooses a model from a pool per call and falls back along the pool on upstream failures.
+
+    ``observer(tool, model, choice)`` is called for every call a model serves,
+    where ``choice`` is "best", "explore", "probe" or "fallback".
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        failure_threshold: int = 5,
+        error_rate_threshold: float = 0.5,
+        min_samples: int = 10,
+        open_seconds: float = 30.0,
+        explore_ratio: float = 0.05,
+        observer: Callable[[str, str, str], None] | None = None,
+    ):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.open_seconds = open_seconds
+        self.explore_ratio = explore_ratio
+        self.observer = observer
+        self._health: dict[str, ModelHealth] = {}
+        self._latency: dict[tuple[str, str], float] = {}
+        self._choices: dict[tuple[str, str], dict[str, int]] = {}
+
+    def health(self, model: str) -> ModelHealth:
+        return self._health.setdefault(model, ModelHealth())
+
+    def _probe_due(self, health: ModelHealth) -> bool:
+        return not health.probing and time.monotonic() - health.opened_at >= self.open_seconds
+
+    def order(self, tool: str, pool: list[str]) -> list[tuple[str, str]]:
+        """Return (model, choice) pairs for ``pool`` in the order they should be tried."""
+        healthy, probes, unavailable = [], [], []
+        for model in pool:
+            health = self.health(model)
+            if health.state == "closed":
+                healthy.append(model)
+            elif self._probe_due(health):
+                probes.append(model)
+            else:
+                unavailable.append(model)
+        # Unmeasured models sort first (optimistic start); ties keep the pool order
+        healthy.sort(key=lambda model: self._latency.get((tool, model), 0.0))
+        if len(healthy) > 1 and random.random() < self.explore_ratio:
+            healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+            first = "explore"
+        else:
+            first = "best"
+        ordered = [(model, "probe") for model in probes]
+        ordered += [(model, first if i == 0 else "fallback") for i, model in enumerate(healthy)]
+        # When every breaker is open, still try the models, longest-open first
+        unavailable.sort(key=lambda model: self.health(model).opened_at)
+        ordered += [(model, "fallback") for model in unavailable]
+        if ordered and ordered[0][1] == "fallback":
+            ordered[0] = (ordered[0][0], "best")
+        return ordered
+
+    def choose(self, tool: str, pool: list[str]) -> tuple[str, str]:
+        """Return the model (and choice) for a call that cannot fall back, e.g. a stream."""
+        model, choice = self.order(tool, pool)[0]
+        health = self.health(model)
+        if health.state == "open":
+            health.probing = True
+        return model, choice
+
+    def record(self, tool: str, model: str, choice: str, duration: float | None, error: Exception | None = None) -> None:
+        """Update latency, error rate and breaker state after a call to ``model``."""
+        health = self.health(model)
+        health.probing = False
+        if error is not None and not is_model_failure(error):
+            # The request itself was rejected; this says nothing about the model's health
+            return
+        failed = error is not None
+        health.samples += 1
+        health.error_rate += self.alpha * (float(failed) - health.error_rate)
+        if failed:
+            health.consecutive_failures += 1
+            tripped = health.consecutive_failures >= self.failure_threshold or (
+                health.samples >= self.min_samples and health.error_rate >= self.error_rate_threshold
+            )
+            if health.state == "open" or tripped:
+                if health.state != "open":
+                    health.opens += 1
+                health.state = "open"
+                health.opened_at = time.monotonic()
+            return
+        health.consecutive_failures = 0
+        if health.state == "open":
+            health.state = "closed"
+            # Start the recovered model below the threshold so one failure does not reopen it
+            health.error_rate = min(health.error_rate, self.error_rate_threshold / 2)
+        self._observe_latency(tool, model, duration)
+        counts = self._choices.setdefault((tool, model), {})
+        counts[choice] = counts.get(choice, 0) + 1
+        models = routed_models.get()
+        if models is not None:
+            models.append(model)
+        if self.observer is not None:
+            self.observer(tool, model, choice)
+
+    def _observe_latency(self, tool: str, model: str, duration: float) -> None:
+        key = (tool, model)
+        previous = self._latency.get(key)
+        self._latency[key] = duration if previous is None else previous + self.alpha * (duration - previous)
+
+    async def run(self, tool: str, pool: list[str], call: Callable[[str], Awaitable[T]]) -> T:
+        """Run ``call(model)`` on the best model in ``pool``, falling back to the others on upstream failures."""
+        error: Exception | None = None
+        candidates = self.order(tool, pool)
+        for position, (model, choice) in enumerate(candidates, 1):
+            if error is not None:
+                choice = "fallback"
+            health = self.health(model)
+            if health.state == "open":
+                health.probing = True
+            started = time.monotonic()
+            token = fallback_available.set(position < len(candidates))
+            try:
+                result = await call(model)
+            except asyncio.CancelledError:
+                health.probing = False
+                if deadlines.expired():
+                    # A model that ran out the deadline is at least this slow
+                    self._observe_latency(tool, model, time.monotonic() - started)
+                raise
+            except Exception as e:
+                if isinstance(e, deadlines.DeadlineExceeded):
+                    self._observe_latency(tool, model, time.monotonic() - started)
+                self.record(tool, model, choice, None, error=e)
+                if not is_model_failure(e):
+                    raise
+                error = e
+                continue
+            finally:
+                fallback_available.reset(token)
+            self.record(tool, model, choice, time.monotonic() - started)
+            return result
+        raise error
+
+    def stats(self) -> dict:
+        """Per-model breaker state and error rate, and per-tool latency and choice counts."""
+        models = {
+            model: {
+                "state": "half_open" if health.state == "open" and self._probe_due(health) else health.state,
+                "error_rate": round(health.error_rate, 4),
+                "consecutive_failures": health.consecutive_failures,
+                "breaker_opens": health.opens,
+            }
+            for model, health in self._health.items()
+        }
+        tools: dict[str, dict] = {}
+        for (tool, model), latency in self._latency.items():
+            tools.setdefault(tool, {})[model] = {
+                "ewma_latency_seconds": round(latency, 4),
+                "calls": self._choices.get((tool, model), {}),
+            }
+        return {
+            "alpha": self.alpha,
+            "open_seconds": self.open_seconds,
+            "explore_ratio": self.explore_ratio,
+            "models": models,
+            "tools": tools,
+        }
@@ -0,0 +1,306 @@
+"""Per-model request scheduling: token buckets, AIMD concurrency and priority queues."""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+
+from . import deadlines
+
+T = TypeVar("T")
+
+PRIORITIES = {"interactive": 0, "default": 1, "bulk": 2}
+
+# Status codes that indicate the upstream is overloaded and we should back off.
+OVERLOAD_STATUSES = (429, 503)
+# Additional transient failures that are retried without shrinking the concurrency limit.
+RETRYABLE_STATUSES = (408, 409, 500, 502, 504)
+
+# True while the router has another model to fall back to: overloads and transient errors
+# then go straight back to it instead of being retried on (or waiting for) the failing model
+fallback_available: ContextVar[bool] = ContextVar("fallback_available", default=False)
+
+
+class ModelPaused(Exception):
+    """The model is paused after an overload and the router has another model to try."""
+
+    # Counts as an overload for the router, like the 429/503 that paused the model
+    status_code = 503
+
+    def __init__(self, model: str, seconds: float):
+        super().__init__(f"{model} is paused for {seconds:.2f}s after an overload")
+
+
+def status_code(error: Exception) -> int | None:
+    """Return the HTTP status of an upstream error, if it has one."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def retry_after(error: Exception) -> float | None:
+    """Return the delay requested by a ``Retry-After``/``retry-after-ms`` header, in seconds."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_connection_error(error: Exception) -> bool:
+    """Return True for connection and timeout failures (OpenAI SDK or httpx)."""
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return bool(names & {"APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException"})
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``per_minute / 60`` tokens per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class ModelLimiter:
+    """Admission control for one model.
+
+    Requests wait in a priority queue and are admitted while the number in
+    flight is below an adaptive (AIMD) concurrency limit and both token buckets
+    have capacity. Overload responses halve the limit and pause admissions for
+    the ``Retry-After`` period; successes grow it by ``1/limit``.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        initial_concurrency: int = 16,
+        max_concurrency: int = 64,
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.paused_until = 0.0
+        self.overloads = 0
+        self.completed = 0
+        self._waiters: list[tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        while self._waiters and self.active < max(1, int(self.limit)):
+            priority, sequence, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = self.paused_until - time.monotonic()
+            if self.requests is not None:
+                delay = max(delay, self.requests.wait_time(1))
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.wait_time(tokens))
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None:
+                self.tokens.consume(tokens)
+            self.active += 1
+            future.set_result(None)
+
+    def _wake(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "default", tokens: float = 1):
+        """Wait for admission, then hold one concurrency slot for the duration of the block."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES[priority], next(self._sequence), tokens, future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def on_success(self) -> None:
+        self.completed += 1
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def on_overload(self, delay: float | None) -> None:
+        self.overloads += 1
+        now = time.monotonic()
+        # Responses to requests already in flight during a pause count as one overload event
+        if now >= self.paused_until:
+            self.limit = max(1.0, self.limit / 2)
+        self.paused_until = max(self.paused_until, now + (delay if delay is not None else 1.0))
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "active": self.active,
+            "queued": sum(1 for *_, future in self._waiters if not future.done()),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+            "completed": self.completed,
+            "overloads": self.overloads,
+        }
+
+
+class Scheduler:
+    """Routes upstream calls through a :class:`ModelLimiter` per model and retries overloads."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        initial_concurrency: int = 16,
+        max_concurrency: int = 64,
+        max_retries: int = 3,
+        model_limits: dict[str, dict] | None = None,
+        retry_budget: float = 0,
+        observer: Callable[..., None] | None = None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.model_limits = model_limits or {}
+        self.retry_budget = retry_budget
+        # Called as observer(model, queue_wait, duration, response=..., error=...) after each attempt
+        self.observer = observer
+        self._limiters: dict[str, ModelLimiter] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        if model not in self._limiters:
+            overrides = self.model_limits.get(model, {})
+            self._limiters[model] = ModelLimiter(
+                requests_per_minute=overrides.get("rpm", self.requests_per_minute),
+                tokens_per_minute=overrides.get("tpm", self.tokens_per_minute),
+                initial_concurrency=overrides.get("concurrency", self.initial_concurrency),
+                max_concurrency=overrides.get("max_concurrency", self.max_concurrency),
+            )
+        return self._limiters[model]
+
+    async def run(
+        self,
+        model: str,
+        call: Callable[[], Awaitable[T]],
+        priority: str = "default",
+        tokens: float = 1,
+        budget: float | None = None,
+    ) -> T:
+        """Run ``call`` once admitted for ``model``, retrying overloads and transient errors.
+
+        Retries back off exponentially with full jitter. No retry is started that
+        could not begin within ``budget`` seconds of the first attempt (defaults
+        to ``retry_budget``; 0 means no limit), or after the call's deadline. An
+        error after the deadline has passed is raised as DeadlineExceeded.
+        While ``fallback_available`` is set, nothing is retried, and a model
+        paused after an overload raises ModelPaused instead of waiting.
+        """
+        limiter = self.limiter(model)
+        budget = self.retry_budget if budget is None else budget
+        deadline = time.monotonic() + budget if budget else None
+        call_deadline = deadlines.current()
+        if call_deadline is not None:
+            deadline = call_deadline if deadline is None else min(deadline, call_deadline)
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            if fallback_available.get() and limiter.paused_until > queued:
+                raise ModelPaused(model, limiter.paused_until - queued)
+            async with limiter.slot(priority, tokens):
+                started = time.monotonic()
+                try:
+                    result = await call()
+                except asyncio.CancelledError as e:
+                    if self.observer is not None:
+                        self.observer(model, started - queued, time.monotonic() - started, error=e)
+                    raise
+                except Exception as e:
+                    if deadlines.expired():
+                        # Out of time: the model is not to blame, and a retry could not finish
+                        exceeded = deadlines.DeadlineExceeded(f"Deadline passed during the call to {model}")
+                        if self.observer is not None:
+                            self.observer(model, started - queued, time.monotonic() - started, error=exceeded)
+                        raise exceeded from e
+                    if self.observer is not None:
+                        self.observer(model, started - queued, time.monotonic() - started, error=e)
+                    status = status_code(e)
+                    overloaded = status in OVERLOAD_STATUSES
+                    if overloaded:
+                        limiter.on_overload(retry_after(e))
+                    transient = status in RETRYABLE_STATUSES or is_connection_error(e)
+                    if attempt >= self.max_retries or not (overloaded or transient) or fallback_available.get():
+                        raise
+                    # Overloads wait in the queue until the pause ends; other errors back off here
+                    delay = 0.0 if overloaded else random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+                    if deadline is not None:
+                        wait = max(delay, limiter.paused_until - time.monotonic())
+                        if time.monotonic() + wait >= deadline:
+                            raise
+                else:
+                    limiter.on_success()
+                    if self.observer is not None:
+                        self.observer(model, started - queued, time.monotonic() - started, response=result)
+                    return result
+            attempt += 1
+            if delay:
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {model: limiter.stats() for model, limiter in self._limiters.items()}
@@ -1,10 +1,34 @@
 import asyncio
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 import httpx
 import os
+import time
 from dotenv import load_dotenv
 import json
-from openai import AsyncOpenAI
+from functools import partial, wraps
+from typing import TYPE_CHECKING
+
+# Heavy dependencies (openai, numpy, Pillow) are imported on first use so that
+# initialize and tools/list are answered without loading them.
+from .audio import file_url_path, open_audio
+from .transcription import transcribe_segmented
+from .batching import EmbeddingCoalescer, estimate_tokens, run_batch
+from .response_cache import ResponseCache, cache_key
+from .hedging import Hedger
+from .image_store import MIME_TYPES as IMAGE_MIME_TYPES
+from .metrics import Metrics, current_tool, error_class
+from .routing import Router, routed_models
+from .scheduler import OVERLOAD_STATUSES, Scheduler, retry_after, status_code
+from . import deadlines, structured
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+    from .embedding_cache import EmbeddingCache
+    from .image_store import ImageStore
+    from .images import ImagePreparer
+    from .jobs import JobManager
+    from .vector_index import VectorIndex
 
 load_dotenv()
 
@@ -13,13 +37,105 @@ DEEPINFRA_API_KEY = os.getenv("DEEPINFRA_API_KEY")
 if not DEEPINFRA_API_KEY:
     raise ValueError("DEEPINFRA_API_KEY not set")
 
-app = FastMCP("deepinfra-ai-tools")
+# OpenAI-compatible endpoint; point at a local stand-in for offline benchmarks
+DEEPINFRA_BASE_URL = os.getenv("DEEPINFRA_BASE_URL", "https://api.deepinfra.com/v1/openai")
+
+# Transport: "stdio" (default), or "streamable-http"/"sse" to serve many clients over HTTP
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8000"))
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+# Sessions live in one process, so several workers require stateless streamable HTTP
+MCP_STATELESS_HTTP = os.getenv("MCP_STATELESS_HTTP", str(MCP_WORKERS > 1)).lower() in ("1", "true", "yes")
+MCP_GRACEFUL_TIMEOUT = int(os.getenv("MCP_GRACEFUL_TIMEOUT", "30"))
+# Local files (file:// audio, embed_file paths) are served only under this directory when it is set;
+# over the HTTP transports, where clients are remote, they are refused unless it is set
+LOCAL_FILES_ROOT = os.getenv("LOCAL_FILES_ROOT", "")
+
+app = FastMCP("deepinfra-ai-tools", host=MCP_HOST, port=MCP_PORT, stateless_http=MCP_STATELESS_HTTP)
+
+_client: "AsyncOpenAI | None" = None
+
+
+def get_client() -> "AsyncOpenAI":
+    """Return the OpenAI client for DeepInfra, creating it on first use."""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        # Initialize OpenAI client with DeepInfra base URL; retries are handled by the scheduler.
+        # The connection limits are the SDK's own; the hook caps each request at the call's deadline.
+        _client = AsyncOpenAI(
+            api_key=DEEPINFRA_API_KEY,
+            base_url=DEEPINFRA_BASE_URL,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100),
+                event_hooks={"request": [deadlines.clamp_timeout]},
+            ),
+        )
+    return _client
+
+
+# Shared connection pool for downloads (keep-alive, HTTP/2 when h2 is installed)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(100 * 1024 * 1024)))
+TRANSCRIPTION_MAX_WORKERS = int(os.getenv("TRANSCRIPTION_MAX_WORKERS", "4"))
+
+# Vision tools: fetch, downscale and cache images locally (requires Pillow)
+IMAGE_PREFETCH = os.getenv("IMAGE_PREFETCH", "true").lower() in ("1", "true", "yes")
+IMAGE_MAX_LONG_SIDE = int(os.getenv("IMAGE_MAX_LONG_SIDE", "2048"))
+IMAGE_MAX_SHORT_SIDE = int(os.getenv("IMAGE_MAX_SHORT_SIDE", "768"))
+IMAGE_CACHE_ENTRIES = int(os.getenv("IMAGE_CACHE_ENTRIES", "256"))
+# Whether image URLs on loopback, private or link-local addresses are fetched; over the HTTP
+# transports a remote client could otherwise make the server read internal addresses
+IMAGE_FETCH_PRIVATE = os.getenv("IMAGE_FETCH_PRIVATE", str(MCP_TRANSPORT == "stdio")).lower() in ("1", "true", "yes")
+
+_image_preparer: "ImagePreparer | None" = None
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None:
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        _http_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            http2=http2,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0),
+            event_hooks={"request": [deadlines.clamp_timeout]},
+        )
+    return _http_client
+
+
+def get_image_preparer() -> "ImagePreparer":
+    """Return the shared image preparer, creating it on first use."""
+    global _image_preparer
+    if _image_preparer is None:
+        from .images import ImagePreparer
+
+        _image_preparer = ImagePreparer(
+            max_long_side=IMAGE_MAX_LONG_SIDE,
+            max_short_side=IMAGE_MAX_SHORT_SIDE,
+            max_entries=IMAGE_CACHE_ENTRIES,
+            allow_private=IMAGE_FETCH_PRIVATE,
+        )
+    return _image_preparer
+
+
+async def _prepare_image(image_url: str) -> str:
+    """Return the image reference to send to the provider (a compact data URI when pre-fetching)."""
+    if not IMAGE_PREFETCH:
+        return image_url
+    return await get_image_preparer().prepare(image_url, get_http_client())
 
-# Initialize OpenAI client with DeepInfra base URL
-client = AsyncOpenAI(
-    api_key=DEEPINFRA_API_KEY,
-    base_url="https://api.deepinfra.com/v1/openai"
-)
 
 # Configuration
 ENABLED_TOOLS_STR = os.getenv("ENABLED_TOOLS", "all")
@@ -28,7 +144,8 @@ if ENABLED_TOOLS_STR == "all":
 else:
     ENABLED_TOOLS = [tool.strip() for tool in ENABLED_TOOLS_STR.split(",")]
 
-DEFAULT_MODELS = {
+# Each MODEL_* variable may list several comma-separated models; calls are routed among them
+MODEL_POOLS = {
     "generate_image": os.getenv("MODEL_GENERATE_IMAGE", "Bria/Bria-3.2"),
     "text_generation": os.getenv("MODEL_TEXT_GENERATION", "meta-llama/Llama-2-7b-chat-hf"),
     "embeddings": os.getenv("MODEL_EMBEDDINGS", "sentence-transformers/all-MiniLM-L6-v2"),
@@ -39,42 +156,881 @@ DEFAULT_MODELS = {
     "text_classification": os.getenv("MODEL_TEXT_CLASSIFICATION", "microsoft/DialoGPT-medium"),
     "token_classification": os.getenv("MODEL_TOKEN_CLASSIFICATION", "microsoft/DialoGPT-medium"),
     "fill_mask": os.getenv("MODEL_FILL_MASK", "microsoft/DialoGPT-medium"),
+    "analyze_image": os.getenv("MODEL_ANALYZE_IMAGE", "openai/gpt-4o-mini"),
+}
+MODEL_POOLS = {tool: [model.strip() for model in models.split(",") if model.strip()] for tool, models in MODEL_POOLS.items()}
+if len(MODEL_POOLS["embeddings"]) > 1:
+    # Vectors from different models are not comparable, so embeddings are never routed
+    raise ValueError("MODEL_EMBEDDINGS must name a single model")
+# The first model of each pool is the default one
+DEFAULT_MODELS = {tool: models[0] for tool, models in MODEL_POOLS.items()}
+
+# Deadline per tool call in seconds (0 = none), TIMEOUT_<TOOL> overriding TOOL_TIMEOUT.
+# A request may set its own with "_meta": {"timeout": seconds}.
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "120"))
+# Long transcriptions and image generations (often run as background jobs) have no deadline by default
+UNBOUNDED_TOOLS = ("speech_recognition", "generate_image")
+DEFAULT_TIMEOUTS = {
+    tool: float(os.getenv(f"TIMEOUT_{tool.upper()}", default))
+    for tool, default in [
+        *((tool, 0 if tool in UNBOUNDED_TOOLS else TOOL_TIMEOUT) for tool in MODEL_POOLS),
+        *((f"{tool}_batch", TOOL_TIMEOUT) for tool in ("text_generation", "text_classification", "token_classification", "fill_mask")),
+        ("index_texts", TOOL_TIMEOUT),
+        ("similarity_search", TOOL_TIMEOUT),
+        # Whole files can take hours, and the job resumes where it stopped, so no deadline by default
+        ("embed_file", 0),
+    ]
+}
+# Tools that return the items (or windows) finished by the deadline and report the rest as
+# DeadlineExceeded; the call itself is only cut off DEADLINE_GRACE seconds later
+PARTIAL_RESULT_TOOLS = {
+    "token_classification",
+    "text_generation_batch",
+    "text_classification_batch",
+    "token_classification_batch",
+    "fill_mask_batch",
 }
+DEADLINE_GRACE = float(os.getenv("DEADLINE_GRACE", "1"))
 
+# Per-model admission control for upstream calls (0 = no requests/tokens-per-minute limit)
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", "0"))
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}"))
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "16"))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "64"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_RETRY_BUDGET = float(os.getenv("UPSTREAM_RETRY_BUDGET", "30"))
 
+# Metrics are always collected; set METRICS_PORT or METRICS_TEXTFILE to export them for Prometheus
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+METRICS_TEXTFILE_INTERVAL = float(os.getenv("METRICS_TEXTFILE_INTERVAL", "15"))
 
-if "all" in ENABLED_TOOLS or "generate_image" in ENABLED_TOOLS:
-    @app.tool()
-    async def generate_image(prompt: str) -> str:
-        """Generate an image from a text prompt using DeepInfra OpenAI-compatible API."""
-        model = DEFAULT_MODELS["generate_image"]
+metrics = Metrics()
+
+scheduler = Scheduler(
+    requests_per_minute=RATE_LIMIT_RPM,
+    tokens_per_minute=RATE_LIMIT_TPM,
+    initial_concurrency=UPSTREAM_CONCURRENCY,
+    max_concurrency=UPSTREAM_MAX_CONCURRENCY,
+    max_retries=UPSTREAM_MAX_RETRIES,
+    model_limits=MODEL_RATE_LIMITS,
+    retry_budget=UPSTREAM_RETRY_BUDGET,
+    observer=metrics.observe_upstream,
+)
+
+# Optional request hedging for idempotent tools; disabled unless HEDGE_TOOLS is set
+HEDGE_TOOLS = {tool.strip() for tool in os.getenv("HEDGE_TOOLS", "").split(",") if tool.strip()}
+HEDGE_MAX_PERCENT = float(os.getenv("HEDGE_MAX_PERCENT", "5"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+hedger = Hedger(max_ratio=HEDGE_MAX_PERCENT / 100, min_samples=HEDGE_MIN_SAMPLES) if HEDGE_TOOLS else None
+
+# Latency-aware routing across each tool's model pool, with a circuit breaker per model
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+ROUTING_FAILURE_THRESHOLD = int(os.getenv("ROUTING_FAILURE_THRESHOLD", "5"))
+ROUTING_ERROR_RATE = float(os.getenv("ROUTING_ERROR_RATE", "0.5"))
+ROUTING_OPEN_SECONDS = float(os.getenv("ROUTING_OPEN_SECONDS", "30"))
+ROUTING_EXPLORE_PERCENT = float(os.getenv("ROUTING_EXPLORE_PERCENT", "5"))
+
+router = Router(
+    alpha=ROUTING_EWMA_ALPHA,
+    failure_threshold=ROUTING_FAILURE_THRESHOLD,
+    error_rate_threshold=ROUTING_ERROR_RATE,
+    open_seconds=ROUTING_OPEN_SECONDS,
+    explore_ratio=ROUTING_EXPLORE_PERCENT / 100,
+    observer=metrics.observe_route,
+)
+
+# Optional persistent embedding cache; disabled unless a path is configured
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+
+_embedding_cache: "EmbeddingCache | None" = None
+
+
+def get_embedding_cache() -> "EmbeddingCache | None":
+    """Return the embedding cache (opened on first use), or None if it is disabled."""
+    global _embedding_cache
+    if _embedding_cache is None and EMBEDDING_CACHE_PATH:
+        from .embedding_cache import EmbeddingCache
+
+        _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+    return _embedding_cache
+
+# Optional micro-batching of concurrent embeddings calls; disabled when the window is 0
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "0"))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "8192"))
+
+
+async def _create_embeddings(model: str, inputs: list[str]) -> list[list[float]]:
+    """Send a single embeddings request upstream."""
+    response = await scheduler.run(
+        model,
+        lambda: get_client().embeddings.create(model=model, input=inputs),
+        priority="bulk",
+        tokens=sum(estimate_tokens(text) for text in inputs),
+    )
+    return [item.embedding for item in response.data]
+
+
+# Bulk embedding of local files: upstream requests in flight per embed_file job
+EMBED_FILE_CONCURRENCY = int(os.getenv("EMBED_FILE_CONCURRENCY", "4"))
+
+embedding_coalescer = (
+    EmbeddingCoalescer(
+        _create_embeddings,
+        window=EMBEDDING_BATCH_WINDOW_MS / 1000,
+        max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+        max_batch_tokens=EMBEDDING_BATCH_MAX_TOKENS,
+    )
+    if EMBEDDING_BATCH_WINDOW_MS > 0
+    else None
+)
+
+
+# Windowed token classification: maximum windows classified at once per call
+TOKEN_CLASSIFICATION_MAX_WORKERS = int(os.getenv("TOKEN_CLASSIFICATION_MAX_WORKERS", "8"))
+
+# Batch tools: maximum upstream calls in flight per batch, and packing limits
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+PACK_MAX_CHARS = 400
+
+# Structured output: JSON-schema constrained chat completions for the JSON-returning tools.
+# Opt-in per tool ("all" for every supported tool); the tool's model must be a chat model.
+STRUCTURED_OUTPUT_TOOLS = {
+    tool.strip()
+    for tool in os.getenv("STRUCTURED_OUTPUT_TOOLS", "").split(",")
+    if tool.strip()
+}
+if "all" in STRUCTURED_OUTPUT_TOOLS:
+    STRUCTURED_OUTPUT_TOOLS = set(structured.TOOLS)
+STRUCTURED_OUTPUT_FORMAT = os.getenv("STRUCTURED_OUTPUT_FORMAT", "json_schema")
+
+# Response cache for deterministic tools; set RESPONSE_CACHE_TOOLS to "" to disable
+RESPONSE_CACHE_TOOLS = {
+    tool.strip()
+    for tool in os.getenv("RESPONSE_CACHE_TOOLS", "text_classification,token_classification,fill_mask").split(",")
+    if tool.strip()
+}
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+
+response_cache = (
+    ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_PATH or None)
+    if RESPONSE_CACHE_TOOLS
+    else None
+)
+
+
+def _check_local_path(path: str) -> None:
+    """Raise PermissionError unless clients may read or write the local ``path``."""
+    if not LOCAL_FILES_ROOT:
+        if MCP_TRANSPORT == "stdio":
+            return
+        raise PermissionError(f"Local files are disabled over {MCP_TRANSPORT}; set LOCAL_FILES_ROOT to allow a directory")
+    root = os.path.realpath(LOCAL_FILES_ROOT)
+    # Resolve symlinks and ".." so a path cannot point outside the root
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise PermissionError(f"{path} is outside LOCAL_FILES_ROOT")
+
+
+def _pool_key(tool: str) -> str:
+    """Identify ``tool``'s model pool in cache keys (just the model name for a single-model pool)."""
+    return "|".join(MODEL_POOLS[tool])
+
+
+async def _routed(tool: str, call):
+    """Await ``call(model)`` on the best model in ``tool``'s pool, falling back along the pool on upstream failures."""
+    return await router.run(tool, MODEL_POOLS[tool], call)
+
+
+def _served_by(models: list[str]):
+    """The "model" value for a result: one name, a list when several models served it, null for the cache."""
+    distinct = list(dict.fromkeys(models))
+    return distinct[0] if len(distinct) == 1 else (distinct or None)
+
+
+def _add_models(result, models: list[str], merge: bool = False):
+    """Report the models that served a tool call in its result.
+
+    With ``merge`` (tools that return a JSON object), an object result gains a
+    "model" field. Any other result is wrapped, unparsed, as
+    {"model": ..., "result": <original string>}. Error strings are returned
+    unchanged.
+    """
+    if not isinstance(result, str) or error_class(result):
+        return result
+    if merge:
         try:
-            response = await client.images.generate(
+            value = json.loads(result)
+        except ValueError:
+            value = None
+        if isinstance(value, dict):
+            return json.dumps({**value, "model": _served_by(models)})
+    return json.dumps({"model": _served_by(models), "result": result})
+
+
+async def _reporting_models(tool: str, call, merge: bool = False):
+    """Await ``call()`` and, if ``tool`` routes across several models, report which served it."""
+    if len(MODEL_POOLS[tool]) < 2:
+        return await call()
+    models: list[str] = []
+    token = routed_models.set(models)
+    try:
+        result = await call()
+    finally:
+        routed_models.reset(token)
+    return _add_models(result, models, merge)
+
+
+def reports_models(tool: str, merge: bool = False):
+    """Decorate a tool so its result names the model(s) from ``tool``'s pool that served it.
+
+    Set ``merge`` for tools that return a JSON object, to add "model" to it
+    instead of wrapping the result.
+    """
+    def decorate(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await _reporting_models(tool, lambda: fn(*args, **kwargs), merge)
+
+        return wrapper
+
+    return decorate
+
+
+def _requested_timeout() -> float | None:
+    """Return the deadline the client set for this request in ``_meta.timeout``, if any."""
+    try:
+        meta = app.get_context().request_context.meta
+    except ValueError:
+        return None
+    value = getattr(meta, "timeout", None)
+    return float(value) if isinstance(value, (int, float)) and value > 0 else None
+
+
+def with_deadline(fn):
+    """Decorate a tool so the call, and every upstream request it makes, ends by its deadline.
+
+    The deadline is the request's ``_meta.timeout`` or the tool's default from
+    DEFAULT_TIMEOUTS. When it passes, in-flight work is cancelled and an error
+    string is returned; tools in PARTIAL_RESULT_TOOLS get DEADLINE_GRACE to
+    return what finished instead.
+    """
+    tool = fn.__name__
+    grace = DEADLINE_GRACE if tool in PARTIAL_RESULT_TOOLS else 0.0
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        seconds = _requested_timeout() or DEFAULT_TIMEOUTS[tool]
+        try:
+            with deadlines.deadline(seconds, grace):
+                return await fn(*args, **kwargs)
+        except deadlines.DeadlineExceeded as e:
+            return f"Error in {tool}: DeadlineExceeded: {str(e)}"
+
+    return wrapper
+
+
+async def _batch(tool: str, items: list, fn, empty_error: str = "No result returned") -> list[dict]:
+    """run_batch over ``items``; if ``tool`` routes across several models, each result names the model(s) that served it."""
+    if len(MODEL_POOLS[tool]) < 2:
+        return await run_batch(items, fn, BATCH_CONCURRENCY, empty_error)
+    models: dict[int, list[str]] = {}
+
+    async def call(entry):
+        index, item = entry
+        # Items run in tasks of their own, so this list collects only this item's models
+        routed_models.set(models.setdefault(index, []))
+        return await fn(item)
+
+    results = await run_batch(list(enumerate(items)), call, BATCH_CONCURRENCY, empty_error)
+    for result in results:
+        if "result" in result:
+            result["model"] = _served_by(models[result["index"]])
+    return results
+
+
+async def _hedged(tool: str, model: str, request):
+    """Await ``request()``, hedging it when hedging is enabled for ``tool``."""
+    if hedger is not None and tool in HEDGE_TOOLS:
+        return await hedger.run(tool, model, request)
+    return await request()
+
+
+async def _complete(
+    tool: str,
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    text: str,
+    priority: str = "default",
+) -> str | None:
+    """Run a text completion on ``tool``'s model pool, through the response cache when it is enabled.
+
+    ``text`` is the raw tool input the prompt was built from; it is normalized
+    to form the cache key. Returns None when the API returns no choices.
+    """
+    def request(model: str):
+        return scheduler.run(
+            model,
+            lambda: get_client().completions.create(
                 model=model,
                 prompt=prompt,
-                n=1,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            ),
+            priority=priority,
+            tokens=estimate_tokens(prompt) + max_tokens,
+        )
+
+    async def create() -> str | None:
+        response = await _routed(tool, lambda model: _hedged(tool, model, partial(request, model)))
+        return response.choices[0].text if response.choices else None
+
+    if response_cache is None or tool not in RESPONSE_CACHE_TOOLS:
+        return await create()
+    key = cache_key(tool, _pool_key(tool), text, {"max_tokens": max_tokens, "temperature": temperature})
+    return await response_cache.get_or_compute(tool, key, create)
+
+
+async def _structured(
+    tool: str,
+    content: str | list[dict],
+    text: str = "",
+    candidate_labels: list[str] | None = None,
+    priority: str = "default",
+) -> str:
+    """Run a chat completion constrained to ``tool``'s JSON schema and return the validated JSON.
+
+    ``content`` is the user message (text, or parts including an image). Text
+    inputs go through the response cache when it is enabled for ``tool``.
+    Raises ValueError if the answer does not match the schema.
+    """
+    schema = structured.schema_for(tool, candidate_labels)
+    limit = structured.max_tokens(tool, text)
+    messages = [
+        {"role": "system", "content": structured.system_prompt(tool, schema)},
+        {"role": "user", "content": content},
+    ]
+
+    def request(model: str):
+        return scheduler.run(
+            model,
+            lambda: get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=limit,
+                temperature=0,
+                response_format=structured.response_format(tool, schema, STRUCTURED_OUTPUT_FORMAT),
+            ),
+            priority=priority,
+            tokens=estimate_tokens(messages[0]["content"]) + estimate_tokens(text) + limit,
+        )
+
+    async def create() -> str:
+        response = await _routed(tool, lambda model: _hedged(tool, model, partial(request, model)))
+        answer = response.choices[0].message.content if response.choices else None
+        return json.dumps(structured.parse(answer, schema))
+
+    if response_cache is None or tool not in RESPONSE_CACHE_TOOLS or not isinstance(content, str):
+        return await create()
+    key = cache_key(tool, _pool_key(tool), text, {"structured": STRUCTURED_OUTPUT_FORMAT, "max_tokens": limit})
+    return await response_cache.get_or_compute(tool, key, create)
+
+
+def _text_classification_prompt(text: str) -> str:
+    return f"""Analyze the following text and classify it. Determine the sentiment (positive, negative, neutral) and main category/topic. Provide your analysis in JSON format with 'sentiment' and 'category' fields.
+
+Text: {text}
+
+Response format: {{"sentiment": "positive/negative/neutral", "category": "topic"}}"""
+
+
+def _token_classification_prompt(text: str) -> str:
+    return f"""Perform named entity recognition on the following text. Identify all named entities (persons, organizations, locations, dates, etc.) and classify them. Provide your analysis in JSON format with an array of entities, each having 'entity', 'type', and 'position' fields.
+
+Text: {text}
+
+Response format: {{"entities": [{{"entity": "entity_name", "type": "PERSON/ORG/LOC/DATE/etc", "position": [start, end]}}]}}"""
+
+
+def _fill_mask_prompt(text: str) -> str:
+    return f"""Fill in the [MASK] token in the following text with the most appropriate word. Provide the completed sentence and explain your choice.
+
+Text: {text}
+
+Response format: {{"filled_text": "completed sentence", "chosen_word": "word", "explanation": "reasoning"}}"""
+
+
+async def _generate_text(prompt: str, priority: str = "interactive") -> str | None:
+    response = await _routed("text_generation", lambda model: scheduler.run(
+        model,
+        lambda: get_client().completions.create(
+            model=model,
+            prompt=prompt,
+            max_tokens=256,
+            temperature=0.7,
+        ),
+        priority=priority,
+        tokens=estimate_tokens(prompt) + 256,
+    ))
+    return response.choices[0].text if response.choices else None
+
+
+async def _classify_text(text: str, priority: str = "default") -> str | None:
+    if "text_classification" in STRUCTURED_OUTPUT_TOOLS:
+        return await _structured("text_classification", f"Text: {text}", text=text, priority=priority)
+    return await _complete("text_classification", _text_classification_prompt(text), max_tokens=200, temperature=0.1, text=text, priority=priority)
+
+
+async def _classify_tokens(text: str, priority: str = "default") -> str | None:
+    if "token_classification" in STRUCTURED_OUTPUT_TOOLS:
+        return await _structured("token_classification", f"Text: {text}", text=text, priority=priority)
+    return await _complete("token_classification", _token_classification_prompt(text), max_tokens=500, temperature=0.1, text=text, priority=priority)
+
+
+async def _fill_mask(text: str, priority: str = "default") -> str | None:
+    if "fill_mask" in STRUCTURED_OUTPUT_TOOLS:
+        return await _structured("fill_mask", f"Text: {text}", text=text, priority=priority)
+    return await _complete("fill_mask", _fill_mask_prompt(text), max_tokens=200, temperature=0.1, text=text, priority=priority)
+
+
+async def _classify_texts_packed(texts: list[str]) -> list[str | None]:
+    """Classify several short texts with one prompt, one result per text.
+
+    Falls back to one call per text if the packed answer cannot be parsed.
+    """
+    if len(texts) == 1:
+        return [await _classify_text(texts[0], priority="bulk")]
+    numbered = "\n".join(f"{i}. {' '.join(text.split())}" for i, text in enumerate(texts, 1))
+    prompt = f"""Analyze each of the following numbered texts and classify it. Determine the sentiment (positive, negative, neutral) and main category/topic of each text. Provide your analysis as a JSON array with one object per text, in order, each with 'index', 'sentiment' and 'category' fields.
+
+Texts:
+{numbered}
+
+Response format: [{{"index": 1, "sentiment": "positive/negative/neutral", "category": "topic"}}]"""
+    response = await _routed("text_classification", lambda model: scheduler.run(
+        model,
+        lambda: get_client().completions.create(
+            model=model,
+            prompt=prompt,
+            max_tokens=60 * len(texts),
+            temperature=0.1,
+        ),
+        priority="bulk",
+        tokens=estimate_tokens(prompt) + 60 * len(texts),
+    ))
+    try:
+        answer = response.choices[0].text
+        items = json.loads(answer[answer.index("["):answer.rindex("]") + 1])
+        by_index = {int(item["index"]): item for item in items}
+        return [
+            json.dumps({"sentiment": by_index[i]["sentiment"], "category": by_index[i]["category"]})
+            for i in range(1, len(texts) + 1)
+        ]
+    except (IndexError, ValueError, KeyError, TypeError):
+        return list(await asyncio.gather(*(_classify_text(text, priority="bulk") for text in texts)))
+
+
+def _parse_json(text: str | None):
+    """Parse JSON from a model answer, tolerating code fences and surrounding prose.
+
+    Returns the raw text if it does not contain valid JSON.
+    """
+    if text is None:
+        return None
+    candidates = [text.strip()]
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if starts:
+        start = min(starts)
+        end = max(text.rfind("}"), text.rfind("]"))
+        candidates.append(text[start:end + 1])
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return text
+
+
+async def _ask_about_image(tool: str, prompt: str, image_ref: str, max_tokens: int) -> str | None:
+    """Send a single-image vision prompt to ``tool``'s model pool and return the answer text."""
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_ref}
+                }
+            ]
+        }
+    ]
+    response = await _routed(tool, lambda model: scheduler.run(
+        model,
+        lambda: get_client().chat.completions.create(model=model, messages=messages, max_tokens=max_tokens),
+        tokens=estimate_tokens(prompt) + max_tokens,
+    ))
+    return response.choices[0].message.content if response.choices else None
+
+
+def _image_content(image_ref: str) -> list[dict]:
+    return [{"type": "image_url", "image_url": {"url": image_ref}}]
+
+
+async def _zero_shot_classify_image(image_ref: str, candidate_labels: list[str]) -> str | None:
+    if "zero_shot_image_classification" in STRUCTURED_OUTPUT_TOOLS:
+        return await _structured("zero_shot_image_classification", _image_content(image_ref), candidate_labels=candidate_labels)
+    prompt = f"Classify this image into one of these categories: {', '.join(candidate_labels)}. Return a JSON with 'label' and 'score' fields."
+    return await _ask_about_image("zero_shot_image_classification", prompt, image_ref, max_tokens=200)
+
+
+async def _detect_objects(image_ref: str) -> str | None:
+    if "object_detection" in STRUCTURED_OUTPUT_TOOLS:
+        return await _structured("object_detection", _image_content(image_ref))
+    prompt = "Analyze this image and detect all objects present. Provide a detailed list of objects you can see, their approximate locations if possible, and confidence scores. Format as JSON."
+    return await _ask_about_image("object_detection", prompt, image_ref, max_tokens=500)
+
+
+async def _classify_image(image_ref: str) -> str | None:
+    if "image_classification" in STRUCTURED_OUTPUT_TOOLS:
+        return await _structured("image_classification", _image_content(image_ref))
+    prompt = "Analyze this image and classify what it shows. Provide the main categories and objects visible in the image with confidence scores. Format as JSON."
+    return await _ask_about_image("image_classification", prompt, image_ref, max_tokens=500)
+
+
+def _analyze_image_prompt(candidate_labels: list[str] | None) -> str:
+    zero_shot = ""
+    zero_shot_format = ""
+    if candidate_labels:
+        zero_shot = f" Also classify the image into one of these categories: {', '.join(candidate_labels)}, with a score for each category."
+        zero_shot_format = ', "zero_shot": {"label": "best category", "scores": {"category": 0.0}}'
+    return f"""Analyze this image. Classify what it shows (main categories with confidence scores) and detect all objects present (with approximate locations and confidence scores).{zero_shot} Respond with JSON only.
+
+Response format: {{"classification": [{{"label": "category", "score": 0.0}}], "objects": [{{"label": "object", "location": "approximate location", "confidence": 0.0}}]{zero_shot_format}}}"""
+
+
+def _validate_image_analysis(answer: str | None, candidate_labels: list[str] | None) -> dict | None:
+    """Return the parsed combined analysis, or None if it does not match the requested shape."""
+    result = _parse_json(answer)
+    if not isinstance(result, dict):
+        return None
+    if not isinstance(result.get("classification"), list) or not isinstance(result.get("objects"), list):
+        return None
+    if candidate_labels:
+        zero_shot = result.get("zero_shot")
+        if not isinstance(zero_shot, dict) or zero_shot.get("label") not in candidate_labels:
+            return None
+    return result
+
+
+async def _generate_image(prompt: str) -> list:
+    """Generate one image upstream and return the response's data items."""
+    response = await _routed("generate_image", lambda model: scheduler.run(
+        model,
+        lambda: get_client().images.generate(
+            model=model,
+            prompt=prompt,
+            n=1,
+        ),
+    ))
+    return response.data
+
+
+async def _transcribe(audio_url: str, segment_seconds: float = 0, overlap_seconds: float = 2.0) -> str:
+    """Transcribe audio from a URL or file:// path; JSON with segments when segment_seconds > 0."""
+    async def transcribe_window(filename: str, data: bytes) -> tuple[str, list[dict] | None]:
+        response = await _routed("speech_recognition", lambda model: scheduler.run(
+            model,
+            lambda: get_client().audio.transcriptions.create(
+                model=model,
+                file=(filename, data, "audio/wav"),
+                response_format="verbose_json",
+            ),
+        ))
+        segments = getattr(response, "segments", None)
+        if segments is not None:
+            segments = [{"start": seg.start, "end": seg.end, "text": seg.text} for seg in segments]
+        return response.text, segments
+
+    if audio_url.startswith("file://"):
+        _check_local_path(file_url_path(audio_url))
+    # Stream the audio into a spooled temp file (or open the local file in place)
+    async with open_audio(audio_url, get_http_client(), AUDIO_MAX_BYTES) as audio_file:
+        if segment_seconds > 0:
+            filename, fileobj, _ = audio_file
+            result = await transcribe_segmented(
+                transcribe_window,
+                filename,
+                fileobj,
+                segment_seconds,
+                overlap_seconds,
+                TRANSCRIPTION_MAX_WORKERS,
             )
-            if response.data:
-                return f"Generated image URL: {response.data[0].url}"
-            else:
-                return "No image generated"
+            return json.dumps(result)
+        def upload(model: str):
+            # Rewind so a retried (or rerouted) upload sends the whole file again
+            audio_file[1].seek(0)
+            # Use the OpenAI-compatible Whisper API
+            return get_client().audio.transcriptions.create(
+                model=model,
+                file=audio_file,
+            )
+
+        response = await _routed("speech_recognition", lambda model: scheduler.run(model, partial(upload, model)))
+    return response.text
+
+
+# Local vector collections used by index_texts / similarity_search
+VECTOR_INDEX_DIR = os.getenv(
+    "VECTOR_INDEX_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "mcp-deepinfra", "collections"),
+)
+
+_vector_index: "VectorIndex | None" = None
+
+
+def get_vector_index() -> "VectorIndex":
+    """Return the local vector index, creating it on first use."""
+    global _vector_index
+    if _vector_index is None:
+        from .vector_index import VectorIndex
+
+        _vector_index = VectorIndex(VECTOR_INDEX_DIR)
+    return _vector_index
+
+
+async def _fetch_embeddings(model: str, inputs: list[str]) -> list[list[float]]:
+    """Fetch embeddings upstream, through the coalescer when enabled."""
+    if embedding_coalescer is not None:
+        return await embedding_coalescer.embed(model, inputs)
+    return await _create_embeddings(model, inputs)
+
+
+async def _embed(model: str, inputs: list[str]) -> list[list[float]]:
+    """Embed texts, serving cache hits locally and sending only misses upstream.
+
+    Vectors are returned in the order of ``inputs``.
+    """
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is None:
+        return await _fetch_embeddings(model, inputs)
+
+    from .embedding_cache import text_key
+
+    keys = [text_key(text) for text in inputs]
+    found = await embedding_cache.get_many(model, keys)
+    missing = {}
+    for key, text in zip(keys, inputs):
+        if key not in found and key not in missing:
+            missing[key] = text
+    if missing:
+        fetched = dict(zip(missing.keys(), await _fetch_embeddings(model, list(missing.values()))))
+        if found and len(next(iter(found.values()))) != len(next(iter(fetched.values()))):
+            # The model now returns vectors of another size (e.g. it was redeployed), so its cached
+            # vectors cannot be mixed with new ones: drop them and fetch the hits again
+            await embedding_cache.invalidate(model)
+            stale = {key: text for key, text in zip(keys, inputs) if key in found}
+            fetched.update(zip(stale.keys(), await _fetch_embeddings(model, list(stale.values()))))
+            found = {}
+        await embedding_cache.put_many(model, fetched)
+        found.update(fetched)
+    return [found[key] for key in keys]
+
+
+# Background jobs (background=true on generate_image and speech_recognition)
+JOB_KINDS = [kind for kind in ("generate_image", "speech_recognition") if "all" in ENABLED_TOOLS or kind in ENABLED_TOOLS]
+JOB_DB_PATH = os.getenv(
+    "JOB_DB_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "mcp-deepinfra", "jobs.sqlite3"),
+)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+IMAGE_STORE_DIR = os.getenv(
+    "IMAGE_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "mcp-deepinfra", "images"),
+)
+
+_image_store: "ImageStore | None" = None
+_job_manager: "JobManager | None" = None
+
+
+def get_image_store() -> "ImageStore":
+    """Return the local store for generated images, creating it on first use."""
+    global _image_store
+    if _image_store is None:
+        from .image_store import ImageStore
+
+        _image_store = ImageStore(IMAGE_STORE_DIR)
+    return _image_store
+
+
+async def _generate_image_job(arguments: dict) -> str:
+    """Generate an image and save it in the image store; returns JSON describing the stored image."""
+    current_tool.set("generate_image")
+
+    async def generate() -> str:
+        data = await _generate_image(arguments["prompt"])
+        if not data or not (data[0].url or data[0].b64_json):
+            raise ValueError("No image generated")
+        source = data[0].url or f"data:image/png;base64,{data[0].b64_json}"
+        image = await get_image_store().fetch(source, get_http_client())
+        return json.dumps({
+            "url": None if source.startswith("data:") else source,
+            "resource": f"images://{image['name']}",
+            **image,
+        })
+
+    with deadlines.deadline(arguments.get("timeout") or DEFAULT_TIMEOUTS["generate_image"]):
+        return await _reporting_models("generate_image", generate, merge=True)
+
+
+async def _speech_recognition_job(arguments: dict) -> str:
+    """Transcribe audio for a background job; returns what speech_recognition would."""
+    current_tool.set("speech_recognition")
+    arguments = dict(arguments)
+    with deadlines.deadline(arguments.pop("timeout", None) or DEFAULT_TIMEOUTS["speech_recognition"]):
+        merge = arguments.get("segment_seconds", 0) > 0
+        return await _reporting_models("speech_recognition", partial(_transcribe, **arguments), merge)
+
+
+def get_job_manager() -> "JobManager":
+    """Return the background job manager; its workers start on first use."""
+    global _job_manager
+    if _job_manager is None:
+        from .jobs import JobManager
+
+        os.makedirs(os.path.dirname(os.path.abspath(JOB_DB_PATH)), exist_ok=True)
+        handlers = {"generate_image": _generate_image_job, "speech_recognition": _speech_recognition_job}
+        _job_manager = JobManager(
+            JOB_DB_PATH,
+            {kind: handlers[kind] for kind in JOB_KINDS},
+            workers=JOB_WORKERS,
+            max_queued=JOB_MAX_QUEUED,
+            retention=JOB_RETENTION_HOURS * 3600,
+            observer=metrics.observe_job,
+        )
+    return _job_manager
+
+
+async def _submit_job(kind: str, arguments: dict) -> str:
+    # The submitter's _meta.timeout is kept with the job and bounds its run
+    timeout = _requested_timeout()
+    if timeout is not None:
+        arguments = {**arguments, "timeout": timeout}
+    job = await get_job_manager().submit(kind, arguments)
+    return json.dumps({"job_id": job["id"], "status": job["status"]})
+
+
+def _job_view(job: dict, include_result: bool = False) -> dict:
+    """Public fields of a job record; the result only once it has succeeded and is requested."""
+    view = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "created": job["created"],
+        "started": job["started"],
+        "finished": job["finished"],
+    }
+    if job["error"] is not None:
+        view["error"] = job["error"]
+    if include_result and job["status"] == "succeeded":
+        view["result"] = job["result"]
+    return view
+
+
+
+if "all" in ENABLED_TOOLS or "generate_image" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def generate_image(prompt: str, background: bool = False) -> str:
+        """Generate an image from a text prompt using DeepInfra OpenAI-compatible API.
+
+        background: return {"job_id", "status"} immediately instead of waiting. The job saves the
+        image in the local image store, readable as an images:// resource; collect it with
+        wait_for_job or job_result.
+        """
+        try:
+            if background:
+                return await _submit_job("generate_image", {"prompt": prompt})
+
+            async def generate() -> str:
+                data = await _generate_image(prompt)
+                if data:
+                    return f"Generated image URL: {data[0].url}"
+                else:
+                    return "No image generated"
+
+            return await _reporting_models("generate_image", generate)
         except Exception as e:
             return f"Error generating image: {type(e).__name__}: {str(e)}"
 
 if "all" in ENABLED_TOOLS or "text_generation" in ENABLED_TOOLS:
     @app.tool()
-    async def text_generation(prompt: str) -> str:
-        """Generate text completion using DeepInfra OpenAI-compatible API."""
-        model = DEFAULT_MODELS["text_generation"]
+    @metrics.instrument
+    @with_deadline
+    @reports_models("text_generation")
+    async def text_generation(prompt: str, ctx: Context, stream: bool = False) -> str:
+        """Generate text completion using DeepInfra OpenAI-compatible API.
+
+        stream: stream tokens from the API and forward each new piece of text as an MCP
+        progress notification (when the request carries a progress token). The full
+        text is still returned at the end. Cancelling the request closes the upstream stream.
+        """
+        max_tokens = 256
         try:
-            response = await client.completions.create(
-                model=model,
-                prompt=prompt,
-                max_tokens=256,
-                temperature=0.7,
-            )
-            if response.choices:
-                return response.choices[0].text
+            if stream:
+                chunks = []
+                # Streams hold a scheduler slot for their whole duration and are neither retried
+                # nor rerouted, since text may already have been forwarded
+                model, choice = router.choose("text_generation", MODEL_POOLS["text_generation"])
+                limiter = scheduler.limiter(model)
+                queued = time.monotonic()
+                async with limiter.slot("interactive", estimate_tokens(prompt) + max_tokens):
+                    started = time.monotonic()
+                    try:
+                        response = await get_client().completions.create(
+                            model=model,
+                            prompt=prompt,
+                            max_tokens=max_tokens,
+                            temperature=0.7,
+                            stream=True,
+                        )
+                        # Leaving the context manager (including on cancellation) closes the HTTP stream
+                        async with response:
+                            async for chunk in response:
+                                if chunk.choices and chunk.choices[0].text:
+                                    chunks.append(chunk.choices[0].text)
+                                    await ctx.report_progress(len(chunks), max_tokens, chunk.choices[0].text)
+                    except Exception as e:
+                        # Report overloads to the limiter as Scheduler.run does, so streams back off too
+                        if status_code(e) in OVERLOAD_STATUSES:
+                            limiter.on_overload(retry_after(e))
+                        metrics.observe_upstream(model, started - queued, time.monotonic() - started, error=e)
+                        router.record("text_generation", model, choice, None, error=e)
+                        raise
+                    except BaseException:
+                        router.health(model).probing = False
+                        raise
+                    limiter.on_success()
+                    router.record("text_generation", model, choice, time.monotonic() - started)
+                    metrics.observe_upstream(model, started - queued, time.monotonic() - started)
+                return "".join(chunks) if chunks else "No text generated"
+
+            result = await _generate_text(prompt)
+            if result is not None:
+                return result
             else:
                 return "No text generated"
         except Exception as e:
@@ -82,68 +1038,298 @@ if "all" in ENABLED_TOOLS or "text_generation" in ENABLED_TOOLS:
 
 if "all" in ENABLED_TOOLS or "embeddings" in ENABLED_TOOLS:
     @app.tool()
-    async def embeddings(inputs: list[str]) -> str:
-        """Generate embeddings for a list of texts using DeepInfra OpenAI-compatible API."""
+    @metrics.instrument
+    @with_deadline
+    async def embeddings(
+        inputs: list[str],
+        output_format: str = "list",
+        dtype: str = "float32",
+        dimensions: int | None = None,
+        normalize: bool = False,
+    ) -> str:
+        """Generate embeddings for a list of texts using DeepInfra OpenAI-compatible API.
+
+        output_format: "list" (Python list repr) or "base64" (JSON with shape, dtype and
+        little-endian packed data). dtype: "float32" or "float16" for base64 output.
+        dimensions: keep only the first N dimensions (Matryoshka truncation).
+        normalize: L2-normalize each vector after truncation.
+        """
         model = DEFAULT_MODELS["embeddings"]
         try:
-            response = await client.embeddings.create(
-                model=model,
-                input=inputs,
-            )
-            embeddings_list = [item.embedding for item in response.data]
-            return str(embeddings_list)
+            embeddings_list = await _embed(model, inputs)
+            if output_format == "list" and dimensions is None and not normalize:
+                return str(embeddings_list)
+            from . import vectors
+
+            matrix = vectors.postprocess(embeddings_list, dimensions=dimensions, normalize=normalize)
+            return vectors.encode(matrix, output_format=output_format, dtype=dtype, model=model)
         except Exception as e:
             return f"Error generating embeddings: {type(e).__name__}: {str(e)}"
 
-if "all" in ENABLED_TOOLS or "speech_recognition" in ENABLED_TOOLS:
+if EMBEDDING_CACHE_PATH and ("all" in ENABLED_TOOLS or "embeddings" in ENABLED_TOOLS):
     @app.tool()
-    async def speech_recognition(audio_url: str) -> str:
-        """Transcribe audio to text using DeepInfra OpenAI-compatible API (Whisper)."""
-        model = DEFAULT_MODELS["speech_recognition"]
-        try:
-            async with httpx.AsyncClient(timeout=120.0) as http_client:
-                # Download the audio file
-                audio_response = await http_client.get(audio_url)
-                audio_response.raise_for_status()
-                audio_content = audio_response.content
-            
-            # Use the OpenAI-compatible Whisper API
-            response = await client.audio.transcriptions.create(
-                model=model,
-                file=("audio.mp3", audio_content),
+    @metrics.instrument
+    async def embedding_cache_stats() -> str:
+        """Report embedding cache size and hit/miss counters."""
+        try:
+            return json.dumps(await get_embedding_cache().stats())
+        except Exception as e:
+            return f"Error reading embedding cache stats: {type(e).__name__}: {str(e)}"
+
+    @app.tool()
+    @metrics.instrument
+    async def embedding_cache_invalidate(model: str | None = None) -> str:
+        """Remove cached embeddings for a model, or for all models if none is given."""
+        try:
+            removed = await get_embedding_cache().invalidate(model)
+            return f"Removed {removed} cached embeddings"
+        except Exception as e:
+            return f"Error invalidating embedding cache: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "embed_file" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def embed_file(
+        input_path: str,
+        ctx: Context,
+        output_path: str | None = None,
+        input_format: str = "lines",
+        dimensions: int | None = None,
+        normalize: bool = False,
+        resume: bool = True,
+    ) -> str:
+        """Embed a local newline-delimited file into a memory-mapped .npy matrix without sending texts over MCP.
+
+        input_format is "lines" (one text per line, id = line number) or "ndjson" (objects with "text"
+        and optional "id"). Row ids are written to <output>.ids.jsonl. An interrupted job resumes from
+        the last completed batch when called again with the same arguments. Returns paths and statistics.
+        """
+        model = DEFAULT_MODELS["embeddings"]
+        try:
+            from .bulk_embeddings import embed_file as run_embed_file
+
+            path = file_url_path(input_path) if input_path.startswith("file://") else input_path
+            if output_path is None:
+                output_path = os.path.splitext(path)[0] + ".embeddings.npy"
+            _check_local_path(path)
+            # The id and progress sidecars are written next to the output
+            _check_local_path(output_path)
+
+            async def report(done: int, total: int) -> None:
+                await ctx.report_progress(done, total)
+
+            result = await run_embed_file(
+                partial(_create_embeddings, model),
+                path,
+                output_path,
+                model,
+                input_format=input_format,
+                dimensions=dimensions,
+                normalize=normalize,
+                max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+                max_batch_tokens=EMBEDDING_BATCH_MAX_TOKENS,
+                concurrency=EMBED_FILE_CONCURRENCY,
+                resume=resume,
+                on_progress=report,
             )
-            return response.text
+            return json.dumps({"model": model, **result})
+        except Exception as e:
+            return f"Error embedding file: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "index_texts" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def index_texts(collection: str, texts: list[str], ids: list[str] | None = None) -> str:
+        """Embed texts and append them to a named local vector collection.
+
+        ids: optional identifiers for the texts; defaults to their row numbers in the collection.
+        """
+        model = DEFAULT_MODELS["embeddings"]
+        try:
+            from . import vectors
+
+            if ids is not None and len(ids) != len(texts):
+                raise ValueError("ids must have the same length as texts")
+            matrix = vectors.postprocess(await _embed(model, texts), normalize=True)
+            result = await get_vector_index().add(collection, model, matrix, ids, texts)
+            return json.dumps({"collection": collection, "added": len(texts), **result})
+        except Exception as e:
+            return f"Error indexing texts: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "similarity_search" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def similarity_search(collection: str, query: str, top_k: int = 5) -> str:
+        """Find the texts in a local vector collection most similar to a query (cosine similarity)."""
+        model = DEFAULT_MODELS["embeddings"]
+        try:
+            from . import vectors
+
+            matrix = vectors.postprocess(await _embed(model, [query]), normalize=True)
+            results = await get_vector_index().search(collection, matrix, top_k)
+            return json.dumps({"collection": collection, "results": results[0]})
+        except Exception as e:
+            return f"Error searching collection: {type(e).__name__}: {str(e)}"
+
+if response_cache is not None:
+    @app.tool()
+    @metrics.instrument
+    async def response_cache_stats() -> str:
+        """Report response cache size, per-tool hits, misses, shared in-flight calls and hit rates."""
+        try:
+            return json.dumps({"enabled_tools": sorted(RESPONSE_CACHE_TOOLS), **response_cache.stats()})
+        except Exception as e:
+            return f"Error reading response cache stats: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "scheduler_stats" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    async def scheduler_stats() -> str:
+        """Report per-model concurrency limits, queue depth, completed requests and overloads (429/503)."""
+        try:
+            return json.dumps(scheduler.stats())
+        except Exception as e:
+            return f"Error reading scheduler stats: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "routing_stats" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    async def routing_stats() -> str:
+        """Report each tool's model pool, per-model circuit breaker state and error rate, and per-tool EWMA latency and routing choices."""
+        try:
+            pools = {tool: models for tool, models in MODEL_POOLS.items() if tool != "embeddings"}
+            return json.dumps({"pools": pools, **router.stats()})
+        except Exception as e:
+            return f"Error reading routing stats: {type(e).__name__}: {str(e)}"
+
+if hedger is not None:
+    @app.tool()
+    @metrics.instrument
+    async def hedging_stats() -> str:
+        """Report per-tool hedged requests, hedge rate, how often the hedge won and rolling p95 latency."""
+        try:
+            return json.dumps({"enabled_tools": sorted(HEDGE_TOOLS), **hedger.stats()})
+        except Exception as e:
+            return f"Error reading hedging stats: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "speech_recognition" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def speech_recognition(
+        audio_url: str,
+        segment_seconds: float = 0,
+        overlap_seconds: float = 2.0,
+        background: bool = False,
+    ) -> str:
+        """Transcribe audio to text using DeepInfra OpenAI-compatible API (Whisper).
+
+        audio_url: http(s) URL or local file:// path. The audio format is detected from its content.
+        segment_seconds: if > 0, split the audio into windows of this length (overlapping by
+        overlap_seconds), transcribe them concurrently and return JSON with the stitched text
+        and timestamped segments. Non-WAV input requires ffmpeg for segmentation.
+        background: return {"job_id", "status"} immediately and transcribe in a background job;
+        collect the transcript with wait_for_job or job_result.
+        """
+        try:
+            if background:
+                return await _submit_job("speech_recognition", {
+                    "audio_url": audio_url,
+                    "segment_seconds": segment_seconds,
+                    "overlap_seconds": overlap_seconds,
+                })
+            transcribe = partial(_transcribe, audio_url, segment_seconds, overlap_seconds)
+            return await _reporting_models("speech_recognition", transcribe, merge=segment_seconds > 0)
         except Exception as e:
             return f"Error transcribing audio: {type(e).__name__}: {str(e)}"
 
+if JOB_KINDS:
+    @app.tool()
+    @metrics.instrument
+    async def job_status(job_id: str) -> str:
+        """Return the status and timestamps of a background job."""
+        try:
+            return json.dumps(_job_view(await get_job_manager().get(job_id)))
+        except Exception as e:
+            return f"Error reading job status: {type(e).__name__}: {str(e)}"
+
+    @app.tool()
+    @metrics.instrument
+    async def wait_for_job(job_id: str, timeout: float = 30) -> str:
+        """Wait up to timeout seconds for a background job to finish.
+
+        Returns the job status; once it has succeeded, "result" holds what the tool would have returned
+        (for generate_image, JSON with the stored image's images:// resource URI, MIME type and size).
+        """
+        try:
+            return json.dumps(_job_view(await get_job_manager().wait(job_id, timeout), include_result=True))
+        except Exception as e:
+            return f"Error waiting for job: {type(e).__name__}: {str(e)}"
+
+    @app.tool()
+    @metrics.instrument
+    async def job_result(job_id: str) -> str:
+        """Return the result of a finished background job, exactly as the tool would have returned it."""
+        try:
+            job = await get_job_manager().get(job_id)
+            if job["status"] == "succeeded":
+                return job["result"]
+            if job["status"] == "failed":
+                return f"Error running job: {job['error']}"
+            return json.dumps(_job_view(job))
+        except Exception as e:
+            return f"Error reading job result: {type(e).__name__}: {str(e)}"
+
+    @app.tool()
+    @metrics.instrument
+    async def cancel_job(job_id: str) -> str:
+        """Cancel a queued or running background job."""
+        try:
+            return json.dumps(_job_view(await get_job_manager().cancel(job_id)))
+        except Exception as e:
+            return f"Error cancelling job: {type(e).__name__}: {str(e)}"
+
+    @app.tool()
+    @metrics.instrument
+    async def list_jobs(status: str | None = None, limit: int = 20) -> str:
+        """List the most recent background jobs (optionally only one status) with job counts per status."""
+        try:
+            manager = get_job_manager()
+            jobs = await manager.list(status, limit)
+            return json.dumps({**await manager.stats(), "recent": [_job_view(job) for job in jobs]})
+        except Exception as e:
+            return f"Error listing jobs: {type(e).__name__}: {str(e)}"
+
+if "generate_image" in JOB_KINDS:
+    def _image_resource(extension: str):
+        def read_image(digest: str) -> bytes:
+            return get_image_store().get(f"{digest}.{extension}")
+
+        return read_image
+
+    # One template per format, since a template has a single MIME type
+    for _extension, _mime_type in IMAGE_MIME_TYPES.items():
+        app.resource(
+            f"images://{{digest}}.{_extension}",
+            name=f"generated_image_{_extension}",
+            description="Image generated by a background generate_image job, from the local store",
+            mime_type=_mime_type,
+        )(_image_resource(_extension))
+
 if "all" in ENABLED_TOOLS or "zero_shot_image_classification" in ENABLED_TOOLS:
     @app.tool()
+    @metrics.instrument
+    @with_deadline
+    @reports_models("zero_shot_image_classification", merge=True)
     async def zero_shot_image_classification(image_url: str, candidate_labels: list[str]) -> str:
         """Classify an image with zero-shot labels using DeepInfra OpenAI-compatible API (CLIP)."""
-        model = DEFAULT_MODELS["zero_shot_image_classification"]
         try:
-            # Use chat/completions with vision capability to get classification
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"Classify this image into one of these categories: {', '.join(candidate_labels)}. Return a JSON with 'label' and 'score' fields."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": image_url}
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=200,
-            )
-            if response.choices:
-                return response.choices[0].message.content
+            result = await _zero_shot_classify_image(await _prepare_image(image_url), candidate_labels)
+            if result is not None:
+                return result
             else:
                 return "Unable to classify image"
         except Exception as e:
@@ -151,31 +1337,15 @@ if "all" in ENABLED_TOOLS or "zero_shot_image_classification" in ENABLED_TOOLS:
 
 if "all" in ENABLED_TOOLS or "object_detection" in ENABLED_TOOLS:
     @app.tool()
+    @metrics.instrument
+    @with_deadline
+    @reports_models("object_detection", merge=True)
     async def object_detection(image_url: str) -> str:
         """Detect objects in an image using DeepInfra OpenAI-compatible API with multimodal model."""
-        model = DEFAULT_MODELS["object_detection"]
         try:
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Analyze this image and detect all objects present. Provide a detailed list of objects you can see, their approximate locations if possible, and confidence scores. Format as JSON."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": image_url}
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=500,
-            )
-            if response.choices:
-                return response.choices[0].message.content
+            result = await _detect_objects(await _prepare_image(image_url))
+            if result is not None:
+                return result
             else:
                 return "No objects detected"
         except Exception as e:
@@ -183,55 +1353,67 @@ if "all" in ENABLED_TOOLS or "object_detection" in ENABLED_TOOLS:
 
 if "all" in ENABLED_TOOLS or "image_classification" in ENABLED_TOOLS:
     @app.tool()
+    @metrics.instrument
+    @with_deadline
+    @reports_models("image_classification", merge=True)
     async def image_classification(image_url: str) -> str:
         """Classify an image using DeepInfra OpenAI-compatible API with multimodal model."""
-        model = DEFAULT_MODELS["image_classification"]
         try:
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Analyze this image and classify what it shows. Provide the main categories and objects visible in the image with confidence scores. Format as JSON."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": image_url}
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=500,
-            )
-            if response.choices:
-                return response.choices[0].message.content
+            result = await _classify_image(await _prepare_image(image_url))
+            if result is not None:
+                return result
             else:
                 return "Unable to classify image"
         except Exception as e:
             return f"Error classifying image: {type(e).__name__}: {str(e)}"
 
+if "all" in ENABLED_TOOLS or "analyze_image" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    @reports_models("analyze_image", merge=True)
+    async def analyze_image(image_url: str, candidate_labels: list[str] | None = None) -> str:
+        """Run image classification, object detection and (optionally) zero-shot classification in one request.
+
+        Returns merged JSON with 'classification', 'objects' and, when candidate_labels are
+        given, 'zero_shot'. Falls back to parallel per-task calls if the combined answer is invalid.
+        """
+        try:
+            image_ref = await _prepare_image(image_url)
+            if "analyze_image" in STRUCTURED_OUTPUT_TOOLS:
+                try:
+                    answer = await _structured("analyze_image", _image_content(image_ref), candidate_labels=candidate_labels)
+                except ValueError:
+                    answer = None
+            else:
+                answer = await _ask_about_image("analyze_image", _analyze_image_prompt(candidate_labels), image_ref, max_tokens=700)
+            result = _validate_image_analysis(answer, candidate_labels)
+            if result is None:
+                tasks = [_classify_image(image_ref), _detect_objects(image_ref)]
+                if candidate_labels:
+                    tasks.append(_zero_shot_classify_image(image_ref, candidate_labels))
+                answers = await asyncio.gather(*tasks)
+                result = {"classification": _parse_json(answers[0]), "objects": _parse_json(answers[1])}
+                if candidate_labels:
+                    result["zero_shot"] = _parse_json(answers[2])
+                result["fallback"] = True
+            else:
+                result["fallback"] = False
+            return json.dumps(result)
+        except Exception as e:
+            return f"Error analyzing image: {type(e).__name__}: {str(e)}"
+
 if "all" in ENABLED_TOOLS or "text_classification" in ENABLED_TOOLS:
     @app.tool()
+    @metrics.instrument
+    @with_deadline
+    @reports_models("text_classification", merge=True)
     async def text_classification(text: str) -> str:
         """Classify text using DeepInfra OpenAI-compatible API."""
-        model = DEFAULT_MODELS["text_classification"]
-        prompt = f"""Analyze the following text and classify it. Determine the sentiment (positive, negative, neutral) and main category/topic. Provide your analysis in JSON format with 'sentiment' and 'category' fields.
-
-Text: {text}
-
-Response format: {{"sentiment": "positive/negative/neutral", "category": "topic"}}"""
         try:
-            response = await client.completions.create(
-                model=model,
-                prompt=prompt,
-                max_tokens=200,
-                temperature=0.1,
-            )
-            if response.choices:
-                return response.choices[0].text
+            result = await _classify_text(text)
+            if result is not None:
+                return result
             else:
                 return "Unable to classify text"
         except Exception as e:
@@ -239,23 +1421,38 @@ Response format: {{"sentiment": "positive/negative/neutral", "category": "topic"
 
 if "all" in ENABLED_TOOLS or "token_classification" in ENABLED_TOOLS:
     @app.tool()
-    async def token_classification(text: str) -> str:
-        """Perform token classification (NER) using DeepInfra OpenAI-compatible API."""
-        model = DEFAULT_MODELS["token_classification"]
-        prompt = f"""Perform named entity recognition on the following text. Identify all named entities (persons, organizations, locations, dates, etc.) and classify them. Provide your analysis in JSON format with an array of entities, each having 'entity', 'type', and 'position' fields.
+    @metrics.instrument
+    @with_deadline
+    @reports_models("token_classification", merge=True)
+    async def token_classification(text: str, ctx: Context, window_chars: int = 0, overlap_chars: int = 200) -> str:
+        """Perform token classification (NER) using DeepInfra OpenAI-compatible API.
 
-Text: {text}
-
-Response format: {{"entities": [{{"entity": "entity_name", "type": "PERSON/ORG/LOC/DATE/etc", "position": [start, end]}}]}}"""
+        Set window_chars (e.g. 2000) to split long text into windows overlapping by overlap_chars,
+        classified concurrently. The result is then JSON with 'entities' at global character
+        offsets, 'windows' and per-window 'errors'; each finished window's entities are sent as
+        a progress notification.
+        """
         try:
-            response = await client.completions.create(
-                model=model,
-                prompt=prompt,
-                max_tokens=500,
-                temperature=0.1,
-            )
-            if response.choices:
-                return response.choices[0].text
+            if window_chars > 0 and len(text) > window_chars:
+                from . import entity_windows
+
+                async def classify(window_text: str) -> list[dict]:
+                    parsed = _parse_json(await _classify_tokens(window_text))
+                    if not isinstance(parsed, dict) or not isinstance(parsed.get("entities"), list):
+                        raise ValueError("Answer has no entities list")
+                    return parsed["entities"]
+
+                async def report(finished: int, total: int, window, entities: list[dict]) -> None:
+                    message = json.dumps({"window": window.index, "entities": entities})
+                    await ctx.report_progress(finished, total, message)
+
+                result = await entity_windows.classify_windowed(
+                    classify, text, window_chars, overlap_chars, TOKEN_CLASSIFICATION_MAX_WORKERS, report
+                )
+                return json.dumps(result)
+            result = await _classify_tokens(text)
+            if result is not None:
+                return result
             else:
                 return "Unable to perform token classification"
         except Exception as e:
@@ -263,30 +1460,181 @@ Response format: {{"entities": [{{"entity": "entity_name", "type": "PERSON/ORG/L
 
 if "all" in ENABLED_TOOLS or "fill_mask" in ENABLED_TOOLS:
     @app.tool()
+    @metrics.instrument
+    @with_deadline
+    @reports_models("fill_mask", merge=True)
     async def fill_mask(text: str) -> str:
         """Fill masked tokens in text using DeepInfra OpenAI-compatible API."""
-        model = DEFAULT_MODELS["fill_mask"]
-        prompt = f"""Fill in the [MASK] token in the following text with the most appropriate word. Provide the completed sentence and explain your choice.
-
-Text: {text}
-
-Response format: {{"filled_text": "completed sentence", "chosen_word": "word", "explanation": "reasoning"}}"""
         try:
-            response = await client.completions.create(
-                model=model,
-                prompt=prompt,
-                max_tokens=200,
-                temperature=0.1,
-            )
-            if response.choices:
-                return response.choices[0].text
+            result = await _fill_mask(text)
+            if result is not None:
+                return result
             else:
                 return "Unable to fill mask"
         except Exception as e:
             return f"Error filling mask: {type(e).__name__}: {str(e)}"
 
+if "all" in ENABLED_TOOLS or "text_generation_batch" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def text_generation_batch(prompts: list[str]) -> str:
+        """Generate text completions for many prompts concurrently.
+
+        Returns a JSON list in input order; each item has 'index' and either 'result' or 'error'.
+        """
+        try:
+            results = await _batch("text_generation", prompts, partial(_generate_text, priority="bulk"), "No text generated")
+            return json.dumps(results)
+        except Exception as e:
+            return f"Error generating text batch: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "text_classification_batch" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def text_classification_batch(texts: list[str], pack_size: int = 1) -> str:
+        """Classify many texts concurrently.
+
+        pack_size: classify up to this many short texts (under 400 characters) in a single
+        prompt; falls back to one call per text if the packed answer cannot be parsed.
+        Returns a JSON list in input order; each item has 'index' and either 'result' or 'error'.
+        """
+        try:
+            if pack_size <= 1:
+                results = await _batch("text_classification", texts, partial(_classify_text, priority="bulk"), "Unable to classify text")
+                return json.dumps(results)
+
+            short = [i for i, text in enumerate(texts) if len(text) <= PACK_MAX_CHARS]
+            groups = [short[start:start + pack_size] for start in range(0, len(short), pack_size)]
+            groups += [[i] for i, text in enumerate(texts) if len(text) > PACK_MAX_CHARS]
+            group_results = await _batch(
+                "text_classification",
+                groups,
+                lambda group: _classify_texts_packed([texts[i] for i in group]),
+            )
+            results = [None] * len(texts)
+            for group, outcome in zip(groups, group_results):
+                for position, index in enumerate(group):
+                    if "error" in outcome:
+                        results[index] = {"index": index, "error": outcome["error"]}
+                    elif outcome["result"][position] is None:
+                        results[index] = {"index": index, "error": "Unable to classify text"}
+                    else:
+                        results[index] = {"index": index, "result": outcome["result"][position]}
+                        if "model" in outcome:
+                            results[index]["model"] = outcome["model"]
+            return json.dumps(results)
+        except Exception as e:
+            return f"Error classifying text batch: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "token_classification_batch" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def token_classification_batch(texts: list[str]) -> str:
+        """Perform token classification (NER) on many texts concurrently.
+
+        Returns a JSON list in input order; each item has 'index' and either 'result' or 'error'.
+        """
+        try:
+            results = await _batch("token_classification", texts, partial(_classify_tokens, priority="bulk"), "Unable to perform token classification")
+            return json.dumps(results)
+        except Exception as e:
+            return f"Error performing token classification batch: {type(e).__name__}: {str(e)}"
+
+if "all" in ENABLED_TOOLS or "fill_mask_batch" in ENABLED_TOOLS:
+    @app.tool()
+    @metrics.instrument
+    @with_deadline
+    async def fill_mask_batch(texts: list[str]) -> str:
+        """Fill masked tokens in many texts concurrently.
+
+        Returns a JSON list in input order; each item has 'index' and either 'result' or 'error'.
+        """
+        try:
+            results = await _batch("fill_mask", texts, partial(_fill_mask, priority="bulk"), "Unable to fill mask")
+            return json.dumps(results)
+        except Exception as e:
+            return f"Error filling mask batch: {type(e).__name__}: {str(e)}"
+
+@app.resource("metrics://summary", mime_type="application/json")
+def metrics_summary() -> str:
+    """Tool and upstream latency histograms, token usage, payload sizes and error counts."""
+    return json.dumps(metrics.summary())
+
+
+@app.resource("metrics://prometheus", mime_type="text/plain")
+def metrics_prometheus() -> str:
+    """The same metrics in the Prometheus text exposition format."""
+    return metrics.prometheus()
+
+
+async def close_clients() -> None:
+    """Close the shared upstream connection pools."""
+    global _client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _start_metrics_exporters() -> None:
+    if METRICS_PORT:
+        # Each worker process takes the next free port starting at METRICS_PORT
+        metrics.serve(METRICS_PORT, METRICS_HOST, attempts=MCP_WORKERS)
+    if METRICS_TEXTFILE:
+        path = METRICS_TEXTFILE if MCP_WORKERS == 1 else f"{METRICS_TEXTFILE}.{os.getpid()}"
+        metrics.write_textfile(path, METRICS_TEXTFILE_INTERVAL)
+
+
+def create_http_app():
+    """Build the ASGI app for the HTTP transports; uvicorn calls this in every worker process."""
+    from contextlib import asynccontextmanager
+
+    starlette_app = app.sse_app() if MCP_TRANSPORT == "sse" else app.streamable_http_app()
+    transport_lifespan = starlette_app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(asgi_app):
+        _start_metrics_exporters()
+        if JOB_KINDS:
+            # Resume jobs left queued by a previous run without waiting for a job tool call
+            await get_job_manager().start()
+        async with transport_lifespan(asgi_app):
+            yield
+        if _job_manager is not None:
+            await _job_manager.close()
+        await close_clients()
+
+    starlette_app.router.lifespan_context = lifespan
+    return starlette_app
+
+
 def main():
-    app.run(transport='stdio')
+    if MCP_TRANSPORT == "stdio":
+        _start_metrics_exporters()
+        app.run(transport='stdio')
+        return
+    if MCP_TRANSPORT not in ("streamable-http", "sse"):
+        raise ValueError(f"Unknown MCP_TRANSPORT {MCP_TRANSPORT!r}; use stdio, streamable-http or sse")
+    if MCP_WORKERS > 1 and (MCP_TRANSPORT == "sse" or not MCP_STATELESS_HTTP):
+        raise ValueError("MCP_WORKERS > 1 requires MCP_TRANSPORT=streamable-http with MCP_STATELESS_HTTP=true")
+
+    import uvicorn
+
+    # Several workers share one listening socket (pre-fork) and must import the app by name
+    uvicorn.run(
+        "mcp_deepinfra.server:create_http_app" if MCP_WORKERS > 1 else create_http_app,
+        factory=True,
+        host=MCP_HOST,
+        port=MCP_PORT,
+        workers=MCP_WORKERS,
+        timeout_graceful_shutdown=MCP_GRACEFUL_TIMEOUT,
+        log_level="warning",
+    )
 
 if __name__ == "__main__":
     main()
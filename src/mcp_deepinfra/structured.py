@@ -0,0 +1,162 @@
+"""Schema-constrained structured output for the JSON-returning tools.
+
+Each tool has a JSON schema, a short task description and a tight output token
+limit. Requests use a system message that depends only on the tool (and the
+candidate labels for zero-shot classification), so providers can cache the
+prompt prefix; the per-call input goes in the user message.
+"""
+
+import json
+
+from .batching import estimate_tokens
+
+SYSTEM_PREFIX = (
+    "You are a precise analysis service. Reply with one JSON value that matches the JSON schema below. "
+    "Do not add prose, code fences or fields that are not in the schema."
+)
+
+TASKS = {
+    "text_classification": "Classify the sentiment (positive, negative or neutral) and the main category or topic of the text.",
+    "token_classification": (
+        "Perform named entity recognition on the text. List every named entity (person, organization, "
+        "location, date, etc.) with its type and [start, end] character offsets in the text."
+    ),
+    "fill_mask": "Replace the [MASK] token in the text with the most appropriate word. Return the completed text and the chosen word.",
+    "zero_shot_image_classification": "Classify the image into exactly one of the allowed labels, with a confidence score between 0 and 1.",
+    "object_detection": "Detect all objects in the image, each with an approximate location and a confidence score between 0 and 1.",
+    "image_classification": "Classify what the image shows: the main categories and the visible objects, each with a confidence score between 0 and 1.",
+    "analyze_image": (
+        "Classify what the image shows and detect all objects present, with approximate locations and confidence "
+        "scores between 0 and 1. If the schema has a zero_shot field, also pick the best of its allowed labels."
+    ),
+}
+
+TOOLS = tuple(TASKS)
+
+# Fixed output budgets; token and mask filling scale with the input because the answer echoes it
+MAX_TOKENS = {
+    "text_classification": 32,
+    "zero_shot_image_classification": 32,
+    "object_detection": 300,
+    "image_classification": 200,
+    "analyze_image": 400,
+}
+MAX_TOKENS_CAP = 500
+
+
+def _object(properties: dict) -> dict:
+    # Strict JSON-schema mode requires every property to be required and no extra properties
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+_SCORE = {"type": "number", "minimum": 0, "maximum": 1}
+_LABEL_SCORES = {"type": "array", "items": _object({"label": {"type": "string"}, "score": _SCORE})}
+_OBJECTS = {
+    "type": "array",
+    "items": _object({"label": {"type": "string"}, "location": {"type": "string"}, "confidence": _SCORE}),
+}
+
+
+def schema_for(tool: str, candidate_labels: list[str] | None = None) -> dict:
+    """Return the JSON schema for ``tool``'s structured answer."""
+    if tool == "text_classification":
+        return _object({
+            "sentiment": {"type": "string", "enum": ["positive", "negative", "neutral"]},
+            "category": {"type": "string"},
+        })
+    if tool == "token_classification":
+        return _object({"entities": {"type": "array", "items": _object({
+            "entity": {"type": "string"},
+            "type": {"type": "string"},
+            "position": {"type": "array", "items": {"type": "integer"}, "minItems": 2, "maxItems": 2},
+        })}})
+    if tool == "fill_mask":
+        return _object({"filled_text": {"type": "string"}, "chosen_word": {"type": "string"}})
+    if tool == "zero_shot_image_classification":
+        return _object({"label": {"type": "string", "enum": list(candidate_labels or [])}, "score": _SCORE})
+    if tool == "object_detection":
+        return _object({"objects": _OBJECTS})
+    if tool == "image_classification":
+        return _object({
+            "categories": _LABEL_SCORES,
+            "objects": {"type": "array", "items": _object({"label": {"type": "string"}, "confidence": _SCORE})},
+        })
+    if tool == "analyze_image":
+        properties = {"classification": _LABEL_SCORES, "objects": _OBJECTS}
+        if candidate_labels:
+            properties["zero_shot"] = schema_for("zero_shot_image_classification", candidate_labels)
+        return _object(properties)
+    raise ValueError(f"No structured output schema for {tool}")
+
+
+def system_prompt(tool: str, schema: dict) -> str:
+    """Build the stable system message for ``tool``."""
+    return f"{SYSTEM_PREFIX}\n\nTask: {TASKS[tool]}\n\nJSON schema: {json.dumps(schema, sort_keys=True, separators=(',', ':'))}"
+
+
+def max_tokens(tool: str, text: str = "") -> int:
+    """Return the output token limit for one ``tool`` call on ``text``."""
+    if tool in MAX_TOKENS:
+        return MAX_TOKENS[tool]
+    return min(MAX_TOKENS_CAP, 32 + 2 * estimate_tokens(text))
+
+
+def response_format(tool: str, schema: dict, mode: str = "json_schema") -> dict:
+    """Return the ``response_format`` request parameter (``json_schema`` or ``json_object``)."""
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": tool, "schema": schema, "strict": True}}
+
+
+def validate(value, schema: dict, path: str = "$") -> None:
+    """Check ``value`` against the subset of JSON schema used here; raise ValueError on mismatch."""
+    expected = schema.get("type")
+    checks = {
+        "object": lambda v: isinstance(v, dict),
+        "array": lambda v: isinstance(v, list),
+        "string": lambda v: isinstance(v, str),
+        "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+        "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+        "boolean": lambda v: isinstance(v, bool),
+    }
+    if expected and not checks[expected](value):
+        raise ValueError(f"{path}: expected {expected}, got {type(value).__name__}")
+    if "enum" in schema and value not in schema["enum"]:
+        raise ValueError(f"{path}: {value!r} is not one of {schema['enum']}")
+    if "minimum" in schema and value < schema["minimum"] or "maximum" in schema and value > schema["maximum"]:
+        raise ValueError(f"{path}: {value} is out of range")
+    if expected == "object":
+        missing = [key for key in schema.get("required", []) if key not in value]
+        if missing:
+            raise ValueError(f"{path}: missing {', '.join(missing)}")
+        properties = schema.get("properties", {})
+        if schema.get("additionalProperties") is False:
+            extra = [key for key in value if key not in properties]
+            if extra:
+                raise ValueError(f"{path}: unexpected {', '.join(extra)}")
+        for key, subschema in properties.items():
+            if key in value:
+                validate(value[key], subschema, f"{path}.{key}")
+    if expected == "array":
+        if len(value) < schema.get("minItems", 0) or len(value) > schema.get("maxItems", len(value)):
+            raise ValueError(f"{path}: wrong number of items ({len(value)})")
+        for index, item in enumerate(value):
+            validate(item, schema.get("items", {}), f"{path}[{index}]")
+
+
+def parse(answer: str | None, schema: dict):
+    """Parse and validate a structured answer; raise ValueError if it is missing or invalid."""
+    if not answer:
+        raise ValueError("Empty structured answer")
+    text = answer.strip()
+    try:
+        value = json.loads(text)
+    except ValueError:
+        # json_object mode on some models still wraps the answer in a code fence
+        start, end = text.find("{"), text.rfind("}")
+        try:
+            value = json.loads(text[start:end + 1])
+        except ValueError:
+            raise ValueError("Structured answer is not valid JSON") from None
+    validate(value, schema)
+    return value
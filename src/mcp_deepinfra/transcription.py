@@ -0,0 +1,169 @@
+"""Segmented transcription: split long audio into overlapping windows and stitch results."""
+
+import asyncio
+import io
+import re
+import shutil
+import tempfile
+import wave
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+# (filename, wav_bytes) -> (text, segments with window-relative "start"/"end"/"text", or None)
+TranscribeFn = Callable[[str, bytes], Awaitable[tuple[str, list[dict] | None]]]
+
+# Sample format used when decoding non-WAV input with ffmpeg.
+DECODE_SAMPLE_RATE = 16000
+
+
+@dataclass
+class Window:
+    index: int
+    start: float
+    end: float
+    first_frame: int
+    frame_count: int
+
+
+def plan_windows(total_frames: int, framerate: int, segment_seconds: float, overlap_seconds: float) -> list[Window]:
+    """Cover ``total_frames`` with windows of ``segment_seconds`` that overlap by ``overlap_seconds``."""
+    if segment_seconds <= 0:
+        raise ValueError("segment_seconds must be positive")
+    if not 0 <= overlap_seconds < segment_seconds:
+        raise ValueError("overlap_seconds must be non-negative and smaller than segment_seconds")
+    length = max(1, int(segment_seconds * framerate))
+    step = max(1, int((segment_seconds - overlap_seconds) * framerate))
+    windows = []
+    first = 0
+    while True:
+        last = min(first + length, total_frames)
+        windows.append(Window(len(windows), first / framerate, last / framerate, first, last - first))
+        if last >= total_frames:
+            return windows
+        first += step
+
+
+def read_window(reader: wave.Wave_read, window: Window) -> bytes:
+    """Extract one window as a standalone WAV file."""
+    reader.setpos(window.first_frame)
+    frames = reader.readframes(window.frame_count)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(reader.getnchannels())
+        writer.setsampwidth(reader.getsampwidth())
+        writer.setframerate(reader.getframerate())
+        writer.writeframes(frames)
+    return buffer.getvalue()
+
+
+@asynccontextmanager
+async def as_wav(filename: str, fileobj):
+    """Yield a WAV file object for the audio, decoding other formats with ffmpeg if available."""
+    if filename.endswith(".wav"):
+        yield fileobj
+        return
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ValueError("Segmented transcription of non-WAV audio requires ffmpeg on PATH")
+    with tempfile.NamedTemporaryFile(suffix=".wav") as decoded:
+        process = await asyncio.create_subprocess_exec(
+            ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", "pipe:0",
+            "-ac", "1", "-ar", str(DECODE_SAMPLE_RATE), "-c:a", "pcm_s16le", decoded.name,
+            stdin=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        async def feed():
+            try:
+                while chunk := fileobj.read(1024 * 1024):
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                process.stdin.close()
+
+        try:
+            _, stderr = await asyncio.gather(feed(), process.stderr.read())
+            if await process.wait() != 0:
+                raise ValueError(f"ffmpeg failed to decode audio: {stderr.decode(errors='replace').strip()}")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        with open(decoded.name, "rb") as f:
+            yield f
+
+
+def _words(text: str) -> list[str]:
+    return text.split()
+
+
+def _normalize(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def _merge_text(previous: list[str], following: list[str], max_overlap: int = 50) -> list[str]:
+    """Drop the longest prefix of ``following`` that repeats the tail of ``previous``."""
+    limit = min(len(previous), len(following), max_overlap)
+    for size in range(limit, 0, -1):
+        tail = [_normalize(w) for w in previous[-size:]]
+        head = [_normalize(w) for w in following[:size]]
+        if tail == head:
+            return following[size:]
+    return following
+
+
+def stitch(windows: list[Window], results: list[tuple[str, list[dict] | None]]) -> dict:
+    """Merge per-window transcripts into one transcript on the global timeline.
+
+    With timestamped segments, each window owns the audio from the middle of its
+    left overlap to the middle of its right overlap, and a segment is kept by the
+    window that owns its midpoint. Without segments, repeated words at window
+    boundaries are removed by matching the overlapping text.
+    """
+    if all(segments is not None for _, segments in results):
+        merged = []
+        for i, (window, (_, segments)) in enumerate(zip(windows, results)):
+            low = 0.0 if i == 0 else (window.start + windows[i - 1].end) / 2
+            high = float("inf") if i == len(windows) - 1 else (windows[i + 1].start + window.end) / 2
+            for segment in segments:
+                start = window.start + segment["start"]
+                end = window.start + segment["end"]
+                if low <= (start + end) / 2 < high:
+                    merged.append({"start": round(start, 3), "end": round(end, 3), "text": segment["text"].strip()})
+        return {"text": " ".join(s["text"] for s in merged if s["text"]), "segments": merged}
+
+    words: list[str] = []
+    for text, _ in results:
+        words.extend(_merge_text(words, _words(text)))
+    return {"text": " ".join(words), "segments": None}
+
+
+async def transcribe_segmented(
+    transcribe: TranscribeFn,
+    filename: str,
+    fileobj,
+    segment_seconds: float,
+    overlap_seconds: float,
+    max_workers: int,
+) -> dict:
+    """Transcribe overlapping windows concurrently (at most ``max_workers`` at once) and stitch them."""
+    async with as_wav(filename, fileobj) as wav_file:
+        with wave.open(wav_file, "rb") as reader:
+            windows = plan_windows(reader.getnframes(), reader.getframerate(), segment_seconds, overlap_seconds)
+            semaphore = asyncio.Semaphore(max_workers)
+
+            async def run(window: Window):
+                async with semaphore:
+                    # Read lazily so at most max_workers windows are held in memory
+                    data = read_window(reader, window)
+                    return await transcribe(f"segment_{window.index:05d}.wav", data)
+
+            results = await asyncio.gather(*(run(window) for window in windows))
+
+    stitched = stitch(windows, results)
+    stitched["windows"] = len(windows)
+    stitched["duration"] = round(windows[-1].end, 3)
+    return stitched
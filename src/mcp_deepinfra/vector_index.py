@@ -0,0 +1,200 @@
+"""Local vector collections stored as append-only, memory-mapped float32 matrices."""
+
+import asyncio
+import json
+import os
+import re
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking (and no multi-worker HTTP serving)
+    fcntl = None
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# Rows scored per matrix product; bounds peak memory for large collections.
+SEARCH_BLOCK_ROWS = 65536
+
+
+class Collection:
+    """A named collection of unit-normalized vectors and their texts.
+
+    Layout inside the collection directory:
+    ``meta.json`` (model and dimensions), ``vectors.f32`` (row-major float32
+    matrix, appended in place) and ``records.jsonl`` (one id/text per row).
+    Appends take an exclusive ``flock`` on ``<collection>.lock`` and searches a
+    shared one, so several worker processes can use the same collection; all
+    sizes and records are read from disk while the lock is held.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = asyncio.Lock()
+        self._meta_path = os.path.join(path, "meta.json")
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._records_path = os.path.join(path, "records.jsonl")
+        self._lock_path = f"{path}.lock"
+        self._records: list[dict] = []
+        # (size, mtime_ns) of records.jsonl when _records was read; another process may have changed it since
+        self._records_version: tuple[int, int] | None = None
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self._lock_path) or ".", exist_ok=True)
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _meta(self) -> dict | None:
+        if not os.path.exists(self._meta_path):
+            return None
+        with open(self._meta_path) as f:
+            return json.load(f)
+
+    def _load_records(self) -> list[dict]:
+        """Return the records on disk; the cached list is reused only while the file is unchanged."""
+        try:
+            info = os.stat(self._records_path)
+        except FileNotFoundError:
+            self._records, self._records_version = [], None
+            return self._records
+        version = (info.st_size, info.st_mtime_ns)
+        if version != self._records_version:
+            with open(self._records_path, encoding="utf-8") as f:
+                self._records = [json.loads(line) for line in f if line.strip()]
+            self._records_version = version
+        return self._records
+
+    def _rows(self, dimensions: int) -> int:
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * dimensions)
+
+    def append(self, model: str, matrix: np.ndarray, ids: list[str] | None, texts: list[str]) -> dict:
+        """Append normalized vectors without rewriting existing data.
+
+        Missing ``ids`` default to the rows' positions in the collection.
+        """
+        with self._file_lock(exclusive=True):
+            return self._append(model, matrix, ids, texts)
+
+    def _append(self, model: str, matrix: np.ndarray, ids: list[str] | None, texts: list[str]) -> dict:
+        meta = self._meta()
+        dimensions = matrix.shape[1]
+        if meta is None:
+            os.makedirs(self.path, exist_ok=True)
+            meta = {"model": model, "dimensions": dimensions}
+            with open(self._meta_path, "w") as f:
+                json.dump(meta, f)
+        elif meta["model"] != model or meta["dimensions"] != dimensions:
+            raise ValueError(
+                f"Collection uses model {meta['model']} ({meta['dimensions']} dims), "
+                f"got {model} ({dimensions} dims)"
+            )
+
+        # Always re-read before deciding what to trim: another process may have appended
+        self._records_version = None
+        records = self._load_records()
+        # Trim a partially written tail so vectors and records stay aligned.
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        rows = min(size // (4 * dimensions), len(records))
+        if size != rows * 4 * dimensions:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(rows * 4 * dimensions)
+        if len(records) > rows:
+            del records[rows:]
+            with open(self._records_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+
+        if ids is None:
+            ids = [str(rows + i) for i in range(len(texts))]
+        with open(self._vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(matrix, dtype="<f4").tobytes())
+        new_records = [{"id": id_, "text": text} for id_, text in zip(ids, texts)]
+        with open(self._records_path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in new_records)
+        records.extend(new_records)
+        return {"model": model, "dimensions": dimensions, "count": len(records)}
+
+    def search(self, queries: np.ndarray, top_k: int) -> list[list[dict]]:
+        """Return the ``top_k`` most cosine-similar records for each query row."""
+        if top_k < 1:
+            raise ValueError(f"top_k must be at least 1, got {top_k}")
+        with self._file_lock(exclusive=False):
+            return self._search(queries, top_k)
+
+    def _search(self, queries: np.ndarray, top_k: int) -> list[list[dict]]:
+        meta = self._meta()
+        if meta is None:
+            raise ValueError("Collection does not exist")
+        dimensions = meta["dimensions"]
+        if queries.shape[1] != dimensions:
+            raise ValueError(f"Query has {queries.shape[1]} dims, collection has {dimensions}")
+        records = self._load_records()
+        rows = min(self._rows(dimensions), len(records))
+        if rows == 0:
+            raise ValueError("Collection is empty")
+        matrix = np.memmap(self._vectors_path, dtype="<f4", mode="r", shape=(rows, dimensions))
+        k = min(top_k, rows)
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, rows, SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS])
+            scores = queries @ block.T
+            if scores.shape[1] > k:
+                candidates = np.argpartition(scores, -k, axis=1)[:, -k:]
+                scores = np.take_along_axis(scores, candidates, axis=1)
+            else:
+                candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, candidates + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(best_scores, -k, axis=1)[:, -k:]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [
+                {"id": records[row]["id"], "text": records[row]["text"], "score": float(score)}
+                for row, score in zip(row_ids, row_scores)
+            ]
+            for row_ids, row_scores in zip(best_rows.tolist(), best_scores.tolist())
+        ]
+
+
+class VectorIndex:
+    """Registry of named collections under a base directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._collections: dict[str, Collection] = {}
+
+    def collection(self, name: str) -> Collection:
+        if not _NAME_RE.match(name) or name in (".", ".."):
+            raise ValueError("Collection names may only contain letters, digits, '.', '_' and '-'")
+        if name not in self._collections:
+            self._collections[name] = Collection(os.path.join(self.directory, name))
+        return self._collections[name]
+
+    async def add(self, name: str, model: str, matrix: np.ndarray, ids: list[str] | None, texts: list[str]) -> dict:
+        collection = self.collection(name)
+        async with collection.lock:
+            return await asyncio.to_thread(collection.append, model, matrix, ids, texts)
+
+    async def search(self, name: str, queries: np.ndarray, top_k: int) -> list[list[dict]]:
+        collection = self.collection(name)
+        async with collection.lock:
+            return await asyncio.to_thread(collection.search, queries, top_k)
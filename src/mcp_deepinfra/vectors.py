@@ -0,0 +1,58 @@
+"""Embedding post-processing and compact serialization helpers."""
+
+import base64
+import json
+
+import numpy as np
+
+OUTPUT_FORMATS = ("list", "base64")
+DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+
+def postprocess(vectors, dimensions: int | None = None, normalize: bool = False) -> np.ndarray:
+    """Convert raw embeddings to a float32 matrix, optionally truncated and L2-normalized.
+
+    Truncation keeps the leading ``dimensions`` components (Matryoshka-style), so
+    normalization is applied afterwards to keep truncated vectors unit length.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(matrix), -1)
+    if dimensions is not None:
+        if dimensions <= 0:
+            raise ValueError("dimensions must be a positive integer")
+        matrix = matrix[:, :dimensions]
+    if normalize:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+    return matrix
+
+
+def encode(matrix: np.ndarray, output_format: str = "list", dtype: str = "float32", model: str | None = None) -> str:
+    """Serialize an embedding matrix in the requested output format.
+
+    ``list`` keeps the legacy Python-repr output. ``base64`` packs the matrix as
+    little-endian ``float32``/``float16`` and returns JSON with shape metadata.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output_format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+    if output_format == "list":
+        return str(matrix.tolist())
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {', '.join(DTYPES)}")
+    packed = np.ascontiguousarray(matrix, dtype=DTYPES[dtype])
+    return json.dumps({
+        "model": model,
+        "shape": list(packed.shape),
+        "dtype": dtype,
+        "byteorder": "little",
+        "data": base64.b64encode(packed.tobytes()).decode("ascii"),
+    })
+
+
+def decode(payload: str) -> np.ndarray:
+    """Decode a ``base64`` payload produced by :func:`encode` back into a matrix."""
+    meta = json.loads(payload)
+    raw = base64.b64decode(meta["data"])
+    return np.frombuffer(raw, dtype=DTYPES[meta["dtype"]]).reshape(meta["shape"])
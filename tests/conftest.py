@@ -3,94 +3,202 @@
 import json
 import os
 import pytest
+import socket
 import subprocess
 import sys
 import time
+import wave
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List
 
+import httpx
 
-@pytest.fixture
-def mcp_server():
-    """Fixture that starts the MCP server as a subprocess and provides a client interface."""
-    # Get the project root directory
-    project_root = Path(__file__).parent.parent
-
-    # Start the server
-    process = subprocess.Popen(
-        [sys.executable, "-m", "mcp_deepinfra.server"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        cwd=str(project_root),
-        env={**os.environ, "PYTHONPATH": str(project_root / "src")}
-    )
-
-    # Give the server a moment to start
-    time.sleep(0.1)
-
-    class MCPServerClient:
-        def __init__(self, process):
-            self.process = process
-            self.request_id = 1
-
-        def send_request(self, method: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
-            """Send a JSON-RPC request to the server."""
+PROJECT_ROOT = Path(__file__).parent.parent
+
+
+class MCPServerClient:
+    def __init__(self, process):
+        self.process = process
+        self.request_id = 1
+        # Notifications (e.g. notifications/progress) received while waiting for responses
+        self.notifications = []
+
+    def send_request(self, method: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Send a JSON-RPC request to the server and return the response with the same id."""
+        return self.send_requests(method, [params])[0]
+
+    def send_requests(self, method: str, params_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Send several requests before reading any response, so the server handles them concurrently."""
+        request_ids = []
+        for params in params_list:
             request = {
                 "jsonrpc": "2.0",
                 "id": self.request_id,
                 "method": method,
                 "params": params or {}
             }
+            request_ids.append(self.request_id)
             self.request_id += 1
-
-            # Send request
             self.process.stdin.write(json.dumps(request) + "\n")
-            self.process.stdin.flush()
-
-            # Read response (skip any log lines)
-            while True:
-                line = self.process.stdout.readline().strip()
-                if line.startswith('{'):
-                    try:
-                        return json.loads(line)
-                    except json.JSONDecodeError:
-                        continue
-
-        def send_notification(self, method: str, params: Dict[str, Any] = None):
-            """Send a JSON-RPC notification to the server."""
-            notification = {
-                "jsonrpc": "2.0",
-                "method": method,
-                "params": params or {}
-            }
-            self.process.stdin.write(json.dumps(notification) + "\n")
-            self.process.stdin.flush()
-
-        def terminate(self):
-            """Terminate the server process."""
-            self.process.terminate()
-            self.process.wait()
-
-    client = MCPServerClient(process)
-
-    # Initialize the server
-    init_response = client.send_request("initialize", {
-        "protocolVersion": "2024-11-05",
-        "capabilities": {},
-        "clientInfo": {
-            "name": "test-client",
-            "version": "1.0.0"
+        self.process.stdin.flush()
+
+        # Read responses (skip log lines; keep notifications sent before them)
+        responses = {}
+        while len(responses) < len(request_ids):
+            raw = self.process.stdout.readline()
+            if not raw and self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}")
+            line = raw.strip()
+            if line.startswith('{'):
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if message.get("id") in request_ids:
+                    responses[message["id"]] = message
+                elif "method" in message and "id" not in message:
+                    self.notifications.append(message)
+        return [responses[request_id] for request_id in request_ids]
+
+    def send_notification(self, method: str, params: Dict[str, Any] = None):
+        """Send a JSON-RPC notification to the server."""
+        notification = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params or {}
         }
-    })
+        self.process.stdin.write(json.dumps(notification) + "\n")
+        self.process.stdin.flush()
+
+    def call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
+        """Call a tool and return the text of its result."""
+        response = self.send_request("tools/call", {"name": name, "arguments": arguments})
+        assert "result" in response, f"Tool call failed: {response}"
+        return response["result"]["content"][0]["text"]
+
+    def terminate(self):
+        """Terminate the server process."""
+        self.process.terminate()
+        self.process.wait()
+
+
+class MockUpstream:
+    """A running ``benchmarks/mock_deepinfra.py``."""
+
+    def __init__(self, process, port: int):
+        self.process = process
+        self.url = f"http://127.0.0.1:{port}"
+        self.base_url = f"{self.url}/v1/openai"
+
+    def stats(self) -> dict:
+        """Requests served per endpoint and per model."""
+        return httpx.get(f"{self.url}/stats").json()
+
 
-    assert "result" in init_response, f"Server initialization failed: {init_response}"
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
 
-    # Send initialized notification
-    client.send_notification("notifications/initialized")
 
-    yield client
+@pytest.fixture
+def isolated_env(tmp_path) -> Dict[str, str]:
+    """Environment that keeps the server's jobs, images and collections under ``tmp_path``, not ~/.cache."""
+    return {
+        "JOB_DB_PATH": str(tmp_path / "state" / "jobs.sqlite3"),
+        "IMAGE_STORE_DIR": str(tmp_path / "state" / "images"),
+        "VECTOR_INDEX_DIR": str(tmp_path / "state" / "collections"),
+    }
+
+
+@pytest.fixture
+def start_server(isolated_env):
+    """Factory fixture: start the MCP server with extra environment variables and return an initialized client."""
+    clients = []
+
+    def start(env: Dict[str, str] = None) -> MCPServerClient:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "mcp_deepinfra.server"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            cwd=str(PROJECT_ROOT),
+            env={**os.environ, "PYTHONPATH": str(PROJECT_ROOT / "src"), **isolated_env, **(env or {})}
+        )
+        client = MCPServerClient(process)
+        clients.append(client)
+
+        # Initialize the server; the blocking initialize round-trip doubles as the readiness check
+        init_response = client.send_request("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {
+                "name": "test-client",
+                "version": "1.0.0"
+            }
+        })
+
+        assert "result" in init_response, f"Server initialization failed: {init_response}"
+
+        # Send initialized notification
+        client.send_notification("notifications/initialized")
+        return client
+
+    yield start
 
     # Cleanup
-    client.terminate()
\ No newline at end of file
+    for client in clients:
+        client.terminate()
+
+
+@pytest.fixture
+def mcp_server(start_server):
+    """Fixture that starts the MCP server as a subprocess and provides a client interface."""
+    return start_server()
+
+
+@pytest.fixture
+def mock_upstream():
+    """Factory fixture: start the mock DeepInfra API with the given command-line flags."""
+    mocks = []
+
+    def start(*flags: str) -> MockUpstream:
+        port = _free_port()
+        process = subprocess.Popen(
+            [sys.executable, str(PROJECT_ROOT / "benchmarks" / "mock_deepinfra.py"), "--port", str(port), *flags],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        mock = MockUpstream(process, port)
+        mocks.append(mock)
+        deadline = time.monotonic() + 15
+        while True:
+            try:
+                mock.stats()
+                return mock
+            except httpx.TransportError:
+                assert process.poll() is None, "Mock upstream exited during startup"
+                assert time.monotonic() < deadline, "Mock upstream did not start listening"
+                time.sleep(0.1)
+
+    yield start
+
+    for mock in mocks:
+        mock.process.terminate()
+        mock.process.wait()
+
+
+@pytest.fixture
+def wav_file(tmp_path):
+    """Factory fixture: write a silent 16 kHz mono WAV of the given length and return its path."""
+    def write(seconds: float, name: str = "audio.wav") -> Path:
+        path = tmp_path / name
+        with wave.open(str(path), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            f.writeframes(b"\0\0" * int(seconds * 16000))
+        return path
+
+    return write
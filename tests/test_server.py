@@ -1,5 +1,13 @@
 """Tests for MCP DeepInfra server initialization and tool listing."""
 
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
 import pytest
 
 
@@ -29,13 +37,29 @@ class TestServerInitialization:
             "generate_image",
             "text_generation",
             "embeddings",
+            "embed_file",
             "speech_recognition",
             "zero_shot_image_classification",
             "object_detection",
             "image_classification",
             "text_classification",
             "token_classification",
-            "fill_mask"
+            "fill_mask",
+            "index_texts",
+            "similarity_search",
+            "response_cache_stats",
+            "text_generation_batch",
+            "text_classification_batch",
+            "token_classification_batch",
+            "fill_mask_batch",
+            "analyze_image",
+            "scheduler_stats",
+            "job_status",
+            "wait_for_job",
+            "job_result",
+            "cancel_job",
+            "list_jobs",
+            "routing_stats"
         }
 
         assert expected_tools.issubset(tool_names), f"Missing tools: {expected_tools - tool_names}"
@@ -45,4 +69,72 @@ class TestServerInitialization:
             assert "name" in tool
             assert "description" in tool
             assert isinstance(tool["description"], str)
-            assert len(tool["description"]) > 0
\ No newline at end of file
+            assert len(tool["description"]) > 0
+
+    def test_streamable_http_transport(self, tmp_path, isolated_env):
+        """Test that the server answers initialize over streamable HTTP with two workers."""
+        project_root = Path(__file__).parent.parent
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        process = subprocess.Popen(
+            [sys.executable, "-m", "mcp_deepinfra.server"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=str(project_root),
+            env={
+                **os.environ,
+                "PYTHONPATH": str(project_root / "src"),
+                **isolated_env,
+                "MCP_TRANSPORT": "streamable-http",
+                "MCP_PORT": str(port),
+                "MCP_WORKERS": "2",
+            },
+        )
+        try:
+            request = {
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "initialize",
+                "params": {
+                    "protocolVersion": "2024-11-05",
+                    "capabilities": {},
+                    "clientInfo": {"name": "test-client", "version": "1.0.0"}
+                }
+            }
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    response = httpx.post(
+                        f"http://127.0.0.1:{port}/mcp",
+                        json=request,
+                        headers={"Accept": "application/json, text/event-stream"},
+                    )
+                    break
+                except httpx.ConnectError:
+                    assert process.poll() is None, "Server exited during startup"
+                    assert time.monotonic() < deadline, "Server did not start listening"
+                    time.sleep(0.2)
+
+            assert response.status_code == 200
+            assert "deepinfra-ai-tools" in response.text
+
+            # Remote clients may not read local files unless LOCAL_FILES_ROOT allows them
+            input_path = tmp_path / "corpus.txt"
+            input_path.write_text("secret\n")
+            response = httpx.post(
+                f"http://127.0.0.1:{port}/mcp",
+                json={
+                    "jsonrpc": "2.0",
+                    "id": 2,
+                    "method": "tools/call",
+                    "params": {"name": "embed_file", "arguments": {"input_path": str(input_path)}}
+                },
+                headers={"Accept": "application/json, text/event-stream"},
+            )
+            assert response.status_code == 200
+            assert "PermissionError: Local files are disabled over streamable-http" in response.text
+            assert not (tmp_path / "corpus.embeddings.npy").exists()
+        finally:
+            process.terminate()
+            assert process.wait(timeout=30) == 0
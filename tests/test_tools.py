@@ -1,5 +1,11 @@
 """Tests for individual MCP DeepInfra tools."""
 
+import ast
+import base64
+import json
+import os
+import time
+
 import pytest
 
 
@@ -28,6 +34,35 @@ class TestTools:
             result_text = content[0]["text"]
             assert isinstance(result_text, str)
 
+    def test_generate_image_background(self, start_server, mock_upstream, isolated_env):
+        """Test submitting image generation as a background job, polling it and reading the stored image."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+
+        job = json.loads(server.call_tool("generate_image", {
+            "prompt": "a cute cat sitting on a windowsill",
+            "background": True
+        }))
+        assert job["status"] == "queued"
+
+        deadline = time.monotonic() + 30
+        while True:
+            status = json.loads(server.call_tool("wait_for_job", {"job_id": job["job_id"], "timeout": 5}))
+            if status["status"] not in ("queued", "running"):
+                break
+            assert time.monotonic() < deadline, "Job did not finish"
+        assert status["status"] == "succeeded", status
+
+        image = json.loads(status["result"])
+        assert image["resource"].startswith("images://")
+        response = server.send_request("resources/read", {"uri": image["resource"]})
+        contents = response["result"]["contents"][0]
+        assert contents["mimeType"] == "image/png"
+        assert base64.b64decode(contents["blob"]).startswith(b"\x89PNG")
+        # The job and the image live in the test's directory, not the user's cache
+        assert os.path.exists(isolated_env["JOB_DB_PATH"])
+        assert os.listdir(isolated_env["IMAGE_STORE_DIR"])
+
     def test_text_generation(self, mcp_server):
         """Test text generation tool."""
         response = mcp_server.send_request("tools/call", {
@@ -48,6 +83,52 @@ class TestTools:
             result_text = content[0]["text"]
             assert isinstance(result_text, str)
 
+    def test_text_generation_stream(self, start_server, mock_upstream):
+        """Test that streamed text is forwarded as progress notifications and returned in full."""
+        mock = mock_upstream("--latency-ms", "10")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+        response = server.send_request("tools/call", {
+            "name": "text_generation",
+            "arguments": {
+                "prompt": "Hello, how are you?",
+                "stream": True
+            },
+            "_meta": {"progressToken": "stream-test"}
+        })
+
+        assert "result" in response
+        text = response["result"]["content"][0]["text"]
+        progress = [
+            message["params"] for message in server.notifications
+            if message["method"] == "notifications/progress"
+        ]
+        assert len(progress) > 1
+        assert all(params["progressToken"] == "stream-test" for params in progress)
+        assert [params["progress"] for params in progress] == list(range(1, len(progress) + 1))
+        assert "".join(params["message"] for params in progress) == text
+
+    def test_text_generation_stream_reports_to_limiter(self, start_server, mock_upstream):
+        """Test that streamed calls count as successes and overloads in the model's limiter."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "MODEL_TEXT_GENERATION": "streamer"})
+        server.call_tool("text_generation", {"prompt": "Hello", "stream": True})
+        limiter = json.loads(server.call_tool("scheduler_stats", {}))["streamer"]
+        assert limiter["completed"] == 1
+        assert limiter["overloads"] == 0
+
+        mock = mock_upstream("--latency-ms", "5", "--rate-limit-rate", "1", "--retry-after-ms", "500")
+        server = start_server({
+            "DEEPINFRA_BASE_URL": mock.base_url,
+            "MODEL_TEXT_GENERATION": "streamer",
+            "UPSTREAM_CONCURRENCY": "16",
+        })
+        text = server.call_tool("text_generation", {"prompt": "Hello", "stream": True})
+        assert text.startswith("Error generating text: RateLimitError")
+        limiter = json.loads(server.call_tool("scheduler_stats", {}))["streamer"]
+        assert limiter["overloads"] == 1
+        assert limiter["concurrency_limit"] == 8
+        assert limiter["paused_for"] > 0
+
     def test_embeddings(self, mcp_server):
         """Test embeddings tool."""
         response = mcp_server.send_request("tools/call", {
@@ -60,6 +141,196 @@ class TestTools:
         # Embeddings might fail due to model availability, but structure should be correct
         assert "result" in response or "error" in response
 
+    def test_embeddings_base64(self, start_server, mock_upstream):
+        """Test that base64 output decodes to truncated, normalized float16 vectors."""
+        import numpy as np
+
+        mock = mock_upstream()
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+        inputs = ["Hello world", "This is a test"]
+
+        payload = json.loads(server.call_tool("embeddings", {
+            "inputs": inputs,
+            "output_format": "base64",
+            "dtype": "float16",
+            "dimensions": 128,
+            "normalize": True,
+        }))
+
+        assert payload["shape"] == [2, 128]
+        assert payload["dtype"] == "float16"
+        matrix = np.frombuffer(base64.b64decode(payload["data"]), dtype="<f2").reshape(payload["shape"])
+        np.testing.assert_allclose(np.linalg.norm(matrix.astype(np.float32), axis=1), 1.0, atol=1e-3)
+        # Rows keep the input order and are the first 128 dimensions of the full vectors
+        full = np.array(ast.literal_eval(server.call_tool("embeddings", {"inputs": inputs})), dtype=np.float32)
+        assert full.shape[1] > 128
+        expected = full[:, :128] / np.linalg.norm(full[:, :128], axis=1, keepdims=True)
+        np.testing.assert_allclose(matrix, expected, atol=1e-3)
+
+    def test_embedding_cache(self, start_server, mock_upstream, tmp_path):
+        """Test that only cache misses go upstream and results keep the input order."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({
+            "DEEPINFRA_BASE_URL": mock.base_url,
+            "EMBEDDING_CACHE_PATH": str(tmp_path / "embeddings.sqlite3"),
+        })
+
+        first = ast.literal_eval(server.call_tool("embeddings", {"inputs": ["alpha", "beta"]}))
+        second = ast.literal_eval(server.call_tool("embeddings", {"inputs": ["gamma", "beta", "alpha", "beta"]}))
+
+        assert second[1] == second[3] == first[1]
+        assert second[2] == first[0]
+        assert second[0] not in first
+        assert mock.stats()["/embeddings"] == 2
+        stats = json.loads(server.call_tool("embedding_cache_stats", {}))
+        assert stats["entries"] == 3
+        assert stats["misses"] == 3
+        assert stats["hits"] == 3
+
+    def test_embedding_cache_evicts_least_recently_used(self, start_server, mock_upstream, tmp_path):
+        """Test that the cache stays within EMBEDDING_CACHE_MAX_ENTRIES by evicting the oldest lookups."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({
+            "DEEPINFRA_BASE_URL": mock.base_url,
+            "EMBEDDING_CACHE_PATH": str(tmp_path / "embeddings.sqlite3"),
+            "EMBEDDING_CACHE_MAX_ENTRIES": "2",
+        })
+
+        # "alpha" is used again after "beta", so "beta" is evicted when "gamma" is added
+        for text in ("alpha", "beta", "alpha", "gamma"):
+            server.call_tool("embeddings", {"inputs": [text]})
+        assert json.loads(server.call_tool("embedding_cache_stats", {}))["entries"] == 2
+        assert mock.stats()["/embeddings"] == 3
+
+        server.call_tool("embeddings", {"inputs": ["alpha"]})
+        assert mock.stats()["/embeddings"] == 3
+        server.call_tool("embeddings", {"inputs": ["beta"]})
+        assert mock.stats()["/embeddings"] == 4
+
+    def test_embedding_cache_invalidation(self, start_server, mock_upstream, tmp_path):
+        """Test that cached vectors are not reused for another model or after the vector size changes."""
+        cache_path = str(tmp_path / "embeddings.sqlite3")
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "EMBEDDING_CACHE_PATH": cache_path})
+        server.call_tool("embeddings", {"inputs": ["alpha", "beta"]})
+        server.terminate()
+
+        # Another model: the cached vectors belong to the first one
+        server = start_server({
+            "DEEPINFRA_BASE_URL": mock.base_url,
+            "EMBEDDING_CACHE_PATH": cache_path,
+            "MODEL_EMBEDDINGS": "other-model",
+        })
+        server.call_tool("embeddings", {"inputs": ["alpha"]})
+        stats = json.loads(server.call_tool("embedding_cache_stats", {}))
+        assert stats["hits"] == 0
+        assert stats["entries_by_model"]["other-model"] == 1
+        server.terminate()
+
+        # Same model, now returning 64 dimensions: a miss reveals the change and the stale hit is refetched
+        resized = mock_upstream("--latency-ms", "5", "--embedding-dimensions", "64")
+        server = start_server({"DEEPINFRA_BASE_URL": resized.base_url, "EMBEDDING_CACHE_PATH": cache_path})
+        vectors = ast.literal_eval(server.call_tool("embeddings", {"inputs": ["alpha", "gamma"]}))
+        assert [len(vector) for vector in vectors] == [64, 64]
+        assert resized.stats()["/embeddings"] == 2
+        stats = json.loads(server.call_tool("embedding_cache_stats", {}))
+        assert stats["entries_by_model"] == {"sentence-transformers/all-MiniLM-L6-v2": 2, "other-model": 1}
+        # The refreshed entries are served from the cache from now on
+        server.call_tool("embeddings", {"inputs": ["gamma", "alpha"], "dimensions": 32})
+        assert resized.stats()["/embeddings"] == 2
+
+    def test_embedding_coalescing(self, start_server, mock_upstream):
+        """Test that concurrent embeddings calls share one upstream request and each gets its own vectors."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "EMBEDDING_BATCH_WINDOW_MS": "200"})
+        inputs = [["one"], ["two", "three"], ["four"], ["five", "six", "seven"]]
+
+        responses = server.send_requests("tools/call", [
+            {"name": "embeddings", "arguments": {"inputs": texts}} for texts in inputs
+        ])
+
+        assert mock.stats()["/embeddings"] == 1
+        results = [ast.literal_eval(response["result"]["content"][0]["text"]) for response in responses]
+        assert [len(vectors) for vectors in results] == [1, 2, 1, 3]
+        # A call on its own (after the window) gets the same vectors for the same texts
+        assert ast.literal_eval(server.call_tool("embeddings", {"inputs": ["two", "three"]})) == results[1]
+        assert mock.stats()["/embeddings"] == 2
+
+    def test_embed_file(self, mcp_server, tmp_path):
+        """Test bulk embedding of a local text file into a .npy matrix."""
+        input_path = tmp_path / "corpus.txt"
+        input_path.write_text("\n".join(f"Sentence number {i}" for i in range(50)) + "\n")
+        response = mcp_server.send_request("tools/call", {
+            "name": "embed_file",
+            "arguments": {
+                "input_path": str(input_path)
+            }
+        })
+
+        assert "result" in response or "error" in response
+
+    def test_embed_file_url(self, start_server, mock_upstream, tmp_path):
+        """Test that embed_file decodes file:// URLs and writes one row per non-empty line."""
+        import numpy as np
+
+        mock = mock_upstream()
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "EMBEDDING_BATCH_MAX_SIZE": "16"})
+        input_path = tmp_path / "my corpus.txt"
+        input_path.write_text("\n".join(f"Sentence number {i}" for i in range(50)) + "\n\n")
+
+        result = json.loads(server.call_tool("embed_file", {"input_path": input_path.as_uri()}))
+
+        assert result["rows"] == 50
+        assert result["embedded"] == 50
+        assert result["output_path"] == str(tmp_path / "my corpus.embeddings.npy")
+        matrix = np.load(result["output_path"])
+        assert matrix.shape == (50, result["dimensions"])
+        ids = [json.loads(line) for line in open(result["ids_path"])]
+        assert ids == list(range(50))
+
+    def test_embed_file_unicode_blank_lines(self, start_server, mock_upstream, tmp_path):
+        """Test that lines holding only Unicode whitespace are neither counted nor embedded."""
+        import numpy as np
+
+        mock = mock_upstream()
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+        input_path = tmp_path / "corpus.txt"
+        input_path.write_text("first\n\u00a0\nthird\n\u2003 \n", encoding="utf-8")
+
+        result = json.loads(server.call_tool("embed_file", {"input_path": str(input_path)}))
+
+        assert result["rows"] == result["embedded"] == 2
+        matrix = np.load(result["output_path"])
+        assert matrix.shape == (2, result["dimensions"])
+        assert np.all(np.abs(matrix).sum(axis=1) > 0)
+        assert [json.loads(line) for line in open(result["ids_path"])] == [0, 2]
+
+    def test_local_files_root(self, start_server, mock_upstream, tmp_path):
+        """Test that LOCAL_FILES_ROOT confines the local paths clients may use."""
+        mock = mock_upstream()
+        root = tmp_path / "shared"
+        root.mkdir()
+        outside = tmp_path / "private.txt"
+        outside.write_text("secret\n")
+        (root / "escape.txt").symlink_to(outside)
+        (root / "corpus.txt").write_text("allowed\n")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "LOCAL_FILES_ROOT": str(root)})
+
+        for arguments in (
+            {"input_path": str(outside)},
+            {"input_path": str(root / "escape.txt")},
+            {"input_path": str(root / ".." / "private.txt")},
+            {"input_path": str(root / "corpus.txt"), "output_path": str(tmp_path / "out.npy")},
+        ):
+            text = server.call_tool("embed_file", arguments)
+            assert text.startswith("Error embedding file: PermissionError"), text
+        text = server.call_tool("speech_recognition", {"audio_url": outside.as_uri()})
+        assert text.startswith("Error transcribing audio: PermissionError"), text
+        assert mock.stats().get("/embeddings", 0) == 0
+
+        result = json.loads(server.call_tool("embed_file", {"input_path": (root / "corpus.txt").as_uri()}))
+        assert result["rows"] == 1
+
     def test_speech_recognition(self, mcp_server):
         """Test speech recognition tool."""
         response = mcp_server.send_request("tools/call", {
@@ -78,6 +349,48 @@ class TestTools:
             assert len(content) > 0
             assert content[0]["type"] == "text"
 
+    def test_speech_recognition_segmented(self, start_server, mock_upstream, wav_file):
+        """Test that long audio is split into overlapping windows and stitched on the global timeline."""
+        mock = mock_upstream()
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+
+        result = json.loads(server.call_tool("speech_recognition", {
+            "audio_url": wav_file(12).as_uri(),
+            "segment_seconds": 5,
+            "overlap_seconds": 1,
+        }))
+
+        # Windows of 5 s every 4 s: 0-5, 4-9 and 8-12
+        assert result["windows"] == 3
+        assert result["duration"] == 12
+        assert mock.stats()["/audio/transcriptions"] == 3
+        # The mock returns one segment per window; each is shifted by its window's offset
+        segments = result["segments"]
+        assert [segment["start"] for segment in segments] == [0, 4, 8]
+        assert [segment["end"] for segment in segments] == pytest.approx([5, 9, 12], abs=0.01)
+        assert result["text"] == " ".join(["This is a mock transcription."] * 3)
+
+    def test_background_job_deadlines(self, start_server, mock_upstream, wav_file):
+        """Test that background transcriptions have no default deadline but keep the submitter's _meta.timeout."""
+        mock = mock_upstream("--latency-ms", "500", "--jitter-ms", "0")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "TOOL_TIMEOUT": "0.2"})
+        audio_url = wav_file(2).as_uri()
+
+        def run(meta: dict) -> dict:
+            response = server.send_request("tools/call", {
+                "name": "speech_recognition",
+                "arguments": {"audio_url": audio_url, "background": True},
+                "_meta": meta
+            })
+            job = json.loads(response["result"]["content"][0]["text"])
+            return json.loads(server.call_tool("wait_for_job", {"job_id": job["job_id"], "timeout": 10}))
+
+        # TOOL_TIMEOUT does not apply to speech_recognition
+        assert run({})["status"] == "succeeded"
+        job = run({"timeout": 0.1})
+        assert job["status"] == "failed"
+        assert "DeadlineExceeded" in job["error"]
+
     def test_zero_shot_image_classification(self, mcp_server):
         """Test zero-shot image classification tool."""
         response = mcp_server.send_request("tools/call", {
@@ -112,6 +425,65 @@ class TestTools:
 
         assert "result" in response or "error" in response
 
+    def test_analyze_image(self, start_server, mock_upstream):
+        """Test combined image analysis tool."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+        image_url = f"{mock.url}/files/ff8800.png"
+
+        analysis = json.loads(server.call_tool("analyze_image", {
+            "image_url": image_url,
+            "candidate_labels": ["cat", "dog", "bird"]
+        }))
+
+        assert analysis["fallback"] is False
+        assert all({"label", "score"} <= set(item) for item in analysis["classification"])
+        assert all({"label", "location", "confidence"} <= set(item) for item in analysis["objects"])
+        assert analysis["zero_shot"]["label"] in ("cat", "dog", "bird")
+        assert set(analysis["zero_shot"]["scores"]) <= {"cat", "dog", "bird"}
+        # One combined request instead of one per analysis
+        assert mock.stats()["/chat/completions"] == 1
+
+        analysis = json.loads(server.call_tool("analyze_image", {"image_url": image_url}))
+        assert "zero_shot" not in analysis
+        assert analysis["classification"] and analysis["objects"]
+
+    def test_image_prefetch(self, start_server, mock_upstream):
+        """Test that vision tools send a downscaled data URI and fetch a repeated URL only once."""
+        import io
+
+        from PIL import Image
+
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+        image_url = f"{mock.url}/files/3366cc.png?size=3000x1000"
+
+        for _ in range(2):
+            server.call_tool("image_classification", {"image_url": image_url})
+
+        stats = mock.stats()
+        assert stats["/files"] == 1
+        assert len(stats["images"]) == 2
+        assert stats["images"][0] == stats["images"][1]
+        header, payload = stats["images"][0].split(",", 1)
+        assert header == "data:image/jpeg;base64"
+        with Image.open(io.BytesIO(base64.b64decode(payload))) as image:
+            # Bounded by IMAGE_MAX_LONG_SIDE (2048) and IMAGE_MAX_SHORT_SIDE (768), keeping the aspect ratio
+            assert image.size == (2048, 683)
+
+    def test_image_prefetch_refuses_private_addresses(self, start_server, mock_upstream):
+        """Test that private addresses are not fetched when IMAGE_FETCH_PRIVATE is off (the HTTP default)."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "IMAGE_FETCH_PRIVATE": "false"})
+        image_url = f"{mock.url}/files/3366cc.png"
+
+        server.call_tool("image_classification", {"image_url": image_url})
+
+        stats = mock.stats()
+        assert stats.get("/files", 0) == 0
+        # The URL is passed on unchanged, as before pre-fetching
+        assert stats["images"] == [image_url]
+
     def test_text_classification(self, mcp_server):
         """Test text classification tool."""
         response = mcp_server.send_request("tools/call", {
@@ -123,6 +495,31 @@ class TestTools:
 
         assert "result" in response or "error" in response
 
+    def test_structured_output(self, start_server, mock_upstream):
+        """Test that structured output mode returns JSON matching the tool's schema."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "STRUCTURED_OUTPUT_TOOLS": "text_classification"})
+
+        result = json.loads(server.call_tool("text_classification", {"text": "I love this product!"}))
+
+        assert set(result) == {"sentiment", "category"}
+        assert result["sentiment"] in ("positive", "negative", "neutral")
+        assert isinstance(result["category"], str)
+        assert mock.stats()["/chat/completions"] == 1
+        # Tools not listed keep the prose prompt
+        server.call_tool("fill_mask", {"text": "Hello [MASK] world"})
+        assert mock.stats()["/completions"] == 1
+
+    def test_structured_output_rejects_invalid_answers(self, start_server, mock_upstream):
+        """Test that an answer that does not match the schema is returned as an error and not cached."""
+        mock = mock_upstream("--latency-ms", "5", "--invalid-structured-rate", "1")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "STRUCTURED_OUTPUT_TOOLS": "text_classification"})
+
+        for _ in range(2):
+            text = server.call_tool("text_classification", {"text": "I love this product!"})
+            assert text.startswith("Error classifying text: ValueError: $: missing sentiment, category")
+        assert mock.stats()["/chat/completions"] == 2
+
     def test_token_classification(self, mcp_server):
         """Test token classification tool."""
         response = mcp_server.send_request("tools/call", {
@@ -134,6 +531,26 @@ class TestTools:
 
         assert "result" in response or "error" in response
 
+    def test_token_classification_windowed(self, start_server, mock_upstream):
+        """Test windowed token classification of a long text."""
+        mock = mock_upstream("--latency-ms", "5")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+        text = "Marie Curie worked in Paris with Pierre Curie. " * 40
+
+        result = json.loads(server.call_tool("token_classification", {
+            "text": text,
+            "window_chars": 500,
+            "overlap_chars": 100
+        }))
+
+        assert result["errors"] == []
+        assert result["windows"] == mock.stats()["/completions"] >= 4
+        # Window-relative positions are mapped onto the whole text, and overlaps are reported once
+        positions = [entity["position"] for entity in result["entities"]]
+        expected = [[start, start + 5] for start in range(len(text)) if text.startswith("Paris", start)]
+        assert positions == expected
+        assert all(text[start:end] == entity["entity"] for entity, (start, end) in zip(result["entities"], positions))
+
     def test_fill_mask(self, mcp_server):
         """Test fill mask tool."""
         response = mcp_server.send_request("tools/call", {
@@ -143,4 +560,325 @@ class TestTools:
             }
         })
 
-        assert "result" in response or "error" in response
\ No newline at end of file
+        assert "result" in response or "error" in response
+
+    def test_index_texts(self, start_server, mock_upstream, tmp_path):
+        """Test indexing texts into a local vector collection."""
+        mock = mock_upstream()
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "VECTOR_INDEX_DIR": str(tmp_path)})
+
+        first = json.loads(server.call_tool("index_texts", {
+            "collection": "test-collection",
+            "texts": ["The cat sat on the mat", "Stock markets rallied today"]
+        }))
+        second = json.loads(server.call_tool("index_texts", {
+            "collection": "test-collection",
+            "texts": ["Rain is expected tomorrow"],
+            "ids": ["weather"]
+        }))
+
+        assert first["added"] == 2
+        assert first["count"] == 2
+        assert second["added"] == 1
+        assert second["count"] == 3
+        assert second["dimensions"] == first["dimensions"]
+        rows = [json.loads(line) for line in open(tmp_path / "test-collection" / "records.jsonl")]
+        assert [row["id"] for row in rows] == ["0", "1", "weather"]
+
+    def test_similarity_search(self, start_server, mock_upstream, tmp_path):
+        """Test similarity search over a local vector collection."""
+        mock = mock_upstream()
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "VECTOR_INDEX_DIR": str(tmp_path)})
+        texts = [f"Document number {i}" for i in range(20)]
+        server.call_tool("index_texts", {"collection": "test-collection", "texts": texts})
+
+        for top_k in (1, 5, 50):
+            result = json.loads(server.call_tool("similarity_search", {
+                "collection": "test-collection",
+                "query": "Document number 7",
+                "top_k": top_k
+            }))
+            results = result["results"]
+            assert len(results) == min(top_k, len(texts))
+            # The query embeds exactly like the indexed text, so it ranks first
+            assert results[0]["id"] == "7"
+            assert results[0]["text"] == "Document number 7"
+            assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+            scores = [item["score"] for item in results]
+            assert scores == sorted(scores, reverse=True)
+            assert len({item["id"] for item in results}) == len(results)
+
+    def test_vector_index_shared_between_processes(self, start_server, mock_upstream, tmp_path):
+        """Test that two server processes appending to one collection keep vectors and records aligned."""
+        mock = mock_upstream()
+        env = {"DEEPINFRA_BASE_URL": mock.base_url, "VECTOR_INDEX_DIR": str(tmp_path)}
+        first, second = start_server(env), start_server(env)
+
+        first.call_tool("index_texts", {"collection": "shared", "texts": ["alpha text", "beta text"]})
+        first.call_tool("similarity_search", {"collection": "shared", "query": "alpha text", "top_k": 1})
+        second.call_tool("index_texts", {"collection": "shared", "texts": ["gamma text"]})
+        result = json.loads(first.call_tool("index_texts", {"collection": "shared", "texts": ["delta text"]}))
+
+        assert result["count"] == 4
+        rows = [json.loads(line) for line in open(tmp_path / "shared" / "records.jsonl")]
+        assert [row["id"] for row in rows] == ["0", "1", "2", "3"]
+        assert (tmp_path / "shared" / "vectors.f32").stat().st_size == 4 * 4 * result["dimensions"]
+        for server in (first, second):
+            for row in rows:
+                results = json.loads(server.call_tool("similarity_search", {
+                    "collection": "shared", "query": row["text"], "top_k": 1
+                }))["results"]
+                assert results[0]["id"] == row["id"]
+
+    def test_similarity_search_rejects_top_k_below_one(self, start_server, mock_upstream, tmp_path):
+        """Test that similarity search refuses a top_k below 1."""
+        mock = mock_upstream()
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "VECTOR_INDEX_DIR": str(tmp_path)})
+        server.call_tool("index_texts", {"collection": "top-k", "texts": ["one", "two"]})
+
+        for top_k in (0, -1):
+            text = server.call_tool("similarity_search", {"collection": "top-k", "query": "one", "top_k": top_k})
+            assert text.startswith("Error searching collection: ValueError: top_k must be at least 1")
+
+    def test_response_cache_stats(self, start_server, mock_upstream):
+        """Test that a repeated request is a hit and concurrent identical requests share one upstream call."""
+        mock = mock_upstream("--latency-ms", "200", "--jitter-ms", "0")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url})
+
+        for _ in range(2):
+            server.call_tool("fill_mask", {"text": "Hello [MASK] world"})
+        stats = json.loads(server.call_tool("response_cache_stats", {}))
+        assert "fill_mask" in stats["enabled_tools"]
+        assert stats["tools"]["fill_mask"]["misses"] == 1
+        assert stats["tools"]["fill_mask"]["hits"] == 1
+        assert mock.stats()["/completions"] == 1
+
+        responses = server.send_requests("tools/call", [
+            {"name": "fill_mask", "arguments": {"text": "Concurrent [MASK] world"}} for _ in range(3)
+        ])
+        texts = [response["result"]["content"][0]["text"] for response in responses]
+        assert texts[0] == texts[1] == texts[2]
+        assert not texts[0].startswith("Error")
+        stats = json.loads(server.call_tool("response_cache_stats", {}))["tools"]["fill_mask"]
+        assert stats["misses"] == 2
+        assert stats["shared"] == 2
+        assert mock.stats()["/completions"] == 2
+
+    def test_text_classification_batch(self, mcp_server):
+        """Test batch text classification returns one item per input in order."""
+        response = mcp_server.send_request("tools/call", {
+            "name": "text_classification_batch",
+            "arguments": {
+                "texts": ["I love this product", "This is terrible", "It arrived on Tuesday"],
+                "pack_size": 2
+            }
+        })
+
+        assert "result" in response or "error" in response
+
+        if "result" in response:
+            content = response["result"]["content"]
+            assert content[0]["type"] == "text"
+            if not content[0]["text"].startswith("Error"):
+                items = json.loads(content[0]["text"])
+                assert [item["index"] for item in items] == [0, 1, 2]
+
+    def test_fill_mask_batch(self, start_server, mock_upstream):
+        """Test batch fill mask tool."""
+        mock = mock_upstream("--latency-ms", "20", "--jitter-ms", "10")
+        server = start_server({"DEEPINFRA_BASE_URL": mock.base_url, "RESPONSE_CACHE_TOOLS": ""})
+        texts = [f"Batch item {i} says hello [MASK] world" for i in range(12)]
+
+        items = json.loads(server.call_tool("fill_mask_batch", {"texts": texts}))
+
+        # One item per input, in input order, even though they finish out of order
+        assert [item["index"] for item in items] == list(range(len(texts)))
+        for item in items:
+            assert "error" not in item
+            assert json.loads(item["result"])["chosen_word"] == "beautiful"
+        assert mock.stats()["/completions"] == len(texts)
+
+        response = server.send_request("tools/call", {
+            "name": "fill_mask_batch",
+            "arguments": {
+                "texts": []
+            }
+        })
+        assert response["result"]["content"][0]["text"] == "[]"
+
+    def test_scheduler_stats(self, mcp_server):
+        """Test scheduler statistics after an upstream call."""
+        mcp_server.send_request("tools/call", {
+            "name": "text_generation",
+            "arguments": {
+                "prompt": "Hello"
+            }
+        })
+        response = mcp_server.send_request("tools/call", {
+            "name": "scheduler_stats",
+            "arguments": {}
+        })
+
+        assert "result" in response
+        content = response["result"]["content"]
+        assert content[0]["type"] == "text"
+        assert "concurrency_limit" in content[0]["text"]
+
+    def test_request_deadline(self, mcp_server):
+        """Test that a deadline set in the request's _meta ends the call."""
+        response = mcp_server.send_request("tools/call", {
+            "name": "fill_mask",
+            "arguments": {
+                "text": "The deadline test [MASK] quickly."
+            },
+            "_meta": {
+                "timeout": 0.01
+            }
+        })
+
+        assert "result" in response
+        assert "DeadlineExceeded" in response["result"]["content"][0]["text"]
+
+    def test_batch_deadline_keeps_items(self, mcp_server):
+        """Test that a batch past its deadline still returns one item per input."""
+        response = mcp_server.send_request("tools/call", {
+            "name": "fill_mask_batch",
+            "arguments": {
+                "texts": [f"Deadline batch item {i} is [MASK]." for i in range(5)]
+            },
+            "_meta": {
+                "timeout": 0.01
+            }
+        })
+
+        assert "result" in response
+        items = json.loads(response["result"]["content"][0]["text"])
+        assert [item["index"] for item in items] == list(range(5))
+        assert all("result" in item or "error" in item for item in items)
+        assert any("DeadlineExceeded" in item.get("error", "") for item in items)
+
+    def test_routing_stats(self, mcp_server):
+        """Test the routing stats tool."""
+        response = mcp_server.send_request("tools/call", {
+            "name": "routing_stats",
+            "arguments": {}
+        })
+
+        assert "result" in response
+        stats = json.loads(response["result"]["content"][0]["text"])
+        assert "pools" in stats
+        assert "embeddings" not in stats["pools"]
+        assert "models" in stats
+
+    def test_hedge_fires_and_wins(self, start_server, mock_upstream):
+        """Test that a request slower than the p95 latency is hedged and the hedge wins."""
+        mock = mock_upstream("--latency-ms", "20", "--jitter-ms", "0", "--slow-every", "10", "--slow-ms", "2000")
+        server = start_server({
+            "DEEPINFRA_BASE_URL": mock.base_url,
+            "HEDGE_TOOLS": "fill_mask",
+            "HEDGE_MIN_SAMPLES": "5",
+            "HEDGE_MAX_PERCENT": "100",
+            "RESPONSE_CACHE_TOOLS": "",
+        })
+
+        for i in range(10):
+            started = time.monotonic()
+            result = json.loads(server.call_tool("fill_mask", {"text": f"Hedge test {i} is [MASK]."}))
+            assert result["chosen_word"] == "beautiful"
+            # The tenth upstream request is the slow one; its hedge answers long before it would
+            assert time.monotonic() - started < 1.5
+
+        stats = json.loads(server.call_tool("hedging_stats", {}))["tools"]["fill_mask"]
+        assert stats["requests"] == 10
+        assert stats["hedges"] >= 1
+        assert stats["hedge_wins"] >= 1
+        assert mock.stats()["/completions"] == 10 + stats["hedges"]
+
+    def test_rate_limit_halves_concurrency(self, start_server, mock_upstream):
+        """Test that each 429 halves the model's concurrency limit and Retry-After delays the retry."""
+        mock = mock_upstream("--latency-ms", "1", "--jitter-ms", "0", "--rate-limit-rate", "1", "--retry-after-ms", "300")
+        server = start_server({
+            "DEEPINFRA_BASE_URL": mock.base_url,
+            "MODEL_FILL_MASK": "rate-limited",
+            "UPSTREAM_CONCURRENCY": "16",
+            "UPSTREAM_MAX_RETRIES": "2",
+            "RESPONSE_CACHE_TOOLS": "",
+        })
+
+        started = time.monotonic()
+        text = server.call_tool("fill_mask", {"text": "Rate limit test [MASK]."})
+        elapsed = time.monotonic() - started
+
+        assert text.startswith("Error")
+        assert "RateLimitError" in text
+        # Two retries, each held back by the 300 ms retry-after-ms
+        assert elapsed >= 0.6
+        assert mock.stats()["/completions"] == 3
+        limiter = json.loads(server.call_tool("scheduler_stats", {}))["rate-limited"]
+        assert limiter["overloads"] == 3
+        assert limiter["concurrency_limit"] == 2
+
+    def test_routing_falls_back_and_opens_breaker(self, start_server, mock_upstream):
+        """Test that a failing model falls back to the next one at once and its breaker opens."""
+        mock = mock_upstream("--latency-ms", "5", "--jitter-ms", "0", "--model-error-rate", "bad=1")
+        server = start_server({
+            "DEEPINFRA_BASE_URL": mock.base_url,
+            "MODEL_FILL_MASK": "bad,good",
+            "MODEL_TEXT_CLASSIFICATION": "warm-up",
+            "ROUTING_EXPLORE_PERCENT": "0",
+            "ROUTING_FAILURE_THRESHOLD": "2",
+            "RESPONSE_CACHE_TOOLS": "",
+        })
+        # Warm up (the OpenAI client is imported on first use) on a tool with a single model
+        server.call_tool("text_classification", {"text": "warm up"})
+
+        for i in range(4):
+            started = time.monotonic()
+            result = json.loads(server.call_tool("fill_mask", {"text": f"Fallback test {i} is [MASK]."}))
+            assert result["model"] == "good"
+            # With the default retries, the 503 is handed to the router instead of being retried on "bad"
+            assert time.monotonic() - started < 0.5
+
+        stats = json.loads(server.call_tool("routing_stats", {}))
+        assert stats["models"]["bad"]["state"] == "open"
+        assert stats["models"]["bad"]["breaker_opens"] == 1
+        calls = stats["tools"]["fill_mask"]["good"]["calls"]
+        assert calls == {"fallback": 2, "best": 2}
+        # Once the breaker is open, calls go straight to the healthy model
+        # The second call finds "bad" paused by the first 503 and skips it without a request
+        assert mock.stats()["models"] == {"bad": 1, "good": 4, "warm-up": 1}
+        assert json.loads(server.call_tool("scheduler_stats", {}))["bad"]["overloads"] == 1
+
+    def test_routing_retries_the_last_model(self, start_server, mock_upstream):
+        """Test that the scheduler still retries when no model is left to fall back to."""
+        mock = mock_upstream("--latency-ms", "5", "--jitter-ms", "0", "--model-error-rate", "bad=1",
+                             "--model-error-rate", "worse=1", "--retry-after-ms", "50")
+        server = start_server({
+            "DEEPINFRA_BASE_URL": mock.base_url,
+            "MODEL_FILL_MASK": "bad,worse",
+            "ROUTING_EXPLORE_PERCENT": "0",
+            "UPSTREAM_MAX_RETRIES": "2",
+            "RESPONSE_CACHE_TOOLS": "",
+        })
+
+        text = server.call_tool("fill_mask", {"text": "Last model test [MASK]."})
+
+        assert text.startswith("Error")
+        assert mock.stats()["models"] == {"bad": 1, "worse": 3}
+
+    def test_metrics_summary(self, mcp_server):
+        """Test the metrics summary resource after a tool call."""
+        mcp_server.send_request("tools/call", {
+            "name": "text_classification",
+            "arguments": {
+                "text": "I love this product!"
+            }
+        })
+        response = mcp_server.send_request("resources/read", {
+            "uri": "metrics://summary"
+        })
+
+        assert "result" in response
+        summary = json.loads(response["result"]["contents"][0]["text"])
+        assert "tool_duration_seconds" in summary
+        assert any(item["tool"] == "text_classification" for item in summary["tool_calls_total"])